@@ -1761,6 +1761,145 @@ app.get('/api/analytics/surfaces/strength', async (req, res) => {
 // ML MATCH PREDICTION ENDPOINT
 // ============================================
 
+// Persistent prediction worker: `ml_predict.py --serve` loads the model and opens its
+// database connection once, then answers one JSON line per request on stdin/stdout.
+// Replies carry the request id, so several requests can be in flight at once.
+const PREDICTION_TIMEOUT_MS = parseInt(process.env.PREDICTION_TIMEOUT_MS || '30000', 10);
+const PREDICTION_RESTART_BASE_MS = 1000;
+const PREDICTION_RESTART_MAX_MS = 60000;
+
+function findPython() {
+  // Railway uses 'python', local dev uses 'python3'
+  const { execSync } = require('child_process');
+  for (const cmd of ['python', 'python3']) {
+    try {
+      execSync(`which ${cmd}`, { stdio: 'ignore' });
+      return cmd;
+    } catch (e) {
+      // try the next one
+    }
+  }
+  return null;
+}
+
+class PredictionWorker {
+  constructor() {
+    this.process = null;
+    this.buffer = '';
+    this.nextId = 1;
+    this.pending = new Map();
+    // Consecutive crashes/timeouts; each one doubles the wait before the next start
+    this.failures = 0;
+    this.nextStartAt = 0;
+  }
+
+  start() {
+    const pythonCmd = findPython();
+    if (!pythonCmd) {
+      throw new Error('Python not found on system');
+    }
+    const child = spawn(pythonCmd, ['scripts/ml_predict.py', '--serve'], {
+      cwd: __dirname + '/..'
+    });
+    child.stdout.on('data', (data) => this.onData(data));
+    // Writes after the worker died surface through 'close' instead
+    child.stdin.on('error', (err) => console.error('Prediction worker stdin:', err.message));
+    child.stderr.on('data', (data) => console.error('Prediction worker:', data.toString().trim()));
+    child.on('close', (code) => {
+      console.error('Prediction worker exited with code:', code);
+      if (this.process === child) {
+        this.fail(new Error(`Prediction worker exited (code ${code})`));
+      }
+    });
+    child.on('error', (err) => {
+      console.error('Prediction worker failed to start:', err.message);
+    });
+    this.process = child;
+  }
+
+  // Drop the current worker (killing it if it is still running), fail its
+  // in-flight requests and hold off the next start with exponential backoff
+  fail(error) {
+    const child = this.process;
+    this.process = null;
+    this.buffer = '';
+    if (child && child.exitCode === null && child.signalCode === null) {
+      child.kill('SIGKILL');
+    }
+    this.failAll(error);
+    this.failures += 1;
+    const delay = Math.min(PREDICTION_RESTART_MAX_MS,
+      PREDICTION_RESTART_BASE_MS * 2 ** (this.failures - 1));
+    this.nextStartAt = Date.now() + delay;
+    console.error(`Prediction worker restarts in ${delay}ms at the earliest`);
+  }
+
+  onData(data) {
+    this.buffer += data.toString();
+    let newline;
+    while ((newline = this.buffer.indexOf('\n')) >= 0) {
+      const line = this.buffer.slice(0, newline);
+      this.buffer = this.buffer.slice(newline + 1);
+      if (!line.trim()) continue;
+      let reply;
+      try {
+        reply = JSON.parse(line);
+      } catch (parseError) {
+        console.error('Prediction worker sent invalid JSON:', line);
+        continue;
+      }
+      // A reply means the worker is healthy again
+      this.failures = 0;
+      const entry = this.pending.get(reply.id);
+      if (entry) {
+        clearTimeout(entry.timer);
+        this.pending.delete(reply.id);
+        entry.resolve(reply);
+      }
+    }
+  }
+
+  failAll(error) {
+    for (const entry of this.pending.values()) {
+      clearTimeout(entry.timer);
+      entry.reject(error);
+    }
+    this.pending.clear();
+  }
+
+  predict(player1, player2, surface) {
+    if (!this.process) {
+      const wait = this.nextStartAt - Date.now();
+      if (wait > 0) {
+        // Fail fast instead of respawning a crashing worker in a tight loop
+        return Promise.reject(new Error(`Prediction worker is restarting; retry in ${Math.ceil(wait / 1000)}s`));
+      }
+      this.start();
+    }
+    const id = this.nextId++;
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        // A worker that misses the deadline is presumed hung: replace it
+        // rather than letting every later request wait out the timeout too
+        this.pending.delete(id);
+        reject(new Error(`Prediction timed out after ${PREDICTION_TIMEOUT_MS}ms`));
+        this.fail(new Error('Prediction worker restarted after a timed-out request'));
+      }, PREDICTION_TIMEOUT_MS);
+      this.pending.set(id, { resolve, reject, timer });
+      this.process.stdin.write(JSON.stringify({ id, player1, player2, surface }) + '\n');
+    });
+  }
+}
+
+let predictionWorker = null;
+
+function getPredictionWorker() {
+  if (!predictionWorker) {
+    predictionWorker = new PredictionWorker();
+  }
+  return predictionWorker;
+}
+
 /**
  * @swagger
  * /api/match-prediction:
@@ -1840,70 +1979,21 @@ app.post('/api/match-prediction', async (req, res) => {
       });
     }
     
-    // Call Python prediction script
-    // Try to find Python - Railway uses 'python', local dev uses 'python3'
-    const { execSync } = require('child_process');
-    let pythonCmd = 'python3'; // default
+    // Ask the persistent Python worker (model and DB connection stay loaded)
+    let result;
     try {
-      execSync('which python', { stdio: 'ignore' });
-      pythonCmd = 'python';
-    } catch (e) {
-      // python not found, try python3
-      try {
-        execSync('which python3', { stdio: 'ignore' });
-        pythonCmd = 'python3';
-      } catch (e2) {
-        return res.status(500).json({
-          success: false,
-          error: 'Python not found on system'
-        });
-      }
+      result = await getPredictionWorker().predict(player1_name, player2_name, surface);
+    } catch (workerError) {
+      console.error('Prediction worker error:', workerError.message);
+      return res.status(500).json({
+        success: false,
+        error: 'Prediction failed',
+        details: workerError.message
+      });
     }
     
-    const pythonProcess = spawn(pythonCmd, [
-      'scripts/ml_predict.py',
-      player1_name,
-      player2_name,
-      surface
-    ], {
-      cwd: __dirname + '/..'
-    });
-    
-    let output = '';
-    let errorOutput = '';
-    
-    pythonProcess.stdout.on('data', (data) => {
-      output += data.toString();
-    });
-    
-    pythonProcess.stderr.on('data', (data) => {
-      errorOutput += data.toString();
-    });
-    
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        console.error('Python script exited with code:', code);
-        console.error('Python script error:', errorOutput);
-        console.error('Python script output:', output);
-        return res.status(500).json({
-          success: false,
-          error: 'Prediction failed',
-          details: errorOutput || `Exit code: ${code}`
-        });
-      }
-      
-      try {
-        const result = JSON.parse(output);
-        res.json(result);
-      } catch (parseError) {
-        console.error('JSON parse error:', parseError);
-        console.error('Output:', output);
-        res.status(500).json({
-          success: false,
-          error: 'Failed to parse prediction result'
-        });
-      }
-    });
+    const { id, ...prediction } = result;
+    res.json(prediction);
     
   } catch (error) {
     console.error('Error in match prediction:', error);
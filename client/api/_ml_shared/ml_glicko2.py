@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Glicko-2 Ratings by Rating Period
+Groups the match history into rating periods (tournament weeks by default)
+and updates every player active in a period at once with NumPy, including
+the Illinois-method volatility solve from Glickman's paper. The per-period
+snapshots back point-in-time ML features and can replace the 'glicko2' rows
+of the ratings table the API reads.
+
+Usage:
+    python3 scripts/ml_glicko2.py                 # compute and summarize
+    python3 scripts/ml_glicko2.py --write         # also replace the glicko2 ratings rows
+    python3 scripts/ml_glicko2.py --source csv    # from data-source/ instead of Postgres
+"""
+
+import argparse
+import sys
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from ml_rating_index import RatingIndex
+from ml_replay import EPOCH_ORDINAL, to_day_numbers
+
+# Same starting values and system constant as Glicko2Rating in server/utils/ratingSystems.js
+INITIAL_RATING = 1500.0
+INITIAL_RD = 350.0
+INITIAL_VOLATILITY = 0.06
+TAU = 0.5
+SCALE = 173.7178
+CONVERGENCE = 0.000001
+MAX_ITERATIONS = 100
+
+# date.toordinal() 1 is a Monday, so 7-day periods run Monday to Sunday like the tour calendar
+PERIOD_DAYS = 7
+
+# Idle periods widen the deviation, but never beyond a new player's
+MAX_PHI = INITIAL_RD / SCALE
+
+
+def print_progress(message, emoji="📊"):
+    """Print progress with timestamp"""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    print(f"[{timestamp}] {emoji} {message}")
+    sys.stdout.flush()
+
+
+def g(phi):
+    return 1 / np.sqrt(1 + 3 * phi ** 2 / np.pi ** 2)
+
+
+def solve_volatility(sigma, phi, v, delta, tau=TAU):
+    """Step 5 of Glicko-2 for many players at once: the new volatility by the
+    Illinois (regula falsi) iteration, until every player has converged"""
+    a = np.log(sigma ** 2)
+    phi2, delta2 = phi ** 2, delta ** 2
+
+    def f(x):
+        ex = np.exp(x)
+        return ex * (delta2 - phi2 - v - ex) / (2 * (phi2 + v + ex) ** 2) - (x - a) / tau ** 2
+
+    A = a.copy()
+    big = delta2 > phi2 + v
+    B = np.where(big, np.log(np.where(big, delta2 - phi2 - v, 1.0)), a - tau)
+    # Bracket the root: step B down by tau while f(B) < 0
+    k = np.ones_like(a)
+    low = ~big & (f(B) < 0)
+    while low.any():
+        k[low] += 1
+        B = np.where(low, a - k * tau, B)
+        low &= f(B) < 0
+
+    fA, fB = f(A), f(B)
+    active = np.abs(B - A) > CONVERGENCE
+    for _ in range(MAX_ITERATIONS):
+        if not active.any():
+            break
+        C = A + (A - B) * fA / (fB - fA)
+        fC = f(C)
+        crossed = fC * fB <= 0
+        A = np.where(active & crossed, B, A)
+        fA = np.where(active, np.where(crossed, fB, fA / 2), fA)
+        B = np.where(active, C, B)
+        fB = np.where(active, fC, fB)
+        active &= np.abs(B - A) > CONVERGENCE
+    return np.exp(A / 2)
+
+
+class Glicko2State:
+    """Every player's Glicko-2 values on the internal scale, by position"""
+
+    def __init__(self, tau=TAU):
+        self.tau = tau
+        self.positions = {}  # player_id -> position
+        self.player_ids = np.empty(0, dtype=np.int64)
+        self.mu = np.empty(0)
+        self.phi = np.empty(0)
+        self.sigma = np.empty(0)
+        self.last_period = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.mu)
+
+    def _positions(self, player_ids):
+        new = [p for p in pd.unique(player_ids).tolist() if p not in self.positions]
+        if new:
+            for p in new:
+                self.positions[p] = len(self.positions)
+            n = len(new)
+            self.player_ids = np.concatenate([self.player_ids, np.asarray(new, dtype=np.int64)])
+            self.mu = np.concatenate([self.mu, np.zeros(n)])
+            self.phi = np.concatenate([self.phi, np.full(n, MAX_PHI)])
+            self.sigma = np.concatenate([self.sigma, np.full(n, INITIAL_VOLATILITY)])
+            self.last_period = np.concatenate([self.last_period, np.full(n, -1, dtype=np.int64)])
+        return np.fromiter((self.positions[p] for p in player_ids.tolist()), dtype=np.int64, count=len(player_ids))
+
+    def rate_period(self, period, players, opponents, scores):
+        """
+        Rate one period. players / opponents are positions and scores the
+        results (1 win, 0 loss) of every game from each player's side.
+        Returns the positions of the players that were rated.
+        """
+        active, slot = np.unique(players, return_inverse=True)
+
+        # Step 6 for the periods each player sat out since their last rating
+        idle = np.where(self.last_period[active] < 0, 0, period - self.last_period[active] - 1)
+        phi = np.sqrt(self.phi[active] ** 2 + idle * self.sigma[active] ** 2)
+        self.phi[active] = np.minimum(phi, MAX_PHI)
+
+        mu, phi, sigma = self.mu[active], self.phi[active], self.sigma[active]
+        opp_g = g(self.phi[opponents])
+        expected = 1 / (1 + np.exp(-opp_g * (self.mu[players] - self.mu[opponents])))
+
+        v = 1 / np.bincount(slot, opp_g ** 2 * expected * (1 - expected), minlength=len(active))
+        improvement = np.bincount(slot, opp_g * (scores - expected), minlength=len(active))
+        delta = v * improvement
+
+        new_sigma = solve_volatility(sigma, phi, v, delta, self.tau)
+        phi_star = np.sqrt(phi ** 2 + new_sigma ** 2)
+        new_phi = 1 / np.sqrt(1 / phi_star ** 2 + 1 / v)
+
+        self.mu[active] = mu + new_phi ** 2 * improvement
+        self.phi[active] = new_phi
+        self.sigma[active] = new_sigma
+        self.last_period[active] = period
+        return active
+
+    def ratings(self, positions):
+        """(rating, rd, volatility) on the Glicko scale"""
+        return SCALE * self.mu[positions] + INITIAL_RATING, SCALE * self.phi[positions], self.sigma[positions]
+
+    def replay(self, matches, period_days=PERIOD_DAYS):
+        """
+        Rate every period of matches (sorted by date) and return the snapshots.
+
+        matches: frame with match_id, match_date, player1_id, player2_id and winner_id
+
+        One row per (period, player who played in it): rated_on (last day of
+        the period), player_id, rating, rd, volatility and match_id (the
+        player's last match of the period).
+        """
+        if len(matches) == 0:
+            return pd.DataFrame({'rated_on': pd.Series(dtype='datetime64[ns]'), 'player_id': [], 'rating': [],
+                                 'rd': [], 'volatility': [], 'match_id': []})
+        player1 = matches['player1_id'].to_numpy(dtype=np.int64)
+        player2 = matches['player2_id'].to_numpy(dtype=np.int64)
+        pos1, pos2 = self._positions(player1), self._positions(player2)
+        won1 = (matches['winner_id'].to_numpy(dtype=np.int64) == player1).astype(np.float64)
+        match_ids = matches['match_id'].to_numpy()
+        periods = (to_day_numbers(matches['match_date']) - 1) // period_days
+        bounds = np.flatnonzero(np.diff(periods)) + 1
+        starts, ends = np.concatenate([[0], bounds]), np.concatenate([bounds, [len(periods)]])
+
+        parts = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            period = int(periods[start])
+            players = np.concatenate([pos1[start:end], pos2[start:end]])
+            opponents = np.concatenate([pos2[start:end], pos1[start:end]])
+            scores = np.concatenate([won1[start:end], 1 - won1[start:end]])
+            active = self.rate_period(period, players, opponents, scores)
+
+            # Each player's last match of the period
+            last = np.zeros(len(active), dtype=np.int64)
+            np.maximum.at(last, np.searchsorted(active, players), np.tile(np.arange(start, end), 2))
+            rating, rd, volatility = self.ratings(active)
+            parts.append((period, active, rating, rd, volatility, match_ids[last]))
+
+        period_ids = np.concatenate([np.full(len(p[1]), p[0], dtype=np.int64) for p in parts])
+        last_days = (period_ids + 1) * period_days
+        return pd.DataFrame({
+            'rated_on': (last_days - EPOCH_ORDINAL).astype('datetime64[D]'),
+            'player_id': self.player_ids[np.concatenate([p[1] for p in parts])],
+            'rating': np.concatenate([p[2] for p in parts]),
+            'rd': np.concatenate([p[3] for p in parts]),
+            'volatility': np.concatenate([p[4] for p in parts]),
+            'match_id': np.concatenate([p[5] for p in parts]),
+        })
+
+
+class Glicko2Index:
+    """Point-in-time Glicko-2 rating and RD: the last snapshot of a period
+    that ended before the given date"""
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+        frame = snapshots.assign(surface=None)
+        self.rating = RatingIndex.from_frame(frame.rename(columns={'rating': 'rating_value'}), default=INITIAL_RATING)
+        self.rd = RatingIndex.from_frame(frame.rename(columns={'rd': 'rating_value'}), default=INITIAL_RD)
+
+    @classmethod
+    def from_history(cls, history, period_days=PERIOD_DAYS):
+        return cls(Glicko2State().replay(history, period_days))
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def ratings_before(self, player_ids, dates):
+        return self.rating.ratings_before(player_ids, None, dates)
+
+    def rds_before(self, player_ids, dates):
+        return self.rd.ratings_before(player_ids, None, dates)
+
+
+def write_ratings(conn, snapshots):
+    """Replace the 'glicko2' rows of the ratings table with the snapshots, oldest first"""
+    from psycopg2.extras import execute_values
+    rows = list(zip(
+        snapshots['player_id'].tolist(),
+        snapshots['rating'].round(2).tolist(),
+        snapshots['rd'].round(2).tolist(),
+        snapshots['volatility'].round(2).tolist(),
+        snapshots['match_id'].tolist()
+    ))
+    with conn.cursor() as cursor:
+        cursor.execute("DELETE FROM ratings WHERE rating_type = 'glicko2'")
+        execute_values(cursor, """
+            INSERT INTO ratings (player_id, rating_type, rating_value, rating_deviation, volatility, match_id)
+            VALUES %s
+        """, rows, template="(%s, 'glicko2', %s, %s, %s, %s)", page_size=5000)
+    conn.commit()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compute Glicko-2 ratings by rating period')
+    parser.add_argument('--period-days', type=int, default=PERIOD_DAYS,
+                        help=f'Rating period length in days (default: {PERIOD_DAYS}, Monday to Sunday)')
+    parser.add_argument('--source', choices=['db', 'csv'], default='db',
+                        help='db: matches from Postgres (default); csv: the files in data-source/')
+    parser.add_argument('--write', action='store_true',
+                        help="Replace the 'glicko2' rows of the ratings table (db source only)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.write and args.source != 'db':
+        print_progress("--write needs --source db (match ids must exist in the matches table)", "❌")
+        sys.exit(1)
+
+    print_progress("Loading match history...", "🔍")
+    conn = None
+    if args.source == 'csv':
+        from ml_csv_source import CsvSource
+        history = CsvSource().history()
+    else:
+        from ml_extract_features import get_db_connection
+        from ml_feature_registry import HISTORY_QUERY
+        conn = get_db_connection()
+        history = pd.read_sql_query(HISTORY_QUERY, conn, params={'player_ids': None, 'before': date.max})
+    print_progress(f"✅ Loaded {len(history):,} matches", "✅")
+
+    start_time = time.time()
+    state = Glicko2State()
+    snapshots = state.replay(history, args.period_days)
+    num_periods = snapshots['rated_on'].nunique()
+    print_progress(f"✅ Rated {num_periods:,} periods ({len(snapshots):,} snapshots) "
+                   f"in {time.time() - start_time:.1f}s", "✅")
+
+    rating, rd, volatility = state.ratings(np.arange(len(state)))
+    print_progress("Glicko-2 Rating Summary:", "📊")
+    print_progress(f"   Players: {len(state):,}", "👥")
+    print_progress(f"   Avg Rating: {rating.mean():.0f}  Range: {rating.min():.0f} - {rating.max():.0f}", "📈")
+    print_progress(f"   Avg Deviation: {rd.mean():.0f}  Avg Volatility: {volatility.mean():.4f}", "📉")
+
+    if args.write:
+        print_progress("Replacing glicko2 rows in the ratings table...", "💾")
+        write_ratings(conn, snapshots)
+        print_progress(f"✅ Wrote {len(snapshots):,} rating rows", "✅")
+    if conn is not None:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Head-to-Head Index
+Cumulative win counts per unordered player pair and surface, with sorted
+match days so "H2H before date D" is a dict lookup plus a binary search
+instead of a scan of the matches table
+"""
+
+import numpy as np
+import pandas as pd
+
+from ml_rating_index import DAY_BITS, day_number, surface_code
+from ml_replay import to_day_numbers
+
+# Same surface rule as the extractor's fetch_history()
+H2H_QUERY = """
+    SELECT
+        m.match_date,
+        m.player1_id,
+        m.player2_id,
+        m.winner_id,
+        COALESCE(t.surface, 'Hard') as surface
+    FROM matches m
+    LEFT JOIN tournaments t ON m.tournament_id = t.id
+    WHERE m.winner_id IS NOT NULL
+        AND m.match_date IS NOT NULL
+"""
+
+
+class H2HIndex:
+    """(low_id, high_id, surface) -> match days with cumulative low/high wins"""
+
+    def __init__(self, player1_ids, player2_ids, winner_ids, surfaces, days):
+        player1_ids = np.asarray(player1_ids, dtype=np.int64)
+        player2_ids = np.asarray(player2_ids, dtype=np.int64)
+        winner_ids = np.asarray(winner_ids, dtype=np.int64)
+        days = np.asarray(days, dtype=np.int64)
+        codes = np.fromiter((surface_code(s) for s in surfaces), dtype=np.int64, count=len(days))
+
+        low = np.minimum(player1_ids, player2_ids)
+        high = np.maximum(player1_ids, player2_ids)
+        order = np.lexsort((days, codes, high, low))
+        low, high, codes, days = low[order], high[order], codes[order], days[order]
+        low_won = (winner_ids[order] == low).astype(np.int64)
+
+        # One group per pair and surface; rows inside a group are sorted by day
+        is_start = np.ones(len(days), dtype=bool)
+        is_start[1:] = (low[1:] != low[:-1]) | (high[1:] != high[:-1]) | (codes[1:] != codes[:-1])
+        starts = np.flatnonzero(is_start)
+        group = np.cumsum(is_start) - 1
+        self.groups = {
+            (int(low[s]), int(high[s]), int(codes[s])): g for g, s in enumerate(starts.tolist())
+        }
+        self.bounds = np.append(starts, len(days))
+        self.composite = (group.astype(np.int64) << DAY_BITS) | days
+        # low_wins[i] / high_wins[i] = wins among the first i sorted rows
+        self.low_wins = np.concatenate([[0], np.cumsum(low_won)])
+        self.high_wins = np.concatenate([[0], np.cumsum(1 - low_won)])
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame with match_date, player1_id, player2_id, winner_id and surface"""
+        return cls(
+            df['player1_id'].to_numpy(),
+            df['player2_id'].to_numpy(),
+            df['winner_id'].to_numpy(),
+            df['surface'].tolist(),
+            to_day_numbers(df['match_date'])
+        )
+
+    @classmethod
+    def load(cls, conn, query=H2H_QUERY):
+        """Read every decided match in one query"""
+        return cls.from_frame(pd.read_sql_query(query, conn))
+
+    def __len__(self):
+        return len(self.composite)
+
+    def advantage(self, player1_id, player2_id, surface, before=None):
+        """player1 wins minus player2 wins on this surface, before `before` (all if None)"""
+        player1_id, player2_id = int(player1_id), int(player2_id)
+        low, high = min(player1_id, player2_id), max(player1_id, player2_id)
+        g = self.groups.get((low, high, surface_code(surface)))
+        if g is None:
+            return 0
+        start, end = int(self.bounds[g]), int(self.bounds[g + 1])
+        target = (g << DAY_BITS) | day_number(before)
+        pos = start + int(np.searchsorted(self.composite[start:end], target, side='left'))
+        low_wins = int(self.low_wins[pos] - self.low_wins[start])
+        high_wins = int(self.high_wins[pos] - self.high_wins[start])
+        return low_wins - high_wins if player1_id == low else high_wins - low_wins
+
+    def advantages(self, player1_ids, player2_ids, surfaces, before):
+        """Vectorized advantage() over aligned arrays; `before` is an array of dates"""
+        player1_ids = np.asarray(player1_ids, dtype=np.int64)
+        player2_ids = np.asarray(player2_ids, dtype=np.int64)
+        low = np.minimum(player1_ids, player2_ids)
+        high = np.maximum(player1_ids, player2_ids)
+        groups = np.fromiter(
+            (self.groups.get((l, h, surface_code(s)), -1)
+             for l, h, s in zip(low.tolist(), high.tolist(), surfaces)),
+            dtype=np.int64, count=len(low)
+        )
+        found = groups >= 0
+        if not found.any():
+            return np.zeros(len(groups), dtype=np.int64)
+        groups = np.where(found, groups, 0)
+        start = self.bounds[groups]
+        pos = np.searchsorted(self.composite, (groups << DAY_BITS) | to_day_numbers(before), side='left')
+        diff = (self.low_wins[pos] - self.low_wins[start]) - (self.high_wins[pos] - self.high_wins[start])
+        diff = np.where(player1_ids == low, diff, -diff)
+        return np.where(found, diff, 0)
@@ -0,0 +1,212 @@
+"""
+Extraction Profiling
+Records wall time, call counts and SQL round trips per feature family while
+features are extracted, and writes them as a JSON report plus a summary table
+"""
+
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+REPORT_FILE = 'ml_extract_profile.json'
+
+# Report order; anything else recorded is listed after these
+FAMILIES = [
+    'load', 'elo_replay', 'state_updates', 'surface_elo', 'overall_elo', 'win_rates', 'form', 'h2h',
+    'glicko2', 'trueskill', 'demographics', 'assembly', 'save',
+]
+
+
+class Section:
+    __slots__ = ('seconds', 'calls', 'sql_round_trips')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.sql_round_trips = 0
+
+
+class Profiler:
+    """Accumulates per-section timings; SQL round trips go to the innermost open section"""
+
+    enabled = True
+
+    def __init__(self):
+        self.sections = {}
+        self.stack = []
+        self.started = time.perf_counter()
+        self.started_at = datetime.now().isoformat()
+
+    def _section(self, name):
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section()
+        return section
+
+    @contextmanager
+    def section(self, name, calls=1):
+        section = self._section(name)
+        self.stack.append(section)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            section.seconds += time.perf_counter() - start
+            section.calls += calls
+            self.stack.pop()
+
+    def iterate(self, name, iterable):
+        """Yield from iterable, charging the time spent producing each item to a section"""
+        iterator = iter(iterable)
+        section = self._section(name)
+        while True:
+            start = time.perf_counter()
+            self.stack.append(section)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.stack.pop()
+                section.seconds += time.perf_counter() - start
+            section.calls += 1
+            yield item
+
+    def count_round_trip(self):
+        section = self.stack[-1] if self.stack else self._section('other')
+        section.sql_round_trips += 1
+
+    def connection(self, conn):
+        return CountingConnection(conn, self)
+
+    def report(self, rows, **info):
+        wall = time.perf_counter() - self.started
+        names = [name for name in FAMILIES if name in self.sections]
+        names += sorted(name for name in self.sections if name not in FAMILIES)
+        return {
+            'started_at': self.started_at,
+            **info,
+            'rows': rows,
+            'wall_seconds': wall,
+            'rows_per_second': rows / wall if wall > 0 else None,
+            'sql_round_trips': sum(s.sql_round_trips for s in self.sections.values()),
+            'sections': {
+                name: {
+                    'seconds': self.sections[name].seconds,
+                    'calls': self.sections[name].calls,
+                    'sql_round_trips': self.sections[name].sql_round_trips,
+                    'share_of_wall': self.sections[name].seconds / wall if wall > 0 else None,
+                    'us_per_call': (self.sections[name].seconds / self.sections[name].calls * 1e6
+                                    if self.sections[name].calls else None),
+                }
+                for name in names
+            }
+        }
+
+
+class NullProfiler:
+    """Stand-in used when profiling is off; every hook is a no-op"""
+
+    enabled = False
+
+    def section(self, name, calls=1):
+        return nullcontext()
+
+    def iterate(self, name, iterable):
+        return iterable
+
+    def count_round_trip(self):
+        pass
+
+    def connection(self, conn):
+        return conn
+
+
+_active = NullProfiler()
+
+
+def active():
+    return _active
+
+
+def enable():
+    """Start recording; returns the new Profiler"""
+    global _active
+    _active = Profiler()
+    return _active
+
+
+class CountingCursor:
+    """Cursor proxy that counts statements (and fetches on server-side cursors)"""
+
+    def __init__(self, cursor, profiler, server_side):
+        self._cursor = cursor
+        self._profiler = profiler
+        self._server_side = server_side
+
+    def execute(self, *args, **kwargs):
+        self._profiler.count_round_trip()
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._profiler.count_round_trip()
+        return self._cursor.executemany(*args, **kwargs)
+
+    def fetchmany(self, *args, **kwargs):
+        if self._server_side:
+            self._profiler.count_round_trip()
+        return self._cursor.fetchmany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+
+class CountingConnection:
+    """Connection proxy whose cursors report round trips to a Profiler"""
+
+    def __init__(self, conn, profiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def cursor(self, *args, **kwargs):
+        server_side = bool(args and args[0]) or kwargs.get('name') is not None
+        return CountingCursor(self._conn.cursor(*args, **kwargs), self._profiler, server_side)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def write_report(report, path=REPORT_FILE):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def summary_lines(report):
+    """Fixed-width summary table of a report, one string per line"""
+    lines = [f"{'section':<14} {'seconds':>9} {'share':>7} {'calls':>10} {'us/call':>9} {'sql':>8}"]
+    for name, s in report['sections'].items():
+        share = f"{s['share_of_wall'] * 100:.1f}%" if s['share_of_wall'] is not None else '-'
+        per_call = f"{s['us_per_call']:.1f}" if s['us_per_call'] is not None else '-'
+        lines.append(f"{name:<14} {s['seconds']:>9.3f} {share:>7} {s['calls']:>10,} {per_call:>9} "
+                     f"{s['sql_round_trips']:>8,}")
+    rate = f"{report['rows_per_second']:,.0f}" if report['rows_per_second'] else '-'
+    lines.append(f"{'total':<14} {report['wall_seconds']:>9.3f} {'':>7} {report['rows']:>10,} rows "
+                 f"({rate} rows/sec) {report['sql_round_trips']:>8,}")
+    return lines
@@ -0,0 +1,187 @@
+"""
+Chronological Replay Engine for ML Feature Extraction
+Walks the match history once in date order and keeps per-player state in memory,
+so every feature is a point-in-time value computed without per-match queries
+"""
+
+from collections import deque
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RATING = 1500.0
+DEFAULT_RATE = 0.5
+
+# Same windows as get_surface_win_rate(months=12) and (months=120)
+WINDOW_12MO_DAYS = 12 * 30
+WINDOW_CAREER_DAYS = 120 * 30
+
+FORM_LONG = 20
+FORM_SHORT = 10
+
+# Order of stat_row() values
+STAT_KEYS = ('surface_elo', 'overall_elo', 'surface_wr_12mo', 'surface_wr_career', 'form_20', 'form_10')
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def to_day_numbers(dates):
+    """Convert a date column to proleptic Gregorian ordinals (date.toordinal())"""
+    days = pd.to_datetime(dates).values.astype('datetime64[D]').astype(np.int64)
+    return days + EPOCH_ORDINAL
+
+
+class SurfaceWindow:
+    """Rolling win/loss counts for one player on one surface over the last N days"""
+
+    __slots__ = ('days', 'results', 'wins')
+
+    def __init__(self, days):
+        self.days = days
+        self.results = deque()
+        self.wins = 0
+
+    def expire(self, day):
+        """Drop results older than the window ending (exclusive) at day"""
+        start = day - self.days
+        results = self.results
+        while results and results[0][0] < start:
+            self.wins -= results.popleft()[1]
+
+    def add(self, day, won):
+        self.results.append((day, won))
+        self.wins += won
+
+    def rate(self):
+        total = len(self.results)
+        return self.wins / total if total else DEFAULT_RATE
+
+
+class ReplayState:
+    """Per-player state as of the start of the current match day"""
+
+    def __init__(self):
+        self.ratings = {}   # (player_id, surface or None) -> latest Elo rating
+        self.recent = {}    # player_id -> deque of last FORM_LONG results (1 = win)
+        self.windows = {}   # (player_id, surface, days) -> SurfaceWindow
+        self.h2h = {}       # (low_id, high_id, surface) -> [low_wins, high_wins]
+        self.last_day = None
+
+    def apply_rating(self, player_id, surface, value):
+        self.ratings[(player_id, surface)] = float(value)
+
+    def rating(self, player_id, surface):
+        return self.ratings.get((player_id, surface), DEFAULT_RATING)
+
+    def _window(self, player_id, surface, days):
+        key = (player_id, surface, days)
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = SurfaceWindow(days)
+        return window
+
+    def surface_win_rate(self, player_id, surface, day, days):
+        window = self.windows.get((player_id, surface, days))
+        if window is None:
+            return DEFAULT_RATE
+        window.expire(day)
+        return window.rate()
+
+    def recent_form(self, player_id, num_matches):
+        results = self.recent.get(player_id)
+        if not results:
+            return DEFAULT_RATE
+        if num_matches < len(results):
+            results = list(results)[-num_matches:]
+        return sum(results) / len(results)
+
+    def stat_row(self, player_id, surface, day):
+        """Pre-match stats for one player as a tuple in STAT_KEYS order"""
+        return (
+            self.rating(player_id, surface),
+            self.rating(player_id, None),
+            self.surface_win_rate(player_id, surface, day, WINDOW_12MO_DAYS),
+            self.surface_win_rate(player_id, surface, day, WINDOW_CAREER_DAYS),
+            self.recent_form(player_id, FORM_LONG),
+            self.recent_form(player_id, FORM_SHORT),
+        )
+
+    def player_stats(self, player_id, surface, day):
+        """Pre-match stats for one player, keyed like query_player_stats()"""
+        return dict(zip(STAT_KEYS, self.stat_row(player_id, surface, day)))
+
+    def h2h_advantage(self, player1_id, player2_id, surface):
+        """player1 wins minus player2 wins on this surface"""
+        if player1_id < player2_id:
+            counts = self.h2h.get((player1_id, player2_id, surface))
+            return counts[0] - counts[1] if counts else 0
+        counts = self.h2h.get((player2_id, player1_id, surface))
+        return counts[1] - counts[0] if counts else 0
+
+    def apply_match(self, player1_id, player2_id, winner_id, surface, day):
+        """Fold one decided match into the state"""
+        for player_id in (player1_id, player2_id):
+            won = 1 if winner_id == player_id else 0
+            recent = self.recent.get(player_id)
+            if recent is None:
+                recent = self.recent[player_id] = deque(maxlen=FORM_LONG)
+            recent.append(won)
+            self._window(player_id, surface, WINDOW_12MO_DAYS).add(day, won)
+            self._window(player_id, surface, WINDOW_CAREER_DAYS).add(day, won)
+
+        if player1_id < player2_id:
+            key, low_won = (player1_id, player2_id, surface), winner_id == player1_id
+        else:
+            key, low_won = (player2_id, player1_id, surface), winner_id == player2_id
+        counts = self.h2h.get(key)
+        if counts is None:
+            counts = self.h2h[key] = [0, 0]
+        counts[0 if low_won else 1] += 1
+
+        self.last_day = day
+
+
+def replay(history, ratings, state):
+    """
+    Yield history matches in date order while keeping state point-in-time.
+
+    history: DataFrame with match_id, match_date, player1_id, player2_id,
+             winner_id and surface, sorted by match_date then match_id
+    ratings: DataFrame with rated_on, player_id, surface and rating_value,
+             sorted by rated_on
+
+    While a match is being yielded, state reflects every match and rating
+    strictly before its date; a day's results are applied once the whole day
+    has been yielded, matching the `match_date < before_date` queries.
+    """
+    days = to_day_numbers(history['match_date'])
+    rating_days = to_day_numbers(ratings['rated_on'])
+    rating_rows = list(zip(
+        rating_days.tolist(),
+        ratings['player_id'].tolist(),
+        [surface if isinstance(surface, str) else None for surface in ratings['surface'].tolist()],
+        ratings['rating_value'].tolist()
+    ))
+    rating_pos = 0
+
+    pending = []
+    current_day = None
+
+    for day, row in zip(days.tolist(), history.itertuples(index=False)):
+        if day != current_day:
+            for match in pending:
+                state.apply_match(match.player1_id, match.player2_id, match.winner_id, match.surface, current_day)
+            pending = []
+            current_day = day
+
+            while rating_pos < len(rating_rows) and rating_rows[rating_pos][0] < day:
+                _, player_id, surface, value = rating_rows[rating_pos]
+                state.apply_rating(player_id, surface, value)
+                rating_pos += 1
+
+        yield day, row
+        pending.append(row)
+
+    for match in pending:
+        state.apply_match(match.player1_id, match.player2_id, match.winner_id, match.surface, current_day)
@@ -3,13 +3,14 @@ Vercel Serverless Function for ML Match Prediction using Flask
 """
 
 from flask import Flask, request, jsonify
-import json
 import os
+import sys
 import joblib
-import numpy as np
 import psycopg2
-from datetime import datetime, timedelta
-import pandas as pd
+
+# Shared ML modules from scripts/, copied here by scripts/sync_ml_shared.py so they ship with the deploy
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '_ml_shared'))
+from ml_feature_registry import FeatureExecutor
 
 app = Flask(__name__)
 
@@ -39,124 +40,13 @@ def get_player_id(player_name, conn):
     cursor.close()
     return result[0] if result else None
 
-def get_surface_elo(player_id, surface, conn):
-    """Get player's latest ELO rating on specific surface"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT rating_value
-        FROM ratings
-        WHERE player_id = %s
-            AND rating_type = 'elo'
-            AND surface = %s
-        ORDER BY calculated_at DESC
-        LIMIT 1
-    """, (player_id, surface))
-    result = cursor.fetchone()
-    cursor.close()
-    return float(result[0]) if result else 1500.0
-
-def get_overall_elo(player_id, conn):
-    """Get player's latest overall ELO rating"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT rating_value
-        FROM ratings
-        WHERE player_id = %s
-            AND rating_type = 'elo'
-            AND surface IS NULL
-        ORDER BY calculated_at DESC
-        LIMIT 1
-    """, (player_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    return float(result[0]) if result else 1500.0
-
-def get_surface_win_rate(player_id, surface, months, conn):
-    """Get player's win rate on surface in last N months"""
-    cursor = conn.cursor()
-    cutoff_date = datetime.now() - timedelta(days=months*30)
-    
-    cursor.execute("""
-        SELECT 
-            COUNT(*) as total,
-            COUNT(*) FILTER (WHERE winner_id = %s) as wins
-        FROM matches m
-        WHERE (m.player1_id = %s OR m.player2_id = %s)
-            AND m.surface = %s
-            AND m.match_date >= %s
-            AND m.winner_id IS NOT NULL
-    """, (player_id, player_id, player_id, surface, cutoff_date))
-    
-    result = cursor.fetchone()
-    cursor.close()
-    
-    if result and result[0] > 0:
-        return result[1] / result[0]
-    return 0.5
-
-def get_recent_form(player_id, num_matches, conn):
-    """Get player's recent form (win rate in last N matches)"""
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT winner_id = %s as won
-        FROM matches m
-        WHERE (m.player1_id = %s OR m.player2_id = %s)
-            AND m.winner_id IS NOT NULL
-        ORDER BY m.match_date DESC
-        LIMIT %s
-    """, (player_id, player_id, player_id, num_matches))
-    
-    results = cursor.fetchall()
-    cursor.close()
-    
-    if len(results) > 0:
-        wins = sum(1 for r in results if r[0])
-        return wins / len(results)
-    return 0.5
-
-def get_h2h(player1_id, player2_id, surface, conn):
-    """Get head-to-head record on specific surface"""
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT 
-            COUNT(*) FILTER (WHERE winner_id = %s) as p1_wins,
-            COUNT(*) FILTER (WHERE winner_id = %s) as p2_wins
-        FROM matches m
-        WHERE ((m.player1_id = %s AND m.player2_id = %s) 
-            OR (m.player1_id = %s AND m.player2_id = %s))
-            AND m.surface = %s
-            AND m.winner_id IS NOT NULL
-    """, (player1_id, player2_id, player1_id, player2_id, player2_id, player1_id, surface))
-    
-    result = cursor.fetchone()
-    cursor.close()
-    
-    if result:
-        p1_wins = result[0] or 0
-        p2_wins = result[1] or 0
-        return p1_wins - p2_wins
-    return 0
-
-def get_player_info(player_id, conn):
-    """Get player age, height, hand"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT birth_date, height, playing_hand
-        FROM players
-        WHERE id = %s
-    """, (player_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    return result if result else (None, None, None)
-
 def predict_match(player1_name, player2_name, surface):
     """Predict match outcome"""
     try:
         # Load model and scaler from same directory
         model_path = os.path.join(os.path.dirname(__file__), 'xgboost_model.pkl')
         scaler_path = os.path.join(os.path.dirname(__file__), 'scaler.pkl')
+        metadata_path = os.path.join(os.path.dirname(__file__), 'model_metadata.json')
         
         model = joblib.load(model_path)
         scaler = joblib.load(scaler_path)
@@ -175,70 +65,9 @@ def predict_match(player1_name, player2_name, surface):
                 'error': f'Player not found: {player1_name if not player1_id else player2_name}'
             }
         
-        # Get ELO ratings
-        p1_surface_elo = get_surface_elo(player1_id, surface, conn)
-        p2_surface_elo = get_surface_elo(player2_id, surface, conn)
-        p1_overall_elo = get_overall_elo(player1_id, conn)
-        p2_overall_elo = get_overall_elo(player2_id, conn)
-        
-        # Get win rates
-        p1_surface_wr_12mo = get_surface_win_rate(player1_id, surface, 12, conn)
-        p2_surface_wr_12mo = get_surface_win_rate(player2_id, surface, 12, conn)
-        p1_surface_wr_career = get_surface_win_rate(player1_id, surface, 120, conn)
-        p2_surface_wr_career = get_surface_win_rate(player2_id, surface, 120, conn)
-        
-        # Get recent form
-        p1_form_20 = get_recent_form(player1_id, 20, conn)
-        p2_form_20 = get_recent_form(player2_id, 20, conn)
-        p1_surface_form_10 = get_recent_form(player1_id, 10, conn)
-        p2_surface_form_10 = get_recent_form(player2_id, 10, conn)
-        
-        # Get H2H
-        h2h_surface = get_h2h(player1_id, player2_id, surface, conn)
-        
-        # Get player info
-        p1_birth, p1_height, p1_hand = get_player_info(player1_id, conn)
-        p2_birth, p2_height, p2_hand = get_player_info(player2_id, conn)
-        
-        # Calculate age difference
-        if p1_birth and p2_birth:
-            p1_age = (datetime.now() - pd.to_datetime(p1_birth)).days / 365.25
-            p2_age = (datetime.now() - pd.to_datetime(p2_birth)).days / 365.25
-            age_diff = p1_age - p2_age
-        else:
-            age_diff = 0
-        
-        # Height difference
-        height_diff = (p1_height or 180) - (p2_height or 180)
-        
-        # Hand matchup
-        hand_matchup = 1 if p1_hand != p2_hand else 0
-        
-        # Encode surface
-        surface_encoded = {'Hard': 0, 'Clay': 1, 'Grass': 2}.get(surface, 0)
-        
-        # Create feature vector
-        features = np.array([[
-            p1_surface_elo - p2_surface_elo,
-            p1_overall_elo - p2_overall_elo,
-            p1_surface_wr_12mo,
-            p2_surface_wr_12mo,
-            p1_surface_wr_12mo - p2_surface_wr_12mo,
-            p1_surface_wr_career,
-            p2_surface_wr_career,
-            p1_surface_wr_career - p2_surface_wr_career,
-            p1_form_20,
-            p2_form_20,
-            p1_form_20 - p2_form_20,
-            p1_surface_form_10,
-            p2_surface_form_10,
-            p1_surface_form_10 - p2_surface_form_10,
-            age_diff,
-            height_diff,
-            hand_matchup,
-            h2h_surface,
-            surface_encoded
-        ]])
+        # Every model feature in model_metadata.json order, from one batched read per source
+        executor = FeatureExecutor.from_metadata(metadata_path)
+        features, _ = executor.run(conn, [player1_id], [player2_id], surface)
         
         # Scale features
         features_scaled = scaler.transform(features)
@@ -0,0 +1,192 @@
+"""
+TrueSkill Replay for Two-Player Matches
+Replays the match history with the TrueSkill update for a win/loss between
+two players (no draws). The truncated-Gaussian correction functions v and w
+come from dense lookup tables with linear interpolation instead of being
+evaluated per match, and matches are updated in waves of matches that share
+no player, so each wave is a handful of array operations
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from ml_rating_index import RatingIndex
+from ml_replay import to_day_numbers
+
+# Same defaults as TrueSkillRating in server/utils/ratingSystems.js
+MU = 25.0
+SIGMA = 25.0 / 3
+BETA = 25.0 / 6
+TAU = 25.0 / 300
+
+# Dynamics: every match adds TAU^2 to the variance, plus TAU^2 for every
+# full DYNAMICS_DAYS the player was inactive; sigma never exceeds SIGMA
+DYNAMICS_DAYS = 7
+
+# v(t) = pdf(t) / cdf(t) and w(t) = v(t) * (v(t) + t) for t in [T_MIN, T_MAX]
+T_MIN, T_MAX = -10.0, 10.0
+TABLE_STEP = 0.001
+
+
+def _normal_pdf(t):
+    return math.exp(-t * t / 2) / math.sqrt(2 * math.pi)
+
+
+def _normal_cdf(t):
+    return 0.5 * math.erfc(-t / math.sqrt(2))
+
+
+GRID = np.linspace(T_MIN, T_MAX, int(round((T_MAX - T_MIN) / TABLE_STEP)) + 1)
+CDF_TABLE = np.array([_normal_cdf(t) for t in GRID.tolist()])
+V_TABLE = np.array([_normal_pdf(t) for t in GRID.tolist()]) / CDF_TABLE
+W_TABLE = V_TABLE * (V_TABLE + GRID)
+
+
+def v_win(t):
+    """Mean correction for a win with performance margin t; v(t) -> -t below the table"""
+    t = np.asarray(t, dtype=np.float64)
+    return np.where(t < T_MIN, -t, np.interp(t, GRID, V_TABLE))
+
+
+def w_win(t):
+    """Variance correction for a win; w(t) -> 1 below the table"""
+    t = np.asarray(t, dtype=np.float64)
+    return np.where(t < T_MIN, 1.0, np.interp(t, GRID, W_TABLE))
+
+
+def normal_cdf(t):
+    return np.interp(t, GRID, CDF_TABLE)
+
+
+def win_probability(mu1, sigma1, mu2, sigma2, beta=BETA):
+    """P(player1 beats player2)"""
+    c = np.sqrt(2 * beta ** 2 + np.asarray(sigma1) ** 2 + np.asarray(sigma2) ** 2)
+    return normal_cdf((np.asarray(mu1) - np.asarray(mu2)) / c)
+
+
+def match_waves(positions1, positions2, num_players):
+    """Wave number of every match: the earliest wave after both players'
+    previous matches, so a wave never holds two matches of one player and
+    every player's matches stay in order"""
+    next_wave = [0] * num_players
+    waves = []
+    for a, b in zip(positions1, positions2):
+        wave = next_wave[a] if next_wave[a] > next_wave[b] else next_wave[b]
+        next_wave[a] = next_wave[b] = wave + 1
+        waves.append(wave)
+    return np.asarray(waves, dtype=np.int64)
+
+
+class TrueSkillState:
+    """Every player's mean, variance and last match day, by position"""
+
+    def __init__(self, beta=BETA, tau=TAU):
+        self.beta = beta
+        self.tau = tau
+        self.positions = {}  # player_id -> position
+        self.player_ids = np.empty(0, dtype=np.int64)
+        self.mu = np.empty(0)
+        self.sigma2 = np.empty(0)
+        self.last_day = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.mu)
+
+    def _positions(self, player_ids):
+        new = [p for p in pd.unique(player_ids).tolist() if p not in self.positions]
+        if new:
+            for p in new:
+                self.positions[p] = len(self.positions)
+            n = len(new)
+            self.player_ids = np.concatenate([self.player_ids, np.asarray(new, dtype=np.int64)])
+            self.mu = np.concatenate([self.mu, np.full(n, MU)])
+            self.sigma2 = np.concatenate([self.sigma2, np.full(n, SIGMA ** 2)])
+            self.last_day = np.concatenate([self.last_day, np.full(n, -1, dtype=np.int64)])
+        return np.fromiter((self.positions[p] for p in player_ids.tolist()), dtype=np.int64, count=len(player_ids))
+
+    def _dynamics(self, players, days):
+        """Prior variance before a match: TAU^2 per match and per idle period"""
+        last = self.last_day[players]
+        idle = np.where(last < 0, 0, (days - last) // DYNAMICS_DAYS)
+        return np.minimum(self.sigma2[players] + self.tau ** 2 * (1 + idle), SIGMA ** 2)
+
+    def replay(self, matches):
+        """
+        Fold matches (sorted by date) into the ratings and return the history.
+
+        matches: frame with match_date, player1_id, player2_id and winner_id
+
+        Returns one row per player per match, in match order: rated_on,
+        player_id, mu and sigma after the match.
+        """
+        n = len(matches)
+        player1 = matches['player1_id'].to_numpy(dtype=np.int64)
+        player2 = matches['player2_id'].to_numpy(dtype=np.int64)
+        pos1, pos2 = self._positions(player1), self._positions(player2)
+        won1 = matches['winner_id'].to_numpy(dtype=np.int64) == player1
+        winners, losers = np.where(won1, pos1, pos2), np.where(won1, pos2, pos1)
+        days = to_day_numbers(matches['match_date'])
+
+        waves = match_waves(pos1.tolist(), pos2.tolist(), len(self))
+        order = np.argsort(waves, kind='stable')
+        bounds = np.flatnonzero(np.diff(waves[order])) + 1
+        post_mu = np.empty((n, 2))      # winner, loser
+        post_sigma2 = np.empty((n, 2))
+
+        beta2 = self.beta ** 2
+        for rows in np.split(order, bounds) if n else []:
+            w, l, day = winners[rows], losers[rows], days[rows]
+            var_w, var_l = self._dynamics(w, day), self._dynamics(l, day)
+            c2 = 2 * beta2 + var_w + var_l
+            c = np.sqrt(c2)
+            t = (self.mu[w] - self.mu[l]) / c
+            v, wt = v_win(t), w_win(t)
+
+            self.mu[w] += var_w / c * v
+            self.mu[l] -= var_l / c * v
+            self.sigma2[w] = var_w * (1 - var_w / c2 * wt)
+            self.sigma2[l] = var_l * (1 - var_l / c2 * wt)
+            self.last_day[w] = day
+            self.last_day[l] = day
+            post_mu[rows] = np.column_stack([self.mu[w], self.mu[l]])
+            post_sigma2[rows] = np.column_stack([self.sigma2[w], self.sigma2[l]])
+
+        # Back to player1 / player2 order
+        swap = ~won1[:, None]
+        post_mu = np.where(swap, post_mu[:, ::-1], post_mu)
+        post_sigma = np.sqrt(np.where(swap, post_sigma2[:, ::-1], post_sigma2))
+        return pd.DataFrame({
+            'rated_on': np.repeat(matches['match_date'].to_numpy(), 2),
+            'player_id': np.column_stack([player1, player2]).ravel(),
+            'mu': post_mu.ravel(),
+            'sigma': post_sigma.ravel(),
+        })
+
+    def ratings(self, positions):
+        """(mu, sigma) of players by position"""
+        return self.mu[positions], np.sqrt(self.sigma2[positions])
+
+
+class TrueSkillIndex:
+    """Point-in-time TrueSkill mu and sigma: as of the last match dated before the given date"""
+
+    def __init__(self, history):
+        self.history = history
+        frame = history.assign(surface=None)
+        self.mu = RatingIndex.from_frame(frame.rename(columns={'mu': 'rating_value'}), default=MU)
+        self.sigma = RatingIndex.from_frame(frame.rename(columns={'sigma': 'rating_value'}), default=SIGMA)
+
+    @classmethod
+    def from_history(cls, matches):
+        return cls(TrueSkillState().replay(matches))
+
+    def __len__(self):
+        return len(self.history)
+
+    def mus_before(self, player_ids, dates):
+        return self.mu.ratings_before(player_ids, None, dates)
+
+    def sigmas_before(self, player_ids, dates):
+        return self.sigma.ratings_before(player_ids, None, dates)
@@ -0,0 +1,112 @@
+"""
+Vectorized Rolling Surface Win Rates and Form
+Explodes a match table into one row per (player, match) and answers the
+"win rate on this surface in the N days before this match" and "last N
+matches before this date" features for every match at once with sorted
+keys and cumulative win counts
+"""
+
+import numpy as np
+import pandas as pd
+
+from ml_replay import DEFAULT_RATE, FORM_LONG, WINDOW_12MO_DAYS, WINDOW_CAREER_DAYS, to_day_numbers
+
+DAY_BITS = 32
+
+
+def player_long(matches):
+    """One row per (player, match) with player_id, surface, day and won (0/1)"""
+    player1 = matches['player1_id'].to_numpy(dtype=np.int64)
+    player2 = matches['player2_id'].to_numpy(dtype=np.int64)
+    winners = matches['winner_id'].to_numpy(dtype=np.int64)
+    days = to_day_numbers(matches['match_date'])
+    surfaces = matches['surface'].to_numpy()
+    return pd.DataFrame({
+        'player_id': np.concatenate([player1, player2]),
+        'surface': np.concatenate([surfaces, surfaces]),
+        'day': np.concatenate([days, days]),
+        'won': np.concatenate([winners == player1, winners == player2]).astype(np.int64),
+    })
+
+
+class SurfaceWinRates:
+    """Per (player, surface) results sorted by day, with cumulative wins"""
+
+    def __init__(self, history):
+        long = player_long(history)
+        self.surfaces = {name: code for code, name in enumerate(pd.unique(long['surface']))}
+        keys = self._keys(long['player_id'].to_numpy(), long['surface'].to_numpy())
+        composite = (keys << DAY_BITS) | long['day'].to_numpy()
+        order = np.argsort(composite, kind='stable')
+        self.composite = composite[order]
+        # cumulative[i] = wins among the first i sorted rows
+        self.cumulative = np.concatenate([[0], np.cumsum(long['won'].to_numpy()[order])])
+
+    def _keys(self, player_ids, surfaces):
+        # Surfaces missing from the history get a code no row uses
+        codes = np.fromiter((self.surfaces.get(s, len(self.surfaces)) for s in surfaces),
+                            dtype=np.int64, count=len(surfaces))
+        return np.asarray(player_ids, dtype=np.int64) * (len(self.surfaces) + 1) + codes
+
+    def win_rates(self, player_ids, surfaces, days, window):
+        """Win rate over day - window <= match day < day for each (player, surface, day)"""
+        keys = self._keys(player_ids, surfaces) << DAY_BITS
+        days = np.asarray(days, dtype=np.int64)
+        lo = np.searchsorted(self.composite, keys | (days - window), side='left')
+        hi = np.searchsorted(self.composite, keys | days, side='left')
+        played = hi - lo
+        wins = self.cumulative[hi] - self.cumulative[lo]
+        rates = np.full(len(days), DEFAULT_RATE)
+        np.divide(wins, played, out=rates, where=played > 0)
+        return rates
+
+    def for_matches(self, targets, windows=(WINDOW_12MO_DAYS, WINDOW_CAREER_DAYS)):
+        """p1_wr_<days> / p2_wr_<days> columns for every target match (see rolling_surface_win_rates)"""
+        days = to_day_numbers(targets['match_date'])
+        surfaces = targets['surface'].to_numpy()
+        columns = {}
+        for window in windows:
+            for side in ('p1', 'p2'):
+                player_ids = targets[f'player{side[1]}_id'].to_numpy()
+                columns[f'{side}_wr_{window}'] = self.win_rates(player_ids, surfaces, days, window)
+        return pd.DataFrame(columns, index=targets.index)
+
+
+class RecentForm:
+    """Per-player results in match order, with cumulative wins"""
+
+    def __init__(self, history):
+        long = player_long(history)
+        player_ids = long['player_id'].to_numpy()
+        composite = (player_ids << DAY_BITS) | long['day'].to_numpy()
+        # Same-day matches keep the history order (match_date, match_id)
+        match_order = np.tile(np.arange(len(history)), 2)
+        order = np.lexsort((match_order, composite))
+        self.composite = composite[order]
+        self.cumulative = np.concatenate([[0], np.cumsum(long['won'].to_numpy()[order])])
+
+    def recent_form(self, player_ids, days, num_matches=FORM_LONG):
+        """Win rate over each player's last num_matches matches dated before day"""
+        keys = np.asarray(player_ids, dtype=np.int64) << DAY_BITS
+        hi = np.searchsorted(self.composite, keys | np.asarray(days, dtype=np.int64), side='left')
+        first = np.searchsorted(self.composite, keys, side='left')
+        lo = np.maximum(first, hi - num_matches)
+        played = hi - lo
+        wins = self.cumulative[hi] - self.cumulative[lo]
+        rates = np.full(len(played), DEFAULT_RATE)
+        np.divide(wins, played, out=rates, where=played > 0)
+        return rates
+
+
+def rolling_surface_win_rates(history, targets=None, windows=(WINDOW_12MO_DAYS, WINDOW_CAREER_DAYS)):
+    """
+    Surface win rates for both players of every target match, strictly before
+    its date, for each window in days.
+
+    history: matches to count (match_date, player1_id, player2_id, winner_id, surface)
+    targets: matches to compute features for (default: history itself), e.g.
+             the fetch_matches() frame with fetch_history() as the history
+
+    Returns a frame aligned with targets with p1_wr_<days> and p2_wr_<days> columns.
+    """
+    return SurfaceWinRates(history).for_matches(history if targets is None else targets, windows)
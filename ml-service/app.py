@@ -5,149 +5,328 @@ Flask API for ML Match Predictions
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
 import joblib
 import numpy as np
 import psycopg2
-from datetime import datetime, timedelta
-import pandas as pd
+import psycopg2.pool
+
+# Shared ML modules from scripts/, copied here by scripts/sync_ml_shared.py so they ship with the deploy
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '_ml_shared'))
+from ml_feature_registry import FeatureExecutor, PlayerSnapshot, Requests
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Database connection using Railway's DATABASE_URL
-def get_db_connection():
-    database_url = os.environ.get('DATABASE_URL')
-    if not database_url:
-        raise Exception('DATABASE_URL environment variable not set')
-    return psycopg2.connect(database_url, sslmode='require')
-
-def get_player_id(player_name, conn):
-    """Get player ID from name"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id FROM players 
-        WHERE LOWER(name) = LOWER(%s)
-        LIMIT 1
-    """, (player_name,))
-    result = cursor.fetchone()
-    cursor.close()
-    return result[0] if result else None
-
-def get_surface_elo(player_id, surface, conn):
-    """Get player's latest ELO rating on specific surface"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT rating_value
-        FROM ratings
-        WHERE player_id = %s
-            AND rating_type = 'elo'
-            AND surface = %s
-        ORDER BY calculated_at DESC
-        LIMIT 1
-    """, (player_id, surface))
-    result = cursor.fetchone()
-    cursor.close()
-    return float(result[0]) if result else 1500.0
-
-def get_overall_elo(player_id, conn):
-    """Get player's latest overall ELO rating"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT rating_value
-        FROM ratings
-        WHERE player_id = %s
-            AND rating_type = 'elo'
-            AND surface IS NULL
-        ORDER BY calculated_at DESC
-        LIMIT 1
-    """, (player_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    return float(result[0]) if result else 1500.0
-
-def get_surface_win_rate(player_id, surface, months, conn):
-    """Get player's win rate on surface in last N months"""
-    cursor = conn.cursor()
-    cutoff_date = datetime.now() - timedelta(days=months*30)
-    
-    cursor.execute("""
-        SELECT 
-            COUNT(*) as total,
-            COUNT(*) FILTER (WHERE winner_id = %s) as wins
-        FROM matches m
-        WHERE (m.player1_id = %s OR m.player2_id = %s)
-            AND m.surface = %s
-            AND m.match_date >= %s
-            AND m.winner_id IS NOT NULL
-    """, (player_id, player_id, player_id, surface, cutoff_date))
-    
-    result = cursor.fetchone()
-    cursor.close()
-    
-    if result and result[0] > 0:
-        return result[1] / result[0]
-    return 0.5
+# Database connections using Railway's DATABASE_URL, pooled per process
+POOL_MIN_CONNECTIONS = int(os.environ.get('DB_POOL_MIN', 1))
+POOL_MAX_CONNECTIONS = int(os.environ.get('DB_POOL_MAX', 4))
+# Connections idle longer than this are checked with SELECT 1 before reuse
+POOL_HEALTH_CHECK_SECONDS = int(os.environ.get('DB_POOL_HEALTH_CHECK', 30))
 
-def get_recent_form(player_id, num_matches, conn):
-    """Get player's recent form (win rate in last N matches)"""
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT winner_id = %s as won
-        FROM matches m
-        WHERE (m.player1_id = %s OR m.player2_id = %s)
-            AND m.winner_id IS NOT NULL
-        ORDER BY m.match_date DESC
-        LIMIT %s
-    """, (player_id, player_id, player_id, num_matches))
-    
-    results = cursor.fetchall()
-    cursor.close()
-    
-    if len(results) > 0:
-        wins = sum(1 for r in results if r[0])
-        return wins / len(results)
-    return 0.5
-
-def get_h2h(player1_id, player2_id, surface, conn):
-    """Get head-to-head record on specific surface"""
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT 
-            COUNT(*) FILTER (WHERE winner_id = %s) as p1_wins,
-            COUNT(*) FILTER (WHERE winner_id = %s) as p2_wins
-        FROM matches m
-        WHERE ((m.player1_id = %s AND m.player2_id = %s) 
-            OR (m.player1_id = %s AND m.player2_id = %s))
-            AND m.surface = %s
-            AND m.winner_id IS NOT NULL
-    """, (player1_id, player2_id, player1_id, player2_id, player2_id, player1_id, surface))
+# Both players' IDs in one round trip; prepared once per connection
+PLAYER_IDS_STATEMENT = """
+    PREPARE player_ids(text[]) AS
+    SELECT DISTINCT ON (LOWER(name)) LOWER(name), id FROM players
+    WHERE LOWER(name) = ANY($1)
+    ORDER BY LOWER(name), id
+"""
+
+class ConnectionPool:
+    """
+    A ThreadedConnectionPool that is created lazily in the process using it.
+
+    gunicorn forks workers after importing the app; a pool (and its TLS
+    sockets) inherited from the parent would be shared by every worker, so
+    each PID gets its own. Connections are autocommit, get the prepared
+    statements on first checkout, and are health-checked after sitting idle.
+    """
+
+    def __init__(self, minconn=POOL_MIN_CONNECTIONS, maxconn=POOL_MAX_CONNECTIONS):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._pool = None
+        self._pid = None
+        self._prepared = set()
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                database_url = os.environ.get('DATABASE_URL')
+                if not database_url:
+                    raise Exception('DATABASE_URL environment variable not set')
+                # The parent's connections are left alone; closing them would close its sockets
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    self.minconn, self.maxconn, database_url, sslmode='require')
+                self._pid = os.getpid()
+                self._prepared = set()
+                self._last_used = {}
+            return self._pool
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        if time.time() - self._last_used.get(id(conn), 0) < POOL_HEALTH_CHECK_SECONDS:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, pool, conn):
+        self._prepared.discard(id(conn))
+        self._last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+
+    def _setup(self, pool, conn):
+        """Make a connection new to this pool autocommit and prepare its statements"""
+        try:
+            # Before anything else runs on it: autocommit can't be set inside a transaction
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(PLAYER_IDS_STATEMENT)
+        except psycopg2.Error:
+            self._discard(pool, conn)
+            raise
+        self._prepared.add(id(conn))
+        self._last_used[id(conn)] = time.time()
+
+    def _checkout(self, pool):
+        conn = pool.getconn()
+        if id(conn) not in self._prepared:
+            # Fresh connection: the setup statements double as its health check
+            self._setup(pool, conn)
+            return conn
+        if not self._healthy(conn):
+            self._discard(pool, conn)
+            conn = pool.getconn()
+            if id(conn) not in self._prepared:
+                self._setup(pool, conn)
+        return conn
+
+    def getconn(self):
+        return self._checkout(self._get_pool())
+
+    def putconn(self, conn):
+        pool = self._get_pool()
+        if conn.closed:
+            self._discard(pool, conn)
+        else:
+            self._last_used[id(conn)] = time.time()
+            pool.putconn(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; it is returned (or dropped if broken) afterwards"""
+        conn = self.getconn()
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            conn.close()
+            raise
+        finally:
+            self.putconn(conn)
+
+db_pool = ConnectionPool()
+
+def get_player_ids(player_names, conn):
+    """Map each name (case-insensitive) to a player ID with one prepared query; unknown names are left out"""
+    with conn.cursor() as cursor:
+        cursor.execute('EXECUTE player_ids(%s)', (sorted({name.lower() for name in player_names}),))
+        ids = dict(cursor.fetchall())
+    return {name: ids[name.lower()] for name in player_names if name.lower() in ids}
+
+# Features are computed from in-memory indexes (see ml_feature_registry.py) and a
+# per-player snapshot of every active player, rebuilt by a background thread
+RATING_INDEX_TTL = int(os.environ.get('RATING_INDEX_TTL', 3600))
+DATA_VERSION_CHECK_SECONDS = int(os.environ.get('DATA_VERSION_CHECK_SECONDS', 60))
+ACTIVE_PLAYER_YEARS = int(os.environ.get('ACTIVE_PLAYER_YEARS', 3))
+MAX_BATCH_ITEMS = int(os.environ.get('MAX_BATCH_ITEMS', 5000))
+
+# Changes whenever matches or ratings are imported or recalculated
+DATA_VERSION_QUERY = """
+    SELECT
+        (SELECT COALESCE(MAX(id), 0) FROM matches),
+        (SELECT COUNT(*) FROM matches),
+        (SELECT COALESCE(MAX(id), 0) FROM ratings),
+        (SELECT COALESCE(MAX(id), 0) FROM players)
+"""
+
+ACTIVE_PLAYERS_QUERY = """
+    SELECT player1_id FROM matches WHERE match_date >= CURRENT_DATE - %(days)s
+    UNION
+    SELECT player2_id FROM matches WHERE match_date >= CURRENT_DATE - %(days)s
+"""
+
+# Same name rule as the player_ids statement, for every player at once
+PLAYER_NAMES_QUERY = """
+    SELECT DISTINCT ON (LOWER(name)) LOWER(name), id FROM players
+    ORDER BY LOWER(name), id
+"""
+
+def fetch_all(conn, query, params=None):
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+class FeatureState:
+    """Feature sources, the active-player snapshot and the name -> ID map, built together"""
+
+    def __init__(self, sources, players, name_ids, version):
+        self.sources = sources
+        self.players = players
+        self.name_ids = name_ids
+        self.version = version
+        self.built_at = time.time()
+
+def build_feature_state(conn):
+    """Bulk-load everything a prediction reads: one query per source plus the player lists"""
+    version = fetch_all(conn, DATA_VERSION_QUERY)[0]
+    sources = feature_executor.load_sources(conn)
+    active_ids = [row[0] for row in fetch_all(conn, ACTIVE_PLAYERS_QUERY, {'days': 365 * ACTIVE_PLAYER_YEARS})]
+    players = PlayerSnapshot(feature_executor, sources, active_ids)
+    name_ids = dict(fetch_all(conn, PLAYER_NAMES_QUERY))
+    return FeatureState(sources, players, name_ids, version)
+
+class FeatureRefresher:
+    """
+    Keeps the current FeatureState, rebuilding it in a background thread when
+    the data version changes or it is older than RATING_INDEX_TTL. Requests
+    never wait on a rebuild once the first state exists; they keep reading
+    the previous one until the new one is swapped in.
+
+    The thread is started per process (gunicorn workers don't inherit threads).
+    """
+
+    def __init__(self):
+        self.state = None
+        self._pid = None
+        # Guards thread start-up and the first build only; rebuilds take no lock
+        self._start_lock = threading.Lock()
+        self._first_build_lock = threading.Lock()
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='feature-refresher', daemon=True).start()
+
+    def get(self):
+        """The current state, building it first if this process has none yet"""
+        self.start()
+        if self.state is None:
+            self._build_first()
+        return self.state
+
+    def _build_first(self):
+        """Build the first state once, however many requests and the thread ask for it"""
+        with self._first_build_lock:
+            if self.state is None:
+                self._rebuild()
+
+    def _rebuild(self):
+        started = time.time()
+        with db_pool.connection() as conn:
+            state = build_feature_state(conn)
+        # One assignment: requests see either the old state or the new one
+        self.state = state
+        app.logger.info(f'Feature snapshot rebuilt: {len(state.players):,} active players '
+                        f'in {time.time() - started:.1f}s')
+
+    def _stale(self):
+        if time.time() - self.state.built_at > RATING_INDEX_TTL:
+            return True
+        with db_pool.connection() as conn:
+            return tuple(fetch_all(conn, DATA_VERSION_QUERY)[0]) != tuple(self.state.version)
+
+    def _run(self):
+        while True:
+            try:
+                if self.state is None:
+                    self._build_first()
+                elif self._stale():
+                    self._rebuild()
+            except Exception:
+                app.logger.exception('Feature snapshot refresh failed')
+            time.sleep(DATA_VERSION_CHECK_SECONDS)
+
+feature_refresher = FeatureRefresher()
+
+def resolve_player_ids(player_names, state):
+    """Names to IDs from the snapshot; only names it doesn't know go to the database"""
+    ids = {name: state.name_ids[name.lower()] for name in player_names if name.lower() in state.name_ids}
+    unknown = [name for name in player_names if name not in ids]
+    if unknown:
+        with db_pool.connection() as conn:
+            ids.update(get_player_ids(unknown, conn))
+    return ids
+
+def evaluate_requests(match_requests, state):
+    """Input values for requests: snapshot lookups when it covers every player"""
+    players = state.players
+    player_ids = np.concatenate([match_requests.player1_ids, match_requests.player2_ids])
+    return feature_executor.evaluate(state.sources, match_requests,
+                                     players=players if players.covers(player_ids) else None)
+
+def prediction_result(player1_name, player2_name, surface, player1_probability, values, row=0):
+    """The /predict response for one match, from its win probability and feature inputs"""
+    p1, p2 = feature_executor.player_values(values, row)
+    h2h_surface = int(values['h2h'][row])
+    player2_probability = 1.0 - player1_probability
     
-    result = cursor.fetchone()
-    cursor.close()
+    # Calculate confidence
+    confidence = abs(player1_probability - player2_probability)
     
-    if result:
-        p1_wins = result[0] or 0
-        p2_wins = result[1] or 0
-        return p1_wins - p2_wins
-    return 0
-
-def get_player_info(player_id, conn):
-    """Get player age, height, hand"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT birth_date, height, playing_hand
-        FROM players
-        WHERE id = %s
-    """, (player_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    return result if result else (None, None, None)
+    return {
+        'success': True,
+        'player1': player1_name,
+        'player2': player2_name,
+        'surface': surface,
+        'prediction': {
+            'winner': player1_name if player1_probability > 0.5 else player2_name,
+            'player1_win_probability': player1_probability,
+            'player2_win_probability': player2_probability,
+            'confidence': confidence
+        },
+        'key_factors': {
+            'surface_elo_difference': p1['surface_elo'] - p2['surface_elo'],
+            'form_difference': p1['form_20'] - p2['form_20'],
+            'surface_form_difference': p1['form_10'] - p2['form_10'],
+            'h2h_advantage': h2h_surface,
+            'player1_surface_wr': p1['surface_wr_12mo'],
+            'player2_surface_wr': p2['surface_wr_12mo']
+        },
+        'player_stats': {
+            'player1': {
+                'surface_elo': p1['surface_elo'],
+                'overall_elo': p1['overall_elo'],
+                'recent_form': p1['form_20'],
+                'surface_form': p1['form_10']
+            },
+            'player2': {
+                'surface_elo': p2['surface_elo'],
+                'overall_elo': p2['overall_elo'],
+                'recent_form': p2['form_20'],
+                'surface_form': p2['form_10']
+            }
+        }
+    }
 
 # Load model once at startup
 model = joblib.load('xgboost_model.pkl')
 scaler = joblib.load('scaler.pkl')
+feature_executor = FeatureExecutor.from_metadata('model_metadata.json')
+feature_refresher.start()
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -178,136 +357,111 @@ def predict():
                 'error': 'Invalid surface. Must be one of: Hard, Clay, Grass'
             }), 400
         
-        # Connect to database
-        conn = get_db_connection()
-        
-        # Get player IDs
-        player1_id = get_player_id(player1_name, conn)
-        player2_id = get_player_id(player2_name, conn)
+        # Get player IDs (from the snapshot; the database only sees new names)
+        state = feature_refresher.get()
+        player_ids = resolve_player_ids([player1_name, player2_name], state)
+        player1_id = player_ids.get(player1_name)
+        player2_id = player_ids.get(player2_name)
         
         if not player1_id or not player2_id:
-            conn.close()
             return jsonify({
                 'success': False,
                 'error': f'Player not found: {player1_name if not player1_id else player2_name}'
             }), 404
         
-        # Get ELO ratings
-        p1_surface_elo = get_surface_elo(player1_id, surface, conn)
-        p2_surface_elo = get_surface_elo(player2_id, surface, conn)
-        p1_overall_elo = get_overall_elo(player1_id, conn)
-        p2_overall_elo = get_overall_elo(player2_id, conn)
-        
-        # Get win rates
-        p1_surface_wr_12mo = get_surface_win_rate(player1_id, surface, 12, conn)
-        p2_surface_wr_12mo = get_surface_win_rate(player2_id, surface, 12, conn)
-        p1_surface_wr_career = get_surface_win_rate(player1_id, surface, 120, conn)
-        p2_surface_wr_career = get_surface_win_rate(player2_id, surface, 120, conn)
-        
-        # Get recent form
-        p1_form_20 = get_recent_form(player1_id, 20, conn)
-        p2_form_20 = get_recent_form(player2_id, 20, conn)
-        p1_surface_form_10 = get_recent_form(player1_id, 10, conn)
-        p2_surface_form_10 = get_recent_form(player2_id, 10, conn)
-        
-        # Get H2H
-        h2h_surface = get_h2h(player1_id, player2_id, surface, conn)
+        # Every model feature in model_metadata.json order, as of the snapshot's date
+        match_requests = Requests([player1_id], [player2_id], surface, state.players.as_of)
+        values = evaluate_requests(match_requests, state)
+        features = feature_executor.matrix(values)
         
-        # Get player info
-        p1_birth, p1_height, p1_hand = get_player_info(player1_id, conn)
-        p2_birth, p2_height, p2_hand = get_player_info(player2_id, conn)
+        # Scale features and make prediction
+        player1_probability = float(model.predict_proba(scaler.transform(features))[0, 1])
         
-        conn.close()
-        
-        # Calculate age difference
-        if p1_birth and p2_birth:
-            p1_age = (datetime.now() - pd.to_datetime(p1_birth)).days / 365.25
-            p2_age = (datetime.now() - pd.to_datetime(p2_birth)).days / 365.25
-            age_diff = p1_age - p2_age
-        else:
-            age_diff = 0
-        
-        # Height difference
-        height_diff = (p1_height or 180) - (p2_height or 180)
+        # Return result
+        return jsonify(prediction_result(player1_name, player2_name, surface, player1_probability, values))
         
-        # Hand matchup
-        hand_matchup = 1 if p1_hand != p2_hand else 0
+    except Exception as e:
+        import traceback
+        app.logger.error(f'Prediction error: {str(e)}')
+        app.logger.error(traceback.format_exc())
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Predict many matches in one request: {"matches": [{player1_name,
+    player2_name, surface}, ...]}. Results come back in the same order, each
+    shaped like a /predict response; invalid items get their own error.
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get('matches')
         
-        # Encode surface
-        surface_encoded = {'Hard': 0, 'Clay': 1, 'Grass': 2}.get(surface, 0)
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'error': 'Body must be {"matches": [{player1_name, player2_name, surface}, ...]}'
+            }), 400
         
-        # Create feature vector
-        features = np.array([[
-            p1_surface_elo - p2_surface_elo,
-            p1_overall_elo - p2_overall_elo,
-            p1_surface_wr_12mo,
-            p2_surface_wr_12mo,
-            p1_surface_wr_12mo - p2_surface_wr_12mo,
-            p1_surface_wr_career,
-            p2_surface_wr_career,
-            p1_surface_wr_career - p2_surface_wr_career,
-            p1_form_20,
-            p2_form_20,
-            p1_form_20 - p2_form_20,
-            p1_surface_form_10,
-            p2_surface_form_10,
-            p1_surface_form_10 - p2_surface_form_10,
-            age_diff,
-            height_diff,
-            hand_matchup,
-            h2h_surface,
-            surface_encoded
-        ]])
+        if len(items) > MAX_BATCH_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f'Too many matches: {len(items):,} (limit {MAX_BATCH_ITEMS:,})'
+            }), 400
         
-        # Scale features
-        features_scaled = scaler.transform(features)
+        results = [None] * len(items)
+        valid = []
+        for i, item in enumerate(items):
+            item = item if isinstance(item, dict) else {}
+            if not all([item.get('player1_name'), item.get('player2_name'), item.get('surface')]):
+                results[i] = {'success': False,
+                              'error': 'Missing required fields: player1_name, player2_name, surface'}
+            elif item['surface'] not in ['Hard', 'Clay', 'Grass']:
+                results[i] = {'success': False, 'error': 'Invalid surface. Must be one of: Hard, Clay, Grass'}
+            else:
+                valid.append(i)
         
-        # Make prediction
-        prediction_proba = model.predict_proba(features_scaled)[0]
-        prediction = model.predict(features_scaled)[0]
+        # Every name at once (from the snapshot; the database only sees new names)
+        state = feature_refresher.get()
+        names = {items[i][key] for i in valid for key in ('player1_name', 'player2_name')}
+        player_ids = resolve_player_ids(sorted(names), state) if names else {}
+        scored = []
+        for i in valid:
+            unknown = [items[i][key] for key in ('player1_name', 'player2_name') if items[i][key] not in player_ids]
+            if unknown:
+                results[i] = {'success': False, 'error': f'Player not found: {unknown[0]}'}
+            else:
+                scored.append(i)
         
-        # Calculate confidence
-        confidence = abs(float(prediction_proba[1]) - float(prediction_proba[0]))
+        if scored:
+            # One feature matrix, one scaler pass and one booster call for the whole batch
+            match_requests = Requests(
+                [player_ids[items[i]['player1_name']] for i in scored],
+                [player_ids[items[i]['player2_name']] for i in scored],
+                [items[i]['surface'] for i in scored],
+                state.players.as_of
+            )
+            values = evaluate_requests(match_requests, state)
+            features = feature_executor.matrix(values)
+            probabilities = model.predict_proba(scaler.transform(features))[:, 1]
+            for row, i in enumerate(scored):
+                item = items[i]
+                results[i] = prediction_result(item['player1_name'], item['player2_name'], item['surface'],
+                                               float(probabilities[row]), values, row)
         
-        # Return result
         return jsonify({
             'success': True,
-            'player1': player1_name,
-            'player2': player2_name,
-            'surface': surface,
-            'prediction': {
-                'winner': player1_name if prediction == 1 else player2_name,
-                'player1_win_probability': float(prediction_proba[1]),
-                'player2_win_probability': float(prediction_proba[0]),
-                'confidence': confidence
-            },
-            'key_factors': {
-                'surface_elo_difference': float(p1_surface_elo - p2_surface_elo),
-                'form_difference': float(p1_form_20 - p2_form_20),
-                'surface_form_difference': float(p1_surface_form_10 - p2_surface_form_10),
-                'h2h_advantage': int(h2h_surface),
-                'player1_surface_wr': float(p1_surface_wr_12mo),
-                'player2_surface_wr': float(p2_surface_wr_12mo)
-            },
-            'player_stats': {
-                'player1': {
-                    'surface_elo': float(p1_surface_elo),
-                    'overall_elo': float(p1_overall_elo),
-                    'recent_form': float(p1_form_20),
-                    'surface_form': float(p1_surface_form_10)
-                },
-                'player2': {
-                    'surface_elo': float(p2_surface_elo),
-                    'overall_elo': float(p2_overall_elo),
-                    'recent_form': float(p2_form_20),
-                    'surface_form': float(p2_surface_form_10)
-                }
-            }
+            'count': len(results),
+            'predicted': len(scored),
+            'results': results
         })
         
     except Exception as e:
         import traceback
-        app.logger.error(f'Prediction error: {str(e)}')
+        app.logger.error(f'Batch prediction error: {str(e)}')
         app.logger.error(traceback.format_exc())
         return jsonify({
             'success': False,
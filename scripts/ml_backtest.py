@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Walk-Forward Backtest for the Match Model
+Trains the model on every season up to S and scores it on season S+1, for
+each test season in turn, so no fold ever sees matches from its future.
+Folds run in a process pool with a bounded thread count each; the feature
+matrix is written once to a memory-mapped .npy file that every worker maps
+read-only instead of receiving a pickled copy.
+
+Usage:
+    python3 scripts/ml_backtest.py --workers 4 --threads 2
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from sklearn.metrics import accuracy_score, brier_score_loss, log_loss, roc_auc_score
+
+from ml_feature_registry import OPTIONAL_FEATURES
+from ml_feature_store import STORE_DIR, is_store, load_columns
+from ml_train_model import FEATURE_COLS, XGB_PARAMS
+
+OUTPUT_FILE = 'backtest_results.json'
+SURFACE_CODES = {'Hard': 0, 'Clay': 1, 'Grass': 2}
+
+
+def print_progress(message, emoji="📊"):
+    """Print progress with timestamp"""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    print(f"[{timestamp}] {emoji} {message}")
+    sys.stdout.flush()
+
+
+def write_shared_arrays(features_path, feature_cols, out_dir):
+    """
+    Write the model matrix and target, sorted by match_date, as .npy files
+    in out_dir and return (matrix_path, target_path, dates).
+
+    From the feature store the matrix is filled column by column straight
+    from the mapped column files, so it is never held in memory as a whole.
+    """
+    columns = feature_cols + ['surface']
+    matrix_path = os.path.join(out_dir, 'X.npy')
+    target_path = os.path.join(out_dir, 'y.npy')
+
+    if is_store(features_path):
+        arrays = load_columns(features_path, columns + ['target', 'match_date'])
+        dates = np.asarray(arrays['match_date'])
+        target = np.asarray(arrays['target'])
+        matrix = np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.float32,
+                                           shape=(len(dates), len(columns)))
+        for i, name in enumerate(columns):
+            matrix[:, i] = arrays[name]
+    else:
+        df = pd.read_csv(features_path, parse_dates=['match_date'])
+        df = df.sort_values(['match_date', 'match_id'], kind='stable')
+        df['surface'] = df['surface'].map(SURFACE_CODES)
+        dates = df['match_date'].to_numpy().astype('datetime64[D]')
+        target = df['target'].to_numpy(dtype=np.int8)
+        matrix = np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.float32,
+                                           shape=(len(df), len(columns)))
+        matrix[:] = df[columns].to_numpy(dtype=np.float32)
+
+    matrix.flush()
+    del matrix
+    np.save(target_path, target)
+    return matrix_path, target_path, dates
+
+
+def make_folds(dates, first_test=None, last_test=None, min_train_seasons=3, window=None):
+    """
+    Walk-forward folds over sorted dates: one per test season, each a dict
+    of row ranges (rows are contiguous because the data is date-sorted).
+
+    window: number of seasons to train on (default: every earlier season)
+    """
+    seasons = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    available = np.unique(seasons).tolist()
+    if not available:
+        return []
+    first_test = max(first_test or available[0], available[0] + min_train_seasons)
+    last_test = min(last_test or available[-1], available[-1])
+
+    folds = []
+    for season in range(first_test, last_test + 1):
+        train_from = available[0] if window is None else season - window
+        start = int(np.searchsorted(seasons, train_from, side='left'))
+        train_end = int(np.searchsorted(seasons, season, side='left'))
+        test_end = int(np.searchsorted(seasons, season, side='right'))
+        if train_end > start and test_end > train_end:
+            folds.append({'season': season, 'train_from': max(train_from, available[0]),
+                          'train_start': start, 'train_end': train_end, 'test_end': test_end})
+    return folds
+
+
+def run_fold(matrix_path, target_path, fold, params, threads):
+    """
+    Fit the model on one fold's training rows and score its test season.
+
+    The model trains on read-only float32 views of the shared mapped matrix;
+    no scaler is fit, since tree splits don't change under per-column scaling
+    and fitting one would copy every training row into float64 per worker.
+    """
+    started = time.time()
+    X = np.load(matrix_path, mmap_mode='r')
+    y = np.load(target_path, mmap_mode='r')
+    train = slice(fold['train_start'], fold['train_end'])
+    test = slice(fold['train_end'], fold['test_end'])
+    X_train, X_test = X[train], X[test]
+    y_train, y_test = np.asarray(y[train]), np.asarray(y[test])
+    result = {**fold, 'train_rows': len(y_train), 'test_rows': len(y_test), 'pid': os.getpid()}
+
+    if len(np.unique(y_train)) < 2:
+        return {**result, 'skipped': 'training rows have a single class',
+                'seconds': round(time.time() - started, 3)}
+    load_seconds = time.time() - started
+
+    fit_started = time.time()
+    model = xgb.XGBClassifier(**{**params, 'n_jobs': threads})
+    model.fit(X_train, y_train)
+    fit_seconds = time.time() - fit_started
+
+    proba = model.predict_proba(X_test)[:, 1]
+    return {
+        **result,
+        'accuracy': float(accuracy_score(y_test, proba > 0.5)),
+        # AUC is undefined when the test season has a single class
+        'auc': float(roc_auc_score(y_test, proba)) if len(np.unique(y_test)) > 1 else None,
+        'log_loss': float(log_loss(y_test, proba, labels=[0, 1])),
+        'brier': float(brier_score_loss(y_test, proba)),
+        'load_seconds': round(load_seconds, 3),
+        'fit_seconds': round(fit_seconds, 3),
+        'seconds': round(time.time() - started, 3)
+    }
+
+
+def run_backtest(matrix_path, target_path, folds, params, workers=1, threads=1):
+    """Run every fold; with workers > 1 they run in a process pool, largest first"""
+    results = []
+    if workers <= 1:
+        for fold in folds:
+            results.append(run_fold(matrix_path, target_path, fold, params, threads))
+            print_progress(f"   {fold['season']} done in {results[-1]['seconds']:.1f}s", "✅")
+    else:
+        # Later seasons have the most training rows; starting them first shortens the tail
+        order = sorted(folds, key=lambda f: f['train_end'] - f['train_start'], reverse=True)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_fold, matrix_path, target_path, fold, params, threads): fold
+                       for fold in order}
+            for future in as_completed(futures):
+                results.append(future.result())
+                print_progress(f"   {futures[future]['season']} done in {results[-1]['seconds']:.1f}s", "✅")
+    return sorted(results, key=lambda r: r['season'])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Walk-forward backtest: train through season S, test on S+1')
+    parser.add_argument('--features', default=None,
+                        help=f'Feature store directory or CSV file (default: {STORE_DIR}/ if present, '
+                             f'else ml_features.csv)')
+    parser.add_argument('--extra-features', nargs='+', choices=OPTIONAL_FEATURES, default=[], metavar='NAME',
+                        help='Optional feature columns to train on as well (extracted with the same flag)')
+    parser.add_argument('--first-test-season', type=int, default=None,
+                        help='First season to test on (default: after --min-train-seasons)')
+    parser.add_argument('--last-test-season', type=int, default=None,
+                        help='Last season to test on (default: the latest one)')
+    parser.add_argument('--min-train-seasons', type=int, default=3,
+                        help='Seasons of training data the first fold needs (default: 3)')
+    parser.add_argument('--window', type=int, default=None,
+                        help='Train on only the last N seasons (default: all earlier seasons)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Folds to run in parallel processes (default: 1)')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='XGBoost threads per fold (default: CPUs / workers)')
+    parser.add_argument('--output', default=OUTPUT_FILE,
+                        help=f'JSON file for the per-season results (default: {OUTPUT_FILE})')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    features_path = args.features or (STORE_DIR if is_store(STORE_DIR) else 'ml_features.csv')
+    threads = args.threads or max(1, (os.cpu_count() or 1) // max(args.workers, 1))
+    feature_cols = FEATURE_COLS + args.extra_features
+
+    print_progress("=" * 60, "🚀")
+    print_progress("WALK-FORWARD BACKTEST", "🎾")
+    print_progress("=" * 60, "🚀")
+    print()
+
+    with tempfile.TemporaryDirectory(prefix='ml_backtest_') as shared_dir:
+        print_progress(f"Loading features from {features_path}...", "📂")
+        matrix_path, target_path, dates = write_shared_arrays(features_path, feature_cols, shared_dir)
+        print_progress(f"✅ Mapped {len(dates):,} matches x {len(feature_cols) + 1} features", "✅")
+
+        folds = make_folds(dates, args.first_test_season, args.last_test_season,
+                           args.min_train_seasons, args.window)
+        if not folds:
+            print_progress("No seasons to test on; check the season arguments", "❌")
+            sys.exit(1)
+        print_progress(f"{len(folds)} folds ({folds[0]['season']}-{folds[-1]['season']}) on "
+                       f"{args.workers} worker(s) x {threads} thread(s)", "⚙️")
+        print()
+
+        start_time = time.time()
+        results = run_backtest(matrix_path, target_path, folds, dict(XGB_PARAMS), args.workers, threads)
+        elapsed = time.time() - start_time
+    print()
+
+    skipped = [r for r in results if 'skipped' in r]
+    results = [r for r in results if 'skipped' not in r]
+    for r in skipped:
+        print_progress(f"   Skipped {r['season']}: {r['skipped']}", "⚠️")
+    if not results:
+        print_progress("Every fold was skipped", "❌")
+        sys.exit(1)
+
+    print_progress("Per-Season Performance:", "📊")
+    for r in results:
+        auc = 'n/a' if r['auc'] is None else f"{r['auc']:.4f}"
+        print_progress(f"   {r['season']}: Accuracy={r['accuracy']*100:.2f}%, AUC={auc}, "
+                       f"LogLoss={r['log_loss']:.4f} (train {r['train_rows']:,}, test {r['test_rows']:,}, "
+                       f"{r['fit_seconds']:.1f}s fit)", "🎾")
+    print()
+
+    test_rows = np.array([r['test_rows'] for r in results], dtype=np.float64)
+    summary = {name: float(np.average([r[name] for r in results], weights=test_rows))
+               for name in ('accuracy', 'log_loss', 'brier')}
+    # Folds without an AUC are left out of its average rather than turning it into NaN
+    with_auc = [r for r in results if r['auc'] is not None]
+    summary['auc'] = (float(np.average([r['auc'] for r in with_auc], weights=[r['test_rows'] for r in with_auc]))
+                      if with_auc else None)
+    fold_seconds = sum(r['seconds'] for r in results + skipped)
+    overall_auc = 'n/a' if summary['auc'] is None else f"{summary['auc']:.4f}"
+    print_progress(f"Overall (weighted by test matches): Accuracy={summary['accuracy']*100:.2f}%, "
+                   f"AUC={overall_auc}, LogLoss={summary['log_loss']:.4f}, "
+                   f"Brier={summary['brier']:.4f}", "🎯")
+    print_progress(f"Wall time {elapsed:.1f}s for {fold_seconds:.1f}s of fold work", "⏱️")
+
+    report = {
+        'run_at': datetime.now().isoformat(),
+        'features': feature_cols + ['surface'],
+        'hyperparameters': {k: v for k, v in XGB_PARAMS.items() if k not in ['n_jobs', 'random_state']},
+        'workers': args.workers,
+        'threads_per_fold': threads,
+        'window': args.window,
+        'wall_seconds': round(elapsed, 3),
+        'fold_seconds': round(fold_seconds, 3),
+        'summary': summary,
+        'seasons': [{k: v for k, v in r.items() if k != 'pid'} for r in results],
+        'skipped': [{'season': r['season'], 'reason': r['skipped']} for r in skipped]
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_progress(f"✅ Saved: {args.output}", "✅")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Offline Data Source for Feature Extraction
+Reads the ATP files in data-source/ (atp_matches_YYYY.csv and
+atp_players.csv) into the same frames the extractor otherwise queries from
+Postgres; ELO ratings are not in the files and are replayed in-process
+from the history instead (see ml_elo.py)
+"""
+
+import os
+import re
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = 'data-source'
+PLAYERS_FILE = 'atp_players.csv'
+MATCH_FILE_PATTERN = re.compile(r'^atp_matches_(\d{4})\.csv$')
+
+MATCH_CSV_COLUMNS = ['tourney_name', 'surface', 'tourney_level', 'tourney_date', 'winner_id', 'loser_id', 'round']
+TARGET_SURFACES = ('Hard', 'Clay', 'Grass')
+
+
+def parse_csv_dates(values):
+    """YYYYMMDD strings to timestamps; malformed or zero months/days become NaT"""
+    return pd.to_datetime(pd.Series(values, dtype='string'), format='%Y%m%d', errors='coerce')
+
+
+def match_files(data_dir=DATA_DIR, years=None):
+    """The yearly tour-level match files, oldest first"""
+    files = []
+    for name in sorted(os.listdir(data_dir)):
+        found = MATCH_FILE_PATTERN.match(name)
+        if found and (years is None or int(found.group(1)) in years):
+            files.append(os.path.join(data_dir, name))
+    return files
+
+
+def load_players(data_dir=DATA_DIR):
+    """atp_players.csv as importPlayers.js stores it"""
+    df = pd.read_csv(os.path.join(data_dir, PLAYERS_FILE), dtype=str, keep_default_na=False,
+                     encoding='utf-8', encoding_errors='replace')
+    return pd.DataFrame({
+        'player_id': df['player_id'].astype(np.int64),
+        'name': df['name_first'] + ' ' + df['name_last'],
+        'birth_date': parse_csv_dates(df['dob']).dt.date,
+        'height': pd.to_numeric(df['height'], errors='coerce'),
+        'playing_hand': df['hand'].replace('', None),
+    })
+
+
+def load_matches(data_dir=DATA_DIR, years=None, player_ids=None):
+    """
+    Every match of the yearly files, numbered in import order (files by
+    year, rows in file order) so (match_date, match_id) sorts like the
+    database. Rows without a valid date or with unknown players are dropped.
+    """
+    frames = [
+        pd.read_csv(path, usecols=MATCH_CSV_COLUMNS, dtype=str, keep_default_na=False,
+                    encoding='utf-8', encoding_errors='replace')
+        for path in match_files(data_dir, years)
+    ]
+    if not frames:
+        raise FileNotFoundError(f"No atp_matches_YYYY.csv files in {data_dir}")
+    df = pd.concat(frames, ignore_index=True)
+
+    matches = pd.DataFrame({
+        'match_id': np.arange(1, len(df) + 1, dtype=np.int64),
+        'match_date': parse_csv_dates(df['tourney_date']),
+        'player1_id': pd.to_numeric(df['winner_id'], errors='coerce'),
+        'player2_id': pd.to_numeric(df['loser_id'], errors='coerce'),
+        'round': df['round'].replace('', None),
+        'surface': df['surface'].replace('', None),
+        'tournament_name': df['tourney_name'],
+        'tournament_level': df['tourney_level'].replace('', None),
+    })
+    keep = matches['match_date'].notna() & matches['player1_id'].notna() & matches['player2_id'].notna()
+    if player_ids is not None:
+        keep &= matches['player1_id'].isin(player_ids) & matches['player2_id'].isin(player_ids)
+    matches = matches[keep].reset_index(drop=True)
+    # In the source files the winner is always listed first, as in the matches table
+    matches['player1_id'] = matches['player1_id'].astype(np.int64)
+    matches['player2_id'] = matches['player2_id'].astype(np.int64)
+    matches['winner_id'] = matches['player1_id']
+    return matches.sort_values(['match_date', 'match_id'], kind='stable').reset_index(drop=True)
+
+
+class CsvSource:
+    """The extractor's inputs read from CSV files instead of Postgres"""
+
+    def __init__(self, data_dir=DATA_DIR, years=None):
+        self.data_dir = data_dir
+        self.players = load_players(data_dir)
+        self.all_matches = load_matches(data_dir, years, self.players['player_id'])
+
+    def matches(self, start_year=2000, after_date=None):
+        """Target matches, shaped like the extractor's MATCHES_QUERY"""
+        m = self.all_matches
+        surfaces = m['surface'].fillna('Hard')
+        keep = (m['match_date'] >= pd.Timestamp(date(start_year, 1, 1))) & surfaces.isin(TARGET_SURFACES)
+        if after_date is not None:
+            keep &= m['match_date'] > pd.Timestamp(after_date)
+        m = m[keep]
+
+        players = self.players.set_index('player_id')
+        p1 = players.reindex(m['player1_id'])
+        p2 = players.reindex(m['player2_id'])
+        df = pd.DataFrame({
+            'match_id': m['match_id'].to_numpy(),
+            'match_date': m['match_date'].dt.date.to_numpy(),
+            'player1_id': m['player1_id'].to_numpy(),
+            'player2_id': m['player2_id'].to_numpy(),
+            'winner_id': m['winner_id'].to_numpy(),
+            'round': m['round'].to_numpy(),
+            'surface': surfaces[keep].to_numpy(),
+            'tournament_name': m['tournament_name'].to_numpy(),
+            'tournament_level': m['tournament_level'].to_numpy(),
+            'player1_name': p1['name'].to_numpy(),
+            'player2_name': p2['name'].to_numpy(),
+            'p1_birth_date': p1['birth_date'].to_numpy(),
+            'p2_birth_date': p2['birth_date'].to_numpy(),
+            'p1_height': p1['height'].to_numpy(),
+            'p2_height': p2['height'].to_numpy(),
+            'p1_hand': p1['playing_hand'].to_numpy(),
+            'p2_hand': p2['playing_hand'].to_numpy(),
+        })
+        named = df['player1_name'].str.strip().astype(bool) & df['player2_name'].str.strip().astype(bool)
+        return df[named].reset_index(drop=True)
+
+    def history(self, after_date=None):
+        """Decided matches, oldest first, shaped like fetch_history() (with the
+        raw surface and tournament level the ELO replay rates by)"""
+        m = self.all_matches
+        if after_date is not None:
+            m = m[m['match_date'] > pd.Timestamp(after_date)]
+        return pd.DataFrame({
+            'match_id': m['match_id'].to_numpy(),
+            'match_date': m['match_date'].dt.date.to_numpy(),
+            'player1_id': m['player1_id'].to_numpy(),
+            'player2_id': m['player2_id'].to_numpy(),
+            'winner_id': m['winner_id'].to_numpy(),
+            'surface': m['surface'].fillna('Hard').to_numpy(),
+            'rating_surface': m['surface'].to_numpy(),
+            'tournament_level': m['tournament_level'].to_numpy(),
+        })
+
+    def player_attributes(self):
+        """Players shaped like the feature registry's PLAYERS_QUERY"""
+        return self.players[['player_id', 'birth_date', 'height', 'playing_hand']]
@@ -0,0 +1,197 @@
+"""
+ELO Rating Replay
+Recomputes the ratings calculateELORatings.js writes to the ratings table
+(tournament-weighted overall ELO plus one ELO per surface) in one tight loop
+over the matches, and hands the pre-match ratings to the feature pipeline as
+columns instead of reading the ratings table back
+"""
+
+import numpy as np
+import pandas as pd
+
+from ml_replay import DEFAULT_RATING, to_day_numbers
+
+# Same weights and K-factors as calculateELORatings.js
+TOURNAMENT_WEIGHTS = {'G': 1.5, 'M': 1.3, '1000': 1.2, '500': 1.1, '250': 1.0, 'C': 0.8, 'F': 0.6, 'A': 1.0}
+DEFAULT_WEIGHT = 1.0
+
+# getKFactor() counts a player's 'elo' rows, and every match writes two of
+# them (overall + surface), so these are thresholds on rows, not matches.
+# Surface ratings ask for rating_type 'elo_<Surface>', which has no rows:
+# they always use the new-player K.
+K_NEW, K_RISING, K_ESTABLISHED = 40, 35, 32
+RISING_ROWS, ESTABLISHED_ROWS = 10, 30
+
+# ratings.rating_value is DECIMAL(10,2); the JS reads back the rounded value
+RATING_DECIMALS = 2
+
+# Surface rating slots per player; the last one is never updated, so
+# surfaces without ratings (e.g. Carpet lookups) read the default
+SURFACES = ('Hard', 'Clay', 'Grass')
+SURFACE_SLOTS = {name: slot for slot, name in enumerate(SURFACES)}
+UNRATED_SLOT = len(SURFACES)
+SLOTS_PER_PLAYER = len(SURFACES) + 1
+
+# Feature registry inputs the replay provides
+ELO_INPUTS = ('surface_elo', 'overall_elo')
+
+
+def normalize_surface(surface):
+    """normalizeSurface() from the JS: Hard, Clay or Grass, defaulting to Hard"""
+    if not isinstance(surface, str) or not surface:
+        return 'Hard'
+    s = surface.lower()
+    if 'hard' in s:
+        return 'Hard'
+    if 'clay' in s:
+        return 'Clay'
+    if 'grass' in s:
+        return 'Grass'
+    return 'Hard'
+
+
+def k_factor(rating_rows):
+    if rating_rows < RISING_ROWS:
+        return K_NEW
+    if rating_rows < ESTABLISHED_ROWS:
+        return K_RISING
+    return K_ESTABLISHED
+
+
+def expected_score(rating, opponent_rating):
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+class EloColumns:
+    """Ratings around every replayed match, in replay order.
+
+    pre: (n, 4) overall and feature-surface ratings of player1 and player2
+         as of the start of the match day (what a `rated_on < match_date`
+         lookup of the ratings table returns)
+    post: (n, 4) overall and rated-surface ratings after the match, as saved
+          by the JS (player1 overall, player2 overall, player1 surface, player2 surface)
+    """
+
+    def __init__(self, match_ids, dates, player_ids, rated_surfaces, pre, post):
+        self.match_ids = match_ids
+        self.dates = dates
+        self.player_ids = player_ids          # (n, 2)
+        self.rated_surfaces = rated_surfaces  # (n,) surface name each match was rated on
+        self.pre = pre
+        self.post = post
+
+    def __len__(self):
+        return len(self.match_ids)
+
+    def for_matches(self, match_ids):
+        """{'surface_elo': (n, 2), 'overall_elo': (n, 2)} pre-match ratings of the given matches"""
+        rows = pd.Index(self.match_ids).get_indexer(np.asarray(match_ids))
+        if (rows < 0).any():
+            raise KeyError(f"{int((rows < 0).sum())} matches were not replayed")
+        pre = self.pre[rows]
+        return {'surface_elo': pre[:, 2:4], 'overall_elo': pre[:, 0:2]}
+
+    def rating_rows(self):
+        """The rows calculateELORatings.js inserts, shaped like RATINGS_QUERY's result"""
+        n = len(self)
+        surfaces = np.empty((n, 4), dtype=object)
+        surfaces[:, 2] = surfaces[:, 3] = self.rated_surfaces
+        return pd.DataFrame({
+            'rated_on': np.repeat(self.dates, 4),
+            'player_id': np.tile(self.player_ids, 2).ravel(),
+            'surface': surfaces.ravel(),
+            'rating_value': self.post.ravel(),
+        })
+
+
+class EloState:
+    """Every player's overall and surface ELO and K-factor row count, in flat
+    lists indexed by player position (picklable, so it can be checkpointed)"""
+
+    def __init__(self):
+        self.positions = {}  # player_id -> position
+        self.overall = []
+        self.surface = []    # SLOTS_PER_PLAYER per player
+        self.rows = []       # 'elo' rows written so far
+
+    def __len__(self):
+        return len(self.overall)
+
+    def _positions(self, player_ids):
+        positions = self.positions
+        for player_id in pd.unique(player_ids).tolist():
+            if player_id not in positions:
+                positions[player_id] = len(self.overall)
+                self.overall.append(DEFAULT_RATING)
+                self.surface.extend([DEFAULT_RATING] * SLOTS_PER_PLAYER)
+                self.rows.append(0)
+        return [positions[player_id] for player_id in player_ids.tolist()]
+
+    def replay(self, matches):
+        """
+        Fold matches into the ratings, oldest first, and return EloColumns.
+
+        matches: frame sorted by (match_date, match_id) with match_id,
+                 match_date, player1_id, player2_id, winner_id,
+                 tournament_level, rating_surface (raw matches.surface, which
+                 the JS rates on; defaults to surface) and surface (what
+                 features look ratings up by)
+        """
+        n = len(matches)
+        player1 = matches['player1_id'].to_numpy(dtype=np.int64)
+        player2 = matches['player2_id'].to_numpy(dtype=np.int64)
+        pos1 = self._positions(player1)
+        pos2 = self._positions(player2)
+        won1 = (matches['winner_id'].to_numpy(dtype=np.int64) == player1).tolist()
+        weights = [TOURNAMENT_WEIGHTS.get(level, DEFAULT_WEIGHT) for level in matches['tournament_level'].tolist()]
+        raw_surfaces = matches['rating_surface' if 'rating_surface' in matches else 'surface']
+        rated_surfaces = [normalize_surface(s) for s in raw_surfaces.tolist()]
+        rated = [SURFACE_SLOTS[s] for s in rated_surfaces]
+        looked_up = [SURFACE_SLOTS.get(s, UNRATED_SLOT) for s in matches['surface'].tolist()]
+        days = to_day_numbers(matches['match_date'])
+        day_starts = np.flatnonzero(np.diff(days, prepend=days[:1] - 1)).tolist() + [n]
+
+        overall, surface, rows = self.overall, self.surface, self.rows
+        pre, post = [], []
+        for start, end in zip(day_starts[:-1], day_starts[1:]):
+            # Every match of the day sees the ratings from before the day
+            for i in range(start, end):
+                a, b, s = pos1[i], pos2[i], looked_up[i]
+                pre.append((overall[a], overall[b],
+                            surface[a * SLOTS_PER_PLAYER + s], surface[b * SLOTS_PER_PLAYER + s]))
+
+            for i in range(start, end):
+                a, b, weight = pos1[i], pos2[i], weights[i]
+                actual1 = 1 if won1[i] else 0
+
+                rating1, rating2 = overall[a], overall[b]
+                expected1 = expected_score(rating1, rating2)
+                k1, k2 = k_factor(rows[a]), k_factor(rows[b])
+                overall1 = overall[a] = round(rating1 + (k1 * weight) * (actual1 - expected1), RATING_DECIMALS)
+                overall2 = overall[b] = round(rating2 + (k2 * weight) * ((1 - actual1) - (1 - expected1)),
+                                              RATING_DECIMALS)
+
+                sa, sb = a * SLOTS_PER_PLAYER + rated[i], b * SLOTS_PER_PLAYER + rated[i]
+                rating1, rating2 = surface[sa], surface[sb]
+                expected1 = expected_score(rating1, rating2)
+                surface1 = surface[sa] = round(rating1 + (K_NEW * weight) * (actual1 - expected1), RATING_DECIMALS)
+                surface2 = surface[sb] = round(rating2 + (K_NEW * weight) * ((1 - actual1) - (1 - expected1)),
+                                               RATING_DECIMALS)
+
+                rows[a] += 2
+                rows[b] += 2
+                post.append((overall1, overall2, surface1, surface2))
+
+        return EloColumns(
+            matches['match_id'].to_numpy(),
+            matches['match_date'].to_numpy(),
+            np.column_stack([player1, player2]),
+            np.asarray(rated_surfaces, dtype=object),
+            np.array(pre, dtype=np.float64).reshape(n, 4),
+            np.array(post, dtype=np.float64).reshape(n, 4)
+        )
+
+
+def elo_ratings(matches):
+    """The ratings table rows calculateELORatings.js would write for these matches"""
+    return EloState().replay(matches).rating_rows()
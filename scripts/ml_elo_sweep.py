@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+ELO Parameter Sweep
+Scores many ELO configurations (K-factors and tournament-weight strength) in
+one chronological pass: every rating is a vector with one entry per
+configuration, so each match updates all configurations at once. Reports
+log-loss, Brier score and accuracy of the pre-match win probability of the
+overall and surface ratings for each configuration.
+
+Usage:
+    python3 scripts/ml_elo_sweep.py --k-new 32 40 48 --k-rising 30 35 --k-established 24 32 \\
+        --weight-scale 0 0.5 1 1.5
+"""
+
+import argparse
+import itertools
+import sys
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from ml_elo import (DEFAULT_WEIGHT, ESTABLISHED_ROWS, K_ESTABLISHED, K_NEW, K_RISING, RATING_DECIMALS,
+                    RISING_ROWS, SURFACE_SLOTS, TOURNAMENT_WEIGHTS, expected_score, normalize_surface)
+from ml_replay import DEFAULT_RATING, to_day_numbers
+from ml_trueskill import match_waves
+
+OUTPUT_FILE = 'elo_sweep.csv'
+EPSILON = 1e-15
+
+
+def print_progress(message, emoji="📊"):
+    """Print progress with timestamp"""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    print(f"[{timestamp}] {emoji} {message}")
+    sys.stdout.flush()
+
+
+def make_grid(k_new, k_rising, k_established, weight_scales, surface_k):
+    """Every combination of the parameter lists, one configuration per row.
+
+    weight_scale stretches the tournament weights around 1.0 (0 ignores the
+    level, 1 is calculateELORatings.js, 2 doubles every deviation from 1.0).
+    surface_k of None keeps the JS behaviour (surface ratings use k_new).
+    """
+    rows = itertools.product(k_new, k_rising, k_established, weight_scales, surface_k or [None])
+    grid = pd.DataFrame(rows, columns=['k_new', 'k_rising', 'k_established', 'weight_scale', 'surface_k'])
+    grid['surface_k'] = grid['surface_k'].fillna(grid['k_new']).astype(float)
+    return grid
+
+
+def sweep(history, grid, eval_from=None):
+    """
+    Replay ELO over history (sorted by date) for every configuration of grid.
+
+    history: frame with match_date, player1_id, player2_id, winner_id,
+             tournament_level and rating_surface (raw surface; defaults to surface)
+    eval_from: only score matches on or after this date (earlier ones only warm up)
+
+    Matches run in waves that share no player (see ml_trueskill.match_waves),
+    so each wave updates a (matches, configurations) block at once and every
+    player still sees their matches in order.
+
+    Returns grid with matches, log_loss, brier and accuracy columns for the
+    overall and surface ratings.
+    """
+    n = len(history)
+    num_configs = len(grid)
+    player1 = history['player1_id'].to_numpy(dtype=np.int64)
+    player2 = history['player2_id'].to_numpy(dtype=np.int64)
+    codes, players = pd.factorize(np.concatenate([player1, player2]))
+    pos1, pos2 = codes[:n], codes[n:]
+    actual1 = (history['winner_id'].to_numpy(dtype=np.int64) == player1).astype(np.float64)[:, None]
+    raw_surfaces = history['rating_surface' if 'rating_surface' in history else 'surface'].tolist()
+    rated = np.array([SURFACE_SLOTS[normalize_surface(s)] for s in raw_surfaces], dtype=np.int64)
+    surface1, surface2 = pos1 * len(SURFACE_SLOTS) + rated, pos2 * len(SURFACE_SLOTS) + rated
+    days = to_day_numbers(history['match_date'])
+    scored = np.arange(n) >= (0 if eval_from is None else np.searchsorted(days, date.toordinal(eval_from)))
+
+    # Tournament weight of every match under every configuration
+    levels, level_codes = np.unique(history['tournament_level'].fillna('').to_numpy(dtype=str), return_inverse=True)
+    base = np.array([TOURNAMENT_WEIGHTS.get(level, DEFAULT_WEIGHT) for level in levels])
+    scale = grid['weight_scale'].to_numpy(dtype=np.float64)
+    level_weights = 1 + (base[:, None] - 1) * scale[None, :]   # (levels, configs)
+
+    # K class of each player before each match: 2 'elo' rows per earlier match
+    appearances = np.column_stack([pos1, pos2]).ravel()
+    prior_rows = 2 * pd.Series(appearances).groupby(appearances).cumcount().to_numpy().reshape(n, 2)
+    k_class = (prior_rows >= RISING_ROWS).astype(np.int64) + (prior_rows >= ESTABLISHED_ROWS)
+    class1, class2 = k_class[:, 0], k_class[:, 1]
+    k_table = grid[['k_new', 'k_rising', 'k_established']].to_numpy(dtype=np.float64).T   # (3, configs)
+    surface_k = grid['surface_k'].to_numpy(dtype=np.float64)
+
+    overall = np.full((len(players), num_configs), DEFAULT_RATING)
+    surface = np.full((len(players) * len(SURFACE_SLOTS), num_configs), DEFAULT_RATING)
+    totals = {name: np.zeros(num_configs) for name in
+              ('overall_log_loss', 'overall_brier', 'overall_correct',
+               'surface_log_loss', 'surface_brier', 'surface_correct')}
+
+    def score(prefix, expected1, won, keep):
+        if keep.any():
+            p = np.where(won[keep], expected1[keep], 1 - expected1[keep])
+            totals[f'{prefix}_log_loss'] -= np.log(np.maximum(p, EPSILON)).sum(axis=0)
+            totals[f'{prefix}_brier'] += ((1 - p) ** 2).sum(axis=0)
+            totals[f'{prefix}_correct'] += (p > 0.5).sum(axis=0)
+
+    waves = match_waves(pos1.tolist(), pos2.tolist(), len(players))
+    order = np.argsort(waves, kind='stable')
+    bounds = np.flatnonzero(np.diff(waves[order])) + 1
+    for rows in tqdm(np.split(order, bounds) if n else [], desc="🧮 Sweeping", unit=" waves", mininterval=1.0):
+        won, keep = actual1[rows], scored[rows]
+        weight = level_weights[level_codes[rows]]
+        a, b = pos1[rows], pos2[rows]
+
+        rating1, rating2 = overall[a], overall[b]
+        expected1 = expected_score(rating1, rating2)
+        score('overall', expected1, won, keep)
+        overall[a] = np.round(rating1 + k_table[class1[rows]] * weight * (won - expected1), RATING_DECIMALS)
+        overall[b] = np.round(rating2 + k_table[class2[rows]] * weight * (expected1 - won), RATING_DECIMALS)
+
+        sa, sb = surface1[rows], surface2[rows]
+        rating1, rating2 = surface[sa], surface[sb]
+        expected1 = expected_score(rating1, rating2)
+        score('surface', expected1, won, keep)
+        surface[sa] = np.round(rating1 + surface_k * weight * (won - expected1), RATING_DECIMALS)
+        surface[sb] = np.round(rating2 + surface_k * weight * (expected1 - won), RATING_DECIMALS)
+
+    num_scored = int(scored.sum())
+    result = grid.copy()
+    result['matches'] = num_scored
+    for prefix in ('overall', 'surface'):
+        result[f'{prefix}_log_loss'] = totals[f'{prefix}_log_loss'] / max(num_scored, 1)
+        result[f'{prefix}_brier'] = totals[f'{prefix}_brier'] / max(num_scored, 1)
+        result[f'{prefix}_accuracy'] = totals[f'{prefix}_correct'] / max(num_scored, 1)
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Score ELO parameter configurations in one pass')
+    parser.add_argument('--k-new', type=float, nargs='+', default=[K_NEW],
+                        help=f'K for players with fewer than {RISING_ROWS} rating rows (default: {K_NEW})')
+    parser.add_argument('--k-rising', type=float, nargs='+', default=[K_RISING],
+                        help=f'K below {ESTABLISHED_ROWS} rating rows (default: {K_RISING})')
+    parser.add_argument('--k-established', type=float, nargs='+', default=[K_ESTABLISHED],
+                        help=f'K for established players (default: {K_ESTABLISHED})')
+    parser.add_argument('--weight-scale', type=float, nargs='+', default=[1.0],
+                        help='Tournament weight strength: 0 = no weights, 1 = current weights (default: 1)')
+    parser.add_argument('--surface-k', type=float, nargs='+', default=None,
+                        help='K for surface ratings (default: same as --k-new, as in calculateELORatings.js)')
+    parser.add_argument('--eval-start-year', type=int, default=2000,
+                        help='Score matches from this season on; earlier ones only warm up (default: 2000)')
+    parser.add_argument('--source', choices=['db', 'csv'], default='db',
+                        help='db: matches from Postgres (default); csv: the files in data-source/')
+    parser.add_argument('--output', default=OUTPUT_FILE,
+                        help=f'CSV file for the results (default: {OUTPUT_FILE})')
+    parser.add_argument('--top', type=int, default=10, help='Configurations to print (default: 10)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    grid = make_grid(args.k_new, args.k_rising, args.k_established, args.weight_scale, args.surface_k)
+
+    print_progress("Loading match history...", "🔍")
+    if args.source == 'csv':
+        from ml_csv_source import CsvSource
+        history = CsvSource().history()
+    else:
+        from ml_extract_features import get_db_connection
+        from ml_feature_registry import HISTORY_QUERY
+        conn = get_db_connection()
+        history = pd.read_sql_query(HISTORY_QUERY, conn, params={'player_ids': None, 'before': date.max})
+        conn.close()
+    print_progress(f"✅ Loaded {len(history):,} matches", "✅")
+
+    print_progress(f"Sweeping {len(grid):,} configurations in one pass...", "🧮")
+    start_time = time.time()
+    result = sweep(history, grid, eval_from=date(args.eval_start_year, 1, 1))
+    print_progress(f"✅ Done in {time.time() - start_time:.1f}s", "✅")
+
+    result = result.sort_values('overall_log_loss', kind='stable').reset_index(drop=True)
+    result.to_csv(args.output, index=False)
+    print_progress(f"✅ Saved {len(result):,} configurations to {args.output}", "✅")
+    print()
+
+    print_progress(f"Top {min(args.top, len(result))} by overall log-loss "
+                   f"({int(result['matches'].iloc[0]):,} matches scored):", "🏆")
+    columns = ['k_new', 'k_rising', 'k_established', 'weight_scale', 'surface_k',
+               'overall_log_loss', 'overall_brier', 'overall_accuracy', 'surface_log_loss', 'surface_brier']
+    for line in result[columns].head(args.top).to_string(index=False, float_format='{:.4f}'.format).splitlines():
+        print_progress(line, "  ")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,19 +7,51 @@ Extracts features for training XGBoost model with LIVE PROGRESS UPDATES
 import psycopg2
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import date, datetime
 from tqdm import tqdm
 import time
 import sys
+import argparse
+import pickle
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from ml_replay import (FORM_LONG, FORM_SHORT, STAT_KEYS, WINDOW_12MO_DAYS, WINDOW_CAREER_DAYS,
+                       ReplayState, replay, to_day_numbers)
+from ml_rating_index import RATINGS_QUERY
+from ml_features_sql import stream_features
+from ml_feature_store import STORE_DIR, append_store, write_store
+from ml_feature_registry import EXTRACTED_FEATURES, OPTIONAL_FEATURES, FeatureExecutor, Requests, feature_columns
+from ml_match_table import MatchTable, assemble_features, feature_frame
+from ml_csv_source import DATA_DIR, CsvSource
+from ml_elo import ELO_INPUTS, EloState
+import ml_profiling
+
+# Set by --source csv: matches, history and players come from the
+# data-source/ files instead of Postgres
+csv_source = None
+
+# Set by --ratings inline: ELO features come from replaying the history
+# (ml_elo.py) instead of the ratings table
+inline_elo = False
+
+# Set by --extra-features: optional registry features added after the model's
+extra_features = []
+
+EMPTY_RATINGS = pd.DataFrame({'rated_on': pd.Series(dtype='datetime64[ns]'), 'player_id': pd.Series(dtype=np.int64),
+                              'surface': pd.Series(dtype=object), 'rating_value': pd.Series(dtype=np.float64)})
 
 # Database connection
 def get_db_connection():
-    return psycopg2.connect(
+    conn = psycopg2.connect(
         dbname="tennis_dash",
         user="razaool",
         host="localhost",
         port=5432
     )
+    # Counts SQL round trips when --profile is on
+    return ml_profiling.active().connection(conn)
 
 def print_progress(message, emoji="📊"):
     """Print progress with timestamp"""
@@ -27,12 +59,8 @@ def print_progress(message, emoji="📊"):
     print(f"[{timestamp}] {emoji} {message}")
     sys.stdout.flush()
 
-def fetch_matches(start_year=2000):
-    """Fetch all matches from start_year onwards"""
-    print_progress(f"Loading matches from {start_year} onwards...", "🔍")
-    
-    conn = get_db_connection()
-    query = f"""
+# Target matches for feature extraction, oldest first
+MATCHES_QUERY = """
     SELECT 
         m.id as match_id,
         m.match_date,
@@ -56,17 +84,32 @@ def fetch_matches(start_year=2000):
     LEFT JOIN players p1 ON m.player1_id = p1.id
     LEFT JOIN players p2 ON m.player2_id = p2.id
     WHERE m.winner_id IS NOT NULL
-        AND m.match_date >= '{start_year}-01-01'
+        AND m.match_date >= %(start_date)s
+        AND m.match_date > %(after_date)s
         AND COALESCE(t.surface, 'Hard') IN ('Hard', 'Clay', 'Grass')
         AND p1.name IS NOT NULL 
         AND p2.name IS NOT NULL
         AND p1.name != ''
         AND p2.name != ''
-    ORDER BY m.match_date ASC
-    """
+    ORDER BY m.match_date ASC, m.id ASC
+"""
+
+MATCH_BATCH_SIZE = 20000
+
+def matches_params(start_year, after_date=None):
+    return {'start_date': date(start_year, 1, 1), 'after_date': after_date or date.min}
+
+def fetch_matches(start_year=2000, after_date=None):
+    """Fetch all matches from start_year onwards (only those after after_date if given)"""
+    print_progress(f"Loading matches from {start_year} onwards...", "🔍")
     
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    if csv_source is not None:
+        df = csv_source.matches(start_year, after_date)
+    else:
+        conn = get_db_connection()
+        with ml_profiling.active().section('load'):
+            df = pd.read_sql_query(MATCHES_QUERY, conn, params=matches_params(start_year, after_date))
+        conn.close()
     
     print_progress(f"✅ Loaded {len(df):,} matches", "✅")
     print_progress(f"   Date range: {df['match_date'].min()} to {df['match_date'].max()}", "📅")
@@ -74,278 +117,734 @@ def fetch_matches(start_year=2000):
     
     return df
 
-def get_surface_elo(player_id, surface, before_date, conn):
-    """Get player's ELO rating on specific surface before a date"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT rating_value
-        FROM ratings
-        WHERE player_id = %s
-            AND rating_type = 'elo'
-            AND surface = %s
-            AND calculated_at < %s
-        ORDER BY calculated_at DESC
-        LIMIT 1
-    """, (player_id, surface, before_date))
+def stream_matches(start_year=2000, after_date=None, batch_size=MATCH_BATCH_SIZE):
+    """Yield the target matches as MatchTable batches from a server-side cursor.
+
+    Only one batch of raw rows is held in client memory at a time.
+    """
+    if csv_source is not None:
+        df = csv_source.matches(start_year, after_date)
+        for start in range(0, len(df), batch_size):
+            yield MatchTable.from_frame(df.iloc[start:start + batch_size])
+        return
+    conn = get_db_connection()
+    try:
+        # Cursors are planned for fast first rows by default; this one is read to the end
+        with conn.cursor() as settings:
+            settings.execute("SET LOCAL cursor_tuple_fraction = 1.0")
+        cursor = conn.cursor(name='ml_extract_matches')
+        cursor.itersize = batch_size
+        cursor.execute(MATCHES_QUERY, matches_params(start_year, after_date))
+        columns = None
+        while True:
+            with ml_profiling.active().section('load'):
+                rows = cursor.fetchmany(batch_size)
+                if columns is None:
+                    columns = [col[0] for col in cursor.description]
+                if not rows:
+                    break
+                batch = MatchTable.from_frame(pd.DataFrame(rows, columns=columns))
+            yield batch
+        cursor.close()
+    finally:
+        conn.close()
+
+def prefetch(iterable, depth=2):
+    """Run a producer in a background thread, up to `depth` items ahead of the consumer.
+
+    Lets the next batch transfer from the database while the current one is processed.
+    """
+    items = queue.Queue(maxsize=depth)
+    done = object()
     
-    result = cursor.fetchone()
-    cursor.close()
-    return float(result[0]) if result else 1500.0
+    def produce():
+        try:
+            for item in iterable:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+        items.put(done)
+    
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = items.get()
+        if item is done:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
 
-def get_overall_elo(player_id, before_date, conn):
-    """Get player's overall ELO rating before a date"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT rating_value
-        FROM ratings
-        WHERE player_id = %s
-            AND rating_type = 'elo'
-            AND surface IS NULL
-            AND calculated_at < %s
-        ORDER BY calculated_at DESC
-        LIMIT 1
-    """, (player_id, before_date))
+def fetch_match_table(start_year=2000, after_date=None):
+    """Stream the target matches into one compact MatchTable"""
+    print_progress(f"Streaming matches from {start_year} onwards...", "🔍")
+    table = MatchTable.concat(prefetch(stream_matches(start_year, after_date)))
     
-    result = cursor.fetchone()
-    cursor.close()
-    return float(result[0]) if result else 1500.0
+    dates = table.dates()
+    print_progress(f"✅ Loaded {len(table):,} matches", "✅")
+    if len(table):
+        print_progress(f"   Date range: {dates.min()} to {dates.max()}", "📅")
+    surfaces, counts = np.unique(table.surface_names().astype(str), return_counts=True)
+    print_progress(f"   Surfaces: {dict(zip(surfaces.tolist(), counts.tolist()))}", "🎾")
+    
+    return table
 
-def get_surface_win_rate(player_id, surface, before_date, months, conn):
-    """Get player's win rate on surface in last N months"""
-    cursor = conn.cursor()
-    start_date = before_date - timedelta(days=months*30)
+def fetch_history(after_date=None):
+    """Fetch every decided match, oldest first, as the replay timeline.
+
+    Unlike fetch_matches() this is not limited by year, surface or player
+    names, because the rolling win rates, form and H2H look further back.
+    """
+    print_progress("Loading match history...", "🔍")
     
-    cursor.execute("""
-        SELECT 
-            COUNT(*) as total,
-            COUNT(*) FILTER (WHERE winner_id = %s) as wins
-        FROM matches m
-        LEFT JOIN tournaments t ON m.tournament_id = t.id
-        WHERE (m.player1_id = %s OR m.player2_id = %s)
-            AND COALESCE(t.surface, 'Hard') = %s
-            AND m.match_date >= %s
-            AND m.match_date < %s
-            AND m.winner_id IS NOT NULL
-    """, (player_id, player_id, player_id, surface, start_date, before_date))
+    if csv_source is not None:
+        df = csv_source.history(after_date)
+        print_progress(f"✅ Loaded {len(df):,} historical matches", "✅")
+        return df
     
-    result = cursor.fetchone()
-    cursor.close()
+    conn = get_db_connection()
+    query = """
+    SELECT 
+        m.id as match_id,
+        m.match_date,
+        m.player1_id,
+        m.player2_id,
+        m.winner_id,
+        COALESCE(t.surface, 'Hard') as surface,
+        m.surface as rating_surface,
+        t.level as tournament_level
+    FROM matches m
+    LEFT JOIN tournaments t ON m.tournament_id = t.id
+    WHERE m.winner_id IS NOT NULL
+        AND m.match_date > %s
+    ORDER BY m.match_date ASC, m.id ASC
+    """
     
-    if result and result[0] > 0:
-        return result[1] / result[0]
-    return 0.5  # Default if no matches
+    with ml_profiling.active().section('load'):
+        df = pd.read_sql_query(query, conn, params=(after_date or date.min,))
+    conn.close()
+    
+    print_progress(f"✅ Loaded {len(df):,} historical matches", "✅")
+    return df
 
-def get_recent_form(player_id, before_date, num_matches, conn):
-    """Get player's recent form (win rate in last N matches)"""
-    cursor = conn.cursor()
+def fetch_elo_ratings(since_date=None):
+    """Fetch all ELO rating rows in one read, dated by the match that produced them"""
+    print_progress("Loading ELO rating history...", "🔍")
     
-    cursor.execute("""
-        SELECT winner_id = %s as won
-        FROM matches m
-        WHERE (m.player1_id = %s OR m.player2_id = %s)
-            AND m.match_date < %s
-            AND m.winner_id IS NOT NULL
-        ORDER BY m.match_date DESC
-        LIMIT %s
-    """, (player_id, player_id, player_id, before_date, num_matches))
-    
-    results = cursor.fetchall()
-    cursor.close()
+    conn = get_db_connection()
+    with ml_profiling.active().section('load'):
+        df = pd.read_sql_query(RATINGS_QUERY, conn, params=('elo', since_date or date.min))
+    conn.close()
     
-    if len(results) > 0:
-        wins = sum(1 for r in results if r[0])
-        return wins / len(results)
-    return 0.5  # Default if no matches
+    print_progress(f"✅ Loaded {len(df):,} rating rows", "✅")
+    return df
 
-def get_h2h(player1_id, player2_id, surface, before_date, conn):
-    """Get head-to-head record on specific surface"""
-    cursor = conn.cursor()
+def profiled_stat_row(state, player_id, surface, day):
+    """ReplayState.stat_row() with each feature family timed separately (--profile)"""
+    profiler = ml_profiling.active()
+    with profiler.section('surface_elo'):
+        surface_elo = state.rating(player_id, surface)
+    with profiler.section('overall_elo'):
+        overall_elo = state.rating(player_id, None)
+    with profiler.section('win_rates', calls=2):
+        surface_wr_12mo = state.surface_win_rate(player_id, surface, day, WINDOW_12MO_DAYS)
+        surface_wr_career = state.surface_win_rate(player_id, surface, day, WINDOW_CAREER_DAYS)
+    with profiler.section('form', calls=2):
+        form_20 = state.recent_form(player_id, FORM_LONG)
+        form_10 = state.recent_form(player_id, FORM_SHORT)
+    return surface_elo, overall_elo, surface_wr_12mo, surface_wr_career, form_20, form_10
+
+# Columns swapped / negated when the player order of a feature row is flipped
+PAIRED_COLUMNS = [
+    ('player1_name', 'player2_name'),
+    ('p1_surface_wr_12mo', 'p2_surface_wr_12mo'),
+    ('p1_surface_wr_career', 'p2_surface_wr_career'),
+    ('p1_form_20', 'p2_form_20'),
+    ('p1_surface_form_10', 'p2_surface_form_10'),
+]
+DIFF_COLUMNS = [
+    'surface_elo_diff', 'overall_elo_diff', 'surface_wr_diff_12mo', 'surface_wr_diff_career',
+    'form_diff_20', 'surface_form_diff_10', 'age_diff', 'height_diff', 'h2h_surface_advantage',
+]
+
+def flip_players(features_df, flips):
+    """Swap player order on the rows where flips is True (same swap as assemble_features)"""
+    df = features_df.copy()
+    for p1_col, p2_col in PAIRED_COLUMNS:
+        p1_values = df[p1_col].to_numpy()
+        p2_values = df[p2_col].to_numpy()
+        df[p1_col] = np.where(flips, p2_values, p1_values)
+        df[p2_col] = np.where(flips, p1_values, p2_values)
+    for col in DIFF_COLUMNS:
+        df[col] = np.where(flips, -df[col].to_numpy(), df[col].to_numpy())
+    df['target'] = np.where(flips, 0, 1)
+    return df
+
+OUTPUT_FILE = 'ml_features.csv'
+OUTPUT_PATHS = {'store': STORE_DIR, 'csv': OUTPUT_FILE}
+CHECKPOINT_FILE = 'ml_extract_state.pkl'
+
+def make_flips(num_matches, seed=None):
+    """Decide up front which rows get their player order swapped.
+
+    In the database player1 is always the winner, so the order is randomized
+    to create a balanced dataset. Drawing every flip before any work starts
+    keeps serial and parallel runs identical for a given seed.
+    """
+    return np.random.default_rng(seed).random(num_matches) > 0.5
+
+def feature_executor(inline=None):
+    """The registry plan for the extracted features; inline ELO inputs are provided by the replay"""
+    inline = inline_elo if inline is None else inline
+    return FeatureExecutor(EXTRACTED_FEATURES + extra_features, provided=ELO_INPUTS if inline else ())
+
+def replay_elo(history, state=None):
+    """Pre-match ELO columns for every history match (see ml_elo.py)"""
+    print_progress("Replaying ELO ratings...", "🧮")
+    with ml_profiling.active().section('elo_replay', calls=len(history)):
+        columns = (state if state is not None else EloState()).replay(history)
+    print_progress(f"✅ Rated {len(columns):,} matches", "✅")
+    return columns
+
+def load_feature_sources(executor):
+    """Build the indexes the feature registry reads (ELO ratings, win rates,
+    form, H2H and player attributes) in one read per source table.
+
+    Returns the sources and, with inline ELO, the replayed ELO columns.
+    """
+    print_progress("Loading ratings, match history and players for the feature registry...", "🔍")
+    if csv_source is not None:
+        frames = {'history': csv_source.history(), 'players': csv_source.player_attributes()}
+    else:
+        conn = get_db_connection()
+        frames = executor.read_frames(conn)
+        conn.close()
+    sources = executor.sources_from_frames(**frames)
+    print_progress(f"✅ Indexed {len(frames['history']):,} matches", "✅")
+    elo = replay_elo(frames['history']) if executor.provided else None
+    return sources, elo
+
+def registry_columns(table, flips, executor, sources, elo=None):
+    """Feature columns for every match of the table from the feature registry,
+    with the player order of flipped rows already swapped.
+
+    elo: inline ELO values for the table's matches (EloColumns.for_matches())
+    """
+    r = table.records
+    flips = np.asarray(flips, dtype=bool)
+    requests = Requests(
+        np.where(flips, r['player2_id'], r['player1_id']),
+        np.where(flips, r['player1_id'], r['player2_id']),
+        table.surface_names(),
+        table.dates()
+    )
+    provided = {}
+    for name, pairs in (elo or {}).items():
+        provided[name] = (np.where(flips, pairs[:, 1], pairs[:, 0]), np.where(flips, pairs[:, 0], pairs[:, 1]))
+    values = executor.evaluate(sources, requests, provided)
+    with ml_profiling.active().section('assembly', calls=0):
+        return feature_columns(executor.feature_names, values)
+
+def compute_features(table, flips=None, sources=None, show_progress=True, elo=None):
+    """Compute features for all matches with batched lookups (see ml_feature_registry.py).
+
+    sources / elo: from load_feature_sources() (loaded here if not given)
+    """
+    if show_progress:
+        print_progress("Starting feature computation...", "🔧")
+        print_progress(f"Processing {len(table):,} matches", "📈")
     
-    cursor.execute("""
-        SELECT 
-            COUNT(*) FILTER (WHERE winner_id = %s) as p1_wins,
-            COUNT(*) FILTER (WHERE winner_id = %s) as p2_wins
-        FROM matches m
-        LEFT JOIN tournaments t ON m.tournament_id = t.id
-        WHERE ((m.player1_id = %s AND m.player2_id = %s) 
-            OR (m.player1_id = %s AND m.player2_id = %s))
-            AND COALESCE(t.surface, 'Hard') = %s
-            AND m.match_date < %s
-            AND m.winner_id IS NOT NULL
-    """, (player1_id, player2_id, player1_id, player2_id, player2_id, player1_id, surface, before_date))
+    if flips is None:
+        flips = make_flips(len(table))
+    executor = feature_executor() if sources is None else feature_executor(elo is not None)
+    if sources is None:
+        sources, elo = load_feature_sources(executor)
     
-    result = cursor.fetchone()
-    cursor.close()
+    start_time = time.time()
+    elo_values = elo.for_matches(table.records['match_id']) if elo is not None else None
+    columns = registry_columns(table, flips, executor, sources, elo_values)
+    
+    if show_progress:
+        print_progress("✅ Feature computation complete!", "✅")
+        print_progress(f"   Total time: {(time.time() - start_time)/60:.1f} minutes", "⏱️")
     
-    if result:
-        p1_wins = result[0] or 0
-        p2_wins = result[1] or 0
-        return p1_wins - p2_wins
-    return 0
+    return feature_frame(table, columns, flips)
+
+def compute_features_stream(batches, seed=None):
+    """Query mode over streamed MatchTable batches (see stream_matches()).
 
-def compute_features(matches_df):
-    """Compute features for all matches with PROGRESS UPDATES"""
-    print_progress("Starting feature computation...", "🔧")
-    print_progress(f"Processing {len(matches_df):,} matches", "📈")
+    Each batch is computed while the next one is still being transferred.
+    Flips come from one generator, so the output matches compute_features()
+    with make_flips(n, seed) on the whole table.
+    """
+    print_progress("Starting feature computation (streaming)...", "🔧")
+    executor = feature_executor()
+    sources, elo = load_feature_sources(executor)
+    rng = np.random.default_rng(seed)
+    parts = []
+    start_time = time.time()
     
-    conn = get_db_connection()
-    features_list = []
+    with tqdm(desc="🔢 Computing features", unit=" matches") as pbar:
+        for table in prefetch(batches):
+            flips = rng.random(len(table)) > 0.5
+            elo_values = elo.for_matches(table.records['match_id']) if elo is not None else None
+            columns = registry_columns(table, flips, executor, sources, elo_values)
+            parts.append(feature_frame(table, columns, flips))
+            pbar.update(len(table))
     
-    total_matches = len(matches_df)
-    start_time = time.time()
+    print_progress("✅ Feature computation complete!", "✅")
+    print_progress(f"   Total time: {(time.time() - start_time)/60:.1f} minutes", "⏱️")
     
-    # Progress bar with detailed stats
-    with tqdm(total=total_matches, desc="🔢 Computing features", 
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+def replay_targets(history, ratings, state, table, show_progress=True):
+    """Replay history into state, recording both players' stats for every match in the table.
+
+    Returns p1_stats, p2_stats, h2h_surface (database order) and a mask of
+    the matches that were found in history.
+    """
+    targets = {match_id: pos for pos, match_id in enumerate(table.records['match_id'].tolist())}
+    p1_stats = np.empty((len(table), len(STAT_KEYS)))
+    p2_stats = np.empty((len(table), len(STAT_KEYS)))
+    h2h_surface = np.zeros(len(table), dtype=np.int64)
+    found = np.zeros(len(table), dtype=bool)
+    total_matches = len(history)
+    
+    # With --profile, time spent inside replay() is the state updates
+    profiler = ml_profiling.active()
+    events = profiler.iterate('state_updates', replay(history, ratings, state))
+    if profiler.enabled:
+        stat_row = lambda player_id, surface, day: profiled_stat_row(state, player_id, surface, day)
+    else:
+        stat_row = state.stat_row
+    
+    with tqdm(total=total_matches, desc="🔁 Replaying matches", disable=not show_progress,
               bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]') as pbar:
         
-        for idx, row in matches_df.iterrows():
-            match_date = pd.to_datetime(row['match_date'])
+        for processed, (day, match) in enumerate(events, 1):
+            pos = targets.get(match.match_id)
+            if pos is not None:
+                p1_stats[pos] = stat_row(match.player1_id, match.surface, day)
+                p2_stats[pos] = stat_row(match.player2_id, match.surface, day)
+                with profiler.section('h2h'):
+                    h2h_surface[pos] = state.h2h_advantage(match.player1_id, match.player2_id, match.surface)
+                found[pos] = True
             
+            if processed % 10000 == 0 or processed == total_matches:
+                pbar.update(processed - pbar.n)
+    
+    return p1_stats, p2_stats, h2h_surface, found
+
+def partition_by_date(table, workers):
+    """Split the table into up to `workers` contiguous date ranges of similar size.
+
+    Returns the first day number (date.toordinal()) of each partition; a match
+    day is never split, so each partition can start from a day-boundary state.
+    """
+    days = table.records['day']
+    cuts = [int(days[len(days) * k // workers]) for k in range(workers)] if len(days) else []
+    return sorted(set(cuts))
+
+def snapshot_states(history, ratings, start_days, state=None):
+    """Cheap pre-pass: replay state updates only and pickle the state at each start day.
+
+    Returns the snapshots and the end-of-history state.
+    """
+    snapshots = []
+    state = state if state is not None else ReplayState()
+    for day, _ in replay(history, ratings, state):
+        while len(snapshots) < len(start_days) and day >= start_days[len(snapshots)]:
+            snapshots.append(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    while len(snapshots) < len(start_days):
+        snapshots.append(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+    return snapshots, state
+
+def _replay_partition(task):
+    """Process-pool worker: resume from a warm state and replay one date range"""
+    state_bytes, history, ratings, table = task
+    state = pickle.loads(state_bytes)
+    return replay_targets(history, ratings, state, table, show_progress=False)
+
+def _query_partition(task):
+    """Process-pool worker: registry lookups for one date range"""
+    table, flips, executor, sources, elo_values = task
+    columns = registry_columns(table, flips, executor, sources, elo_values)
+    return [columns[name] for name in executor.feature_names]
+
+def gather_partitions(parts, positions, num_matches):
+    """Scatter per-partition stat arrays back into table order"""
+    gathered = None
+    for part, pos in zip(parts, positions):
+        if gathered is None:
+            gathered = [np.zeros((num_matches,) + array.shape[1:], dtype=array.dtype) for array in part]
+        for full, array in zip(gathered, part):
+            full[pos] = array
+    return gathered
+
+def compute_features_replay(table, flips=None, workers=1, checkpoint=None):
+    """Compute features in one chronological pass over the match history.
+
+    Loads matches and ratings once and keeps per-player state in memory
+    (see ml_replay.py), so no queries are issued per match. With workers > 1
+    the target matches are split into date partitions, each replayed in its
+    own process from a snapshot of the state at the partition start.
+
+    With a checkpoint from a previous run only the history after its
+    high-water mark is replayed, starting from the saved state.
+    Returns the features and a checkpoint for the end of this run.
+    """
+    print_progress("Starting feature computation (replay mode)...", "🔧")
+    print_progress(f"Processing {len(table):,} matches", "📈")
+    
+    if flips is None:
+        flips = make_flips(len(table))
+    
+    if checkpoint is None:
+        history = fetch_history()
+        state = ReplayState()
+    else:
+        history = fetch_history(after_date=checkpoint['last_date'])
+        state = checkpoint['state']
+    
+    elo_state, elo_columns = None, None
+    if inline_elo:
+        # The replay state gets no rating rows; ELO columns are filled in below
+        ratings = EMPTY_RATINGS
+        elo_state = checkpoint['elo'] if checkpoint is not None else EloState()
+        elo_columns = replay_elo(history, elo_state)
+    else:
+        # Ratings on the high-water day were not applied yet (they only count from the next day)
+        ratings = fetch_elo_ratings(since_date=checkpoint['last_date'] if checkpoint is not None else None)
+    start_time = time.time()
+    
+    if workers <= 1 or len(table) == 0:
+        p1_stats, p2_stats, h2h_surface, found = replay_targets(history, ratings, state, table)
+    else:
+        start_days = partition_by_date(table, workers)
+        print_progress(f"Snapshotting player state at {len(start_days)} partition starts...", "📸")
+        initial = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        snapshots, state = snapshot_states(history, ratings, start_days, state)
+        
+        history_days = to_day_numbers(history['match_date'])
+        rating_days = to_day_numbers(ratings['rated_on'])
+        match_days = table.records['day']
+        
+        tasks, positions = [], []
+        for k, start_day in enumerate(start_days):
+            end_day = start_days[k + 1] if k + 1 < len(start_days) else np.iinfo(np.int64).max
+            in_history = (history_days >= start_day) & (history_days < end_day)
+            in_ratings = (rating_days >= start_day) & (rating_days < end_day)
+            in_matches = (match_days >= start_day) & (match_days < end_day)
+            if k == 0:
+                # The first partition also replays everything before the first target
+                in_history |= history_days < start_day
+                in_ratings |= rating_days < start_day
+                in_matches |= match_days < start_day
+            tasks.append((
+                snapshots[k] if k > 0 else initial,
+                history[in_history],
+                ratings[in_ratings],
+                table.take(in_matches)
+            ))
+            positions.append(np.flatnonzero(in_matches))
+        
+        print_progress(f"Replaying {len(tasks)} partitions on {workers} workers...", "⚙️")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(tqdm(pool.map(_replay_partition, tasks), total=len(tasks), desc="🧩 Partitions"))
+        p1_stats, p2_stats, h2h_surface, found = gather_partitions(parts, positions, len(table))
+    
+    if elo_columns is not None:
+        elo = elo_columns.for_matches(table.records['match_id'][found])
+        for name in ELO_INPUTS:
+            p1_stats[found, STAT_KEYS.index(name)] = elo[name][:, 0]
+            p2_stats[found, STAT_KEYS.index(name)] = elo[name][:, 1]
+    
+    extra = None
+    if extra_features:
+        # Replayed over the whole history, also when resuming from a checkpoint
+        executor = FeatureExecutor(extra_features)
+        extra_sources = executor.sources_from_frames(history=history if checkpoint is None else fetch_history())
+        extra = registry_columns(table.take(found), flips[found], executor, extra_sources)
+    
+    features_df = assemble_features(table.take(found), p1_stats[found], p2_stats[found],
+                                    h2h_surface[found], flips[found], extra)
+    
+    print_progress("✅ Feature computation complete!", "✅")
+    print_progress(f"   Total time: {(time.time() - start_time)/60:.1f} minutes", "⏱️")
+    
+    if len(history) > 0:
+        last_date = pd.Timestamp(history['match_date'].iloc[-1]).date()
+        last_match_id = int(history['match_id'].max())
+        if checkpoint is not None:
+            last_match_id = max(last_match_id, checkpoint['last_match_id'])
+    else:
+        last_date, last_match_id = checkpoint['last_date'], checkpoint['last_match_id']
+    
+    new_checkpoint = {'state': state, 'elo': elo_state, 'last_date': last_date, 'last_match_id': last_match_id}
+    return features_df, new_checkpoint
+
+def compute_features_parallel(table, flips=None, workers=2):
+    """Query mode split into date partitions, one process per partition.
+
+    Every lookup is already point-in-time, so partitions need no warm state.
+    """
+    print_progress(f"Starting feature computation on {workers} workers...", "🔧")
+    print_progress(f"Processing {len(table):,} matches", "📈")
+    
+    if flips is None:
+        flips = make_flips(len(table))
+    
+    executor = feature_executor()
+    sources, elo = load_feature_sources(executor)
+    elo_values = elo.for_matches(table.records['match_id']) if elo is not None else None
+    
+    start_time = time.time()
+    start_days = partition_by_date(table, workers)
+    match_days = table.records['day']
+    tasks, positions = [], []
+    for k, start_day in enumerate(start_days):
+        in_partition = match_days >= start_day if k > 0 else np.ones(len(table), dtype=bool)
+        if k + 1 < len(start_days):
+            in_partition &= match_days < start_days[k + 1]
+        partition_elo = {name: pairs[in_partition] for name, pairs in elo_values.items()} if elo_values else None
+        tasks.append((table.take(in_partition), flips[in_partition], executor, sources, partition_elo))
+        positions.append(np.flatnonzero(in_partition))
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(tqdm(pool.map(_query_partition, tasks), total=len(tasks), desc="🧩 Partitions"))
+    columns = dict(zip(executor.feature_names, gather_partitions(parts, positions, len(table))))
+    
+    print_progress("✅ Feature computation complete!", "✅")
+    print_progress(f"   Total time: {(time.time() - start_time)/60:.1f} minutes", "⏱️")
+    
+    return feature_frame(table, columns, flips)
+
+def compute_features_sql(start_year=2000, seed=None):
+    """Compute features inside Postgres (see ml_features_sql.py) and stream them back"""
+    print_progress("Starting feature computation (server-side SQL mode)...", "🔧")
+    
+    rng = np.random.default_rng(seed)
+    conn = get_db_connection()
+    batches = []
+    start_time = time.time()
+    
+    with tqdm(desc="🐘 Streaming features", unit=" matches") as pbar:
+        profiler = ml_profiling.active()
+        for batch in profiler.iterate('sql_stream', stream_features(conn, start_year=start_year)):
             # IMPORTANT: Randomize player order to create balanced dataset
-            # In the database, player1 is always the winner, so we need to flip randomly
-            flip = np.random.rand() > 0.5
-            if flip:
-                # Swap players
-                actual_p1_id = row['player2_id']
-                actual_p2_id = row['player1_id']
-                actual_p1_name = row['player2_name']
-                actual_p2_name = row['player1_name']
-                actual_p1_birth = row['p2_birth_date']
-                actual_p2_birth = row['p1_birth_date']
-                actual_p1_height = row['p2_height']
-                actual_p2_height = row['p1_height']
-                actual_p1_hand = row['p2_hand']
-                actual_p2_hand = row['p1_hand']
-                # Target: 1 if actual_p1 won (but actual_p1 is original player2, who lost)
-                target = 0
-            else:
-                # Keep original order
-                actual_p1_id = row['player1_id']
-                actual_p2_id = row['player2_id']
-                actual_p1_name = row['player1_name']
-                actual_p2_name = row['player2_name']
-                actual_p1_birth = row['p1_birth_date']
-                actual_p2_birth = row['p2_birth_date']
-                actual_p1_height = row['p1_height']
-                actual_p2_height = row['p2_height']
-                actual_p1_hand = row['p1_hand']
-                actual_p2_hand = row['p2_hand']
-                # Target: 1 if actual_p1 won (actual_p1 is original player1, who won)
-                target = 1
-            
-            # Get ELO ratings using actual player IDs
-            p1_surface_elo = get_surface_elo(actual_p1_id, row['surface'], match_date, conn)
-            p2_surface_elo = get_surface_elo(actual_p2_id, row['surface'], match_date, conn)
-            p1_overall_elo = get_overall_elo(actual_p1_id, match_date, conn)
-            p2_overall_elo = get_overall_elo(actual_p2_id, match_date, conn)
-            
-            # Get win rates
-            p1_surface_wr_12mo = get_surface_win_rate(actual_p1_id, row['surface'], match_date, 12, conn)
-            p2_surface_wr_12mo = get_surface_win_rate(actual_p2_id, row['surface'], match_date, 12, conn)
-            p1_surface_wr_career = get_surface_win_rate(actual_p1_id, row['surface'], match_date, 120, conn)
-            p2_surface_wr_career = get_surface_win_rate(actual_p2_id, row['surface'], match_date, 120, conn)
-            
-            # Get recent form
-            p1_form_20 = get_recent_form(actual_p1_id, match_date, 20, conn)
-            p2_form_20 = get_recent_form(actual_p2_id, match_date, 20, conn)
-            p1_surface_form_10 = get_recent_form(actual_p1_id, match_date, 10, conn)
-            p2_surface_form_10 = get_recent_form(actual_p2_id, match_date, 10, conn)
-            
-            # Get H2H
-            h2h_surface = get_h2h(actual_p1_id, actual_p2_id, row['surface'], match_date, conn)
-            
-            # Calculate ages
-            if pd.notna(actual_p1_birth) and pd.notna(actual_p2_birth):
-                p1_age = (match_date - pd.to_datetime(actual_p1_birth)).days / 365.25
-                p2_age = (match_date - pd.to_datetime(actual_p2_birth)).days / 365.25
-                age_diff = p1_age - p2_age
-            else:
-                age_diff = 0
-            
-            # Height difference
-            height_diff = (actual_p1_height or 180) - (actual_p2_height or 180)
-            
-            # Hand matchup (1 if different hands, 0 if same)
-            hand_matchup = 1 if actual_p1_hand != actual_p2_hand else 0
-            
-            features = {
-                'match_id': row['match_id'],
-                'match_date': row['match_date'],
-                'surface': row['surface'],
-                'player1_name': actual_p1_name,
-                'player2_name': actual_p2_name,
-                
-                # Features
-                'surface_elo_diff': p1_surface_elo - p2_surface_elo,
-                'overall_elo_diff': p1_overall_elo - p2_overall_elo,
-                'p1_surface_wr_12mo': p1_surface_wr_12mo,
-                'p2_surface_wr_12mo': p2_surface_wr_12mo,
-                'surface_wr_diff_12mo': p1_surface_wr_12mo - p2_surface_wr_12mo,
-                'p1_surface_wr_career': p1_surface_wr_career,
-                'p2_surface_wr_career': p2_surface_wr_career,
-                'surface_wr_diff_career': p1_surface_wr_career - p2_surface_wr_career,
-                'p1_form_20': p1_form_20,
-                'p2_form_20': p2_form_20,
-                'form_diff_20': p1_form_20 - p2_form_20,
-                'p1_surface_form_10': p1_surface_form_10,
-                'p2_surface_form_10': p2_surface_form_10,
-                'surface_form_diff_10': p1_surface_form_10 - p2_surface_form_10,
-                'age_diff': age_diff,
-                'height_diff': height_diff,
-                'hand_matchup': hand_matchup,
-                'h2h_surface_advantage': h2h_surface,
-                
-                # Target
-                'target': target
-            }
-            
-            features_list.append(features)
-            pbar.update(1)
-            
-            # Print detailed progress every 1000 matches
-            if (idx + 1) % 1000 == 0 or (idx + 1) == total_matches:
-                elapsed = time.time() - start_time
-                rate = (idx + 1) / elapsed
-                remaining = (total_matches - (idx + 1)) / rate if rate > 0 else 0
-                
-                print_progress(
-                    f"Progress: {idx+1:,}/{total_matches:,} ({(idx+1)/total_matches*100:.1f}%) | "
-                    f"{rate:.1f} matches/sec | ETA: {remaining/60:.1f} min",
-                    "⚡"
-                )
+            with profiler.section('assembly', calls=len(batch)):
+                flips = rng.random(len(batch)) > 0.5
+                batches.append(flip_players(batch, flips))
+            pbar.update(len(batch))
     
     conn.close()
     
-    print_progress(f"✅ Feature computation complete!", "✅")
+    print_progress("✅ Feature computation complete!", "✅")
     print_progress(f"   Total time: {(time.time() - start_time)/60:.1f} minutes", "⏱️")
     
-    return pd.DataFrame(features_list)
+    return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+
+def save_checkpoint(checkpoint, path=CHECKPOINT_FILE):
+    """Persist end-of-run player state and high-water mark for --since-last"""
+    with open(path, 'wb') as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    """Load the checkpoint written by the previous replay run, or None"""
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+def count_backfilled_matches(checkpoint):
+    """Count matches imported since the checkpoint but dated on or before its high-water day"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM matches
+        WHERE winner_id IS NOT NULL
+            AND id > %s
+            AND match_date <= %s
+    """, (checkpoint['last_match_id'], checkpoint['last_date']))
+    result = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return result[0]
+
+def save_features(features_df, output_format, append=False):
+    """Write (or append) features as the column store or the legacy CSV"""
+    output = OUTPUT_PATHS[output_format]
+    if append:
+        print_progress(f"Appending features to {output}...", "💾")
+        if output_format == 'store':
+            append_store(features_df)
+        elif not features_df.empty:
+            features_df.to_csv(OUTPUT_FILE, mode='a', header=False, index=False)
+        print_progress(f"✅ Appended {len(features_df):,} feature rows", "✅")
+    else:
+        print_progress(f"Saving features to {output}...", "💾")
+        if output_format == 'store':
+            write_store(features_df)
+        else:
+            features_df.to_csv(OUTPUT_FILE, index=False)
+        print_progress(f"✅ Saved {len(features_df):,} feature rows", "✅")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Extract ML features for match prediction')
+    parser.add_argument('--mode', choices=['replay', 'query', 'sql'], default='replay',
+                        help='replay: one chronological pass with in-memory state (default); '
+                             'query: batched lookups through the feature registry; '
+                             'sql: one set-based statement run inside Postgres')
+    parser.add_argument('--start-year', type=int, default=2000,
+                        help='First season to extract features for (default: 2000)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes for replay/query mode, split by date (default: 1)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed for the player-order flip (same seed = same output)')
+    parser.add_argument('--since-last', action='store_true',
+                        help=f'Replay only matches newer than the last run ({CHECKPOINT_FILE}) '
+                             f'and append their features to the existing output')
+    parser.add_argument('--profile', nargs='?', const=ml_profiling.REPORT_FILE, default=None, metavar='PATH',
+                        help=f'Record time, calls and SQL round trips per feature family and write a '
+                             f'JSON report (default path: {ml_profiling.REPORT_FILE}); runs single-process')
+    parser.add_argument('--source', choices=['db', 'csv'], default='db',
+                        help='db: read matches and ratings from Postgres (default); '
+                             'csv: read the ATP files in --data-dir and compute ELO in-process, no database needed')
+    parser.add_argument('--ratings', choices=['db', 'inline'], default=None,
+                        help='db: ELO features from the ratings table (default with --source db); '
+                             'inline: replay ELO from the match history in-process (always with --source csv)')
+    parser.add_argument('--extra-features', nargs='+', choices=OPTIONAL_FEATURES, default=[], metavar='NAME',
+                        help=f'Optional features to extract after the model features '
+                             f'({", ".join(OPTIONAL_FEATURES)}); train with the same --extra-features')
+    parser.add_argument('--data-dir', default=DATA_DIR,
+                        help=f'Directory with atp_matches_YYYY.csv and atp_players.csv (default: {DATA_DIR})')
+    parser.add_argument('--format', choices=['store', 'csv'], default='store',
+                        help=f'store: columnar feature store in {STORE_DIR}/ (default); '
+                             f'csv: legacy {OUTPUT_FILE}')
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    
     print_progress("=" * 60, "🚀")
     print_progress("ML FEATURE EXTRACTION - MATCH PREDICTION", "🎾")
     print_progress("=" * 60, "🚀")
     print()
     
-    # Step 1: Load matches
-    matches_df = fetch_matches(start_year=2000)
-    print()
+    if args.profile:
+        profiler = ml_profiling.enable()
+        if args.workers > 1:
+            print_progress("--profile measures a single process; ignoring --workers", "ℹ️")
+            args.workers = 1
+    
+    global csv_source, inline_elo, extra_features
+    if args.ratings is None:
+        args.ratings = 'inline' if args.source == 'csv' else 'db'
+    if args.ratings == 'inline' and args.mode == 'sql':
+        print_progress("--mode sql reads the ratings table; use --ratings db", "❌")
+        sys.exit(1)
+    inline_elo = args.ratings == 'inline'
+    if args.extra_features and args.mode == 'sql':
+        print_progress("--extra-features needs --mode replay or query", "❌")
+        sys.exit(1)
+    extra_features = list(args.extra_features)
+    
+    if args.source == 'csv':
+        if args.mode == 'sql' or args.since_last:
+            # Match ids are row numbers in the files, not stable database ids
+            print_progress("--source csv supports --mode replay/query without --since-last", "❌")
+            sys.exit(1)
+        if not inline_elo:
+            print_progress("--source csv has no ratings table; use --ratings inline", "❌")
+            sys.exit(1)
+        print_progress(f"Reading matches and players from {args.data_dir}/...", "📂")
+        with ml_profiling.active().section('load'):
+            csv_source = CsvSource(args.data_dir)
+        print_progress(f"✅ Loaded {len(csv_source.all_matches):,} matches and "
+                       f"{len(csv_source.players):,} players", "✅")
+        print()
     
-    # Step 2: Compute features
-    features_df = compute_features(matches_df)
+    checkpoint = None
+    if args.since_last:
+        if args.mode != 'replay':
+            print_progress("--since-last needs --mode replay", "❌")
+            sys.exit(1)
+        checkpoint = load_checkpoint()
+        if checkpoint is None:
+            print_progress(f"No {CHECKPOINT_FILE} found - run a full extraction first", "❌")
+            sys.exit(1)
+        if checkpoint.get('start_year') != args.start_year:
+            print_progress(f"{CHECKPOINT_FILE} was built with --start-year {checkpoint.get('start_year')}", "❌")
+            sys.exit(1)
+        if checkpoint.get('ratings', 'db') != args.ratings:
+            print_progress(f"{CHECKPOINT_FILE} was built with --ratings {checkpoint.get('ratings', 'db')}", "❌")
+            sys.exit(1)
+        if checkpoint.get('extra_features', []) != extra_features:
+            print_progress(f"{CHECKPOINT_FILE} was built with --extra-features "
+                           f"{' '.join(checkpoint.get('extra_features', [])) or '(none)'}", "❌")
+            sys.exit(1)
+        backfilled = count_backfilled_matches(checkpoint)
+        if backfilled:
+            print_progress(f"{backfilled:,} new matches are dated on or before {checkpoint['last_date']} "
+                           f"- run a full extraction instead", "❌")
+            sys.exit(1)
+        print_progress(f"Resuming after {checkpoint['last_date']} (match id {checkpoint['last_match_id']})", "⏩")
+        print()
+    
+    # Step 1 + 2: Load matches and compute features
+    if args.mode == 'sql':
+        # The database does both steps in one statement
+        features_df = compute_features_sql(start_year=args.start_year, seed=args.seed)
+    else:
+        after_date = checkpoint['last_date'] if checkpoint else None
+        if args.mode == 'query' and args.workers <= 1:
+            # Per-match queries keep up with the transfer, so batches are computed as they arrive
+            batches = stream_matches(start_year=args.start_year, after_date=after_date)
+            features_df = compute_features_stream(batches, seed=args.seed)
+        else:
+            table = fetch_match_table(start_year=args.start_year, after_date=after_date)
+            flips = make_flips(len(table), args.seed)
+            print()
+            
+            if args.mode == 'replay':
+                features_df, new_checkpoint = compute_features_replay(
+                    table, flips, workers=1 if checkpoint else args.workers, checkpoint=checkpoint)
+                new_checkpoint['start_year'] = args.start_year
+                new_checkpoint['ratings'] = args.ratings
+                new_checkpoint['extra_features'] = extra_features
+            else:
+                features_df = compute_features_parallel(table, flips, workers=args.workers)
     print()
     
-    # Step 3: Save to CSV
-    output_file = 'ml_features.csv'
-    print_progress(f"Saving features to {output_file}...", "💾")
-    features_df.to_csv(output_file, index=False)
-    print_progress(f"✅ Saved {len(features_df):,} feature rows", "✅")
+    # Step 3: Save features
+    with ml_profiling.active().section('save'):
+        save_features(features_df, args.format, append=checkpoint is not None)
+        if args.mode == 'replay' and csv_source is None:
+            save_checkpoint(new_checkpoint)
+            print_progress(f"✅ Saved player state through {new_checkpoint['last_date']} to {CHECKPOINT_FILE}", "✅")
     print()
     
+    if args.profile:
+        report = profiler.report(len(features_df), mode=args.mode, start_year=args.start_year,
+                                 since_last=args.since_last, format=args.format, source=args.source,
+                                 ratings=args.ratings)
+        ml_profiling.write_report(report, args.profile)
+        print_progress("⏱️ EXTRACTION PROFILE", "⏱️")
+        for line in ml_profiling.summary_lines(report):
+            print_progress(line, "  ")
+        print_progress(f"✅ Saved profile report to {args.profile}", "✅")
+        print()
+    
+    if features_df.empty:
+        print_progress("No new matches to extract", "ℹ️")
+        return
+    
     # Step 4: Show summary statistics
     print_progress("📊 FEATURE SUMMARY", "📊")
     print_progress(f"   Total matches: {len(features_df):,}", "📈")
-    print_progress(f"   Date range: {features_df['match_date'].min()} to {features_df['match_date'].max()}", "📅")
+    dates = pd.to_datetime(features_df['match_date'])
+    print_progress(f"   Date range: {dates.min().date()} to {dates.max().date()}", "📅")
     print_progress(f"   Surfaces: {features_df['surface'].value_counts().to_dict()}", "🎾")
     print_progress(f"   Features: {len([c for c in features_df.columns if c not in ['match_id', 'match_date', 'surface', 'player1_name', 'player2_name', 'target']])}", "🔢")
     print_progress(f"   Target distribution: {features_df['target'].value_counts().to_dict()}", "🎯")
@@ -354,7 +853,7 @@ def main():
     print_progress("=" * 60, "🎉")
     print_progress("FEATURE EXTRACTION COMPLETE!", "🎉")
     print_progress("=" * 60, "🎉")
-    print_progress(f"Next step: Run 'python3 scripts/ml_train_model.py'", "➡️")
+    print_progress("Next step: Run 'python3 scripts/ml_train_model.py'", "➡️")
 
 if __name__ == "__main__":
     main()
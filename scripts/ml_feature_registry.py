@@ -0,0 +1,475 @@
+"""
+Feature Registry
+Declares every model feature once, together with the inputs it is computed
+from (ELO ratings, windowed win rates, form, H2H, player attributes). A
+FeatureExecutor plans the batched reads a set of features needs, evaluates
+them for many (player1, player2, surface, as_of) requests at once and returns
+them in model_metadata.json column order
+"""
+
+import json
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import ml_profiling
+from ml_glicko2 import Glicko2Index
+from ml_h2h_index import H2HIndex
+from ml_rating_index import RatingIndex
+from ml_trueskill import TrueSkillIndex, win_probability
+from ml_replay import (EPOCH_ORDINAL, FORM_LONG, FORM_SHORT, WINDOW_12MO_DAYS, WINDOW_CAREER_DAYS,
+                       to_day_numbers)
+from ml_win_rates import RecentForm, SurfaceWinRates
+
+METADATA_FILE = 'model_metadata.json'
+
+DEFAULT_HEIGHT = 180.0
+DAYS_PER_YEAR = 365.25
+SURFACE_ENCODING = {'Hard': 0, 'Clay': 1, 'Grass': 2}
+
+# Attribute values for players missing from the players table
+MISSING_ATTRIBUTES = {'births': np.nan, 'heights': DEFAULT_HEIGHT, 'hands': 0}
+
+# Every match involving the requested players before the cutoff, with the
+# extractor's surface rule and replay order (plus what the ELO replay in
+# ml_elo.py rates by)
+HISTORY_QUERY = """
+    SELECT
+        m.id as match_id,
+        m.match_date,
+        m.player1_id,
+        m.player2_id,
+        m.winner_id,
+        COALESCE(t.surface, 'Hard') as surface,
+        m.surface as rating_surface,
+        t.level as tournament_level
+    FROM matches m
+    LEFT JOIN tournaments t ON m.tournament_id = t.id
+    WHERE m.winner_id IS NOT NULL
+        AND m.match_date IS NOT NULL
+        AND m.match_date < %(before)s
+        AND (%(player_ids)s::int[] IS NULL
+            OR m.player1_id = ANY(%(player_ids)s::int[])
+            OR m.player2_id = ANY(%(player_ids)s::int[]))
+    ORDER BY m.match_date ASC, m.id ASC
+"""
+
+# RATINGS_QUERY (ml_rating_index.py) limited to the requested players
+PLAYER_RATINGS_QUERY = """
+    SELECT
+        COALESCE(m.match_date, r.calculated_at::date) as rated_on,
+        r.player_id,
+        r.surface,
+        r.rating_value
+    FROM ratings r
+    LEFT JOIN matches m ON r.match_id = m.id
+    WHERE r.rating_type = 'elo'
+        AND COALESCE(m.match_date, r.calculated_at::date) < %(before)s
+        AND (%(player_ids)s::int[] IS NULL OR r.player_id = ANY(%(player_ids)s::int[]))
+    ORDER BY rated_on ASC, r.id ASC
+"""
+
+PLAYERS_QUERY = """
+    SELECT id as player_id, birth_date, height, playing_hand
+    FROM players
+    WHERE %(player_ids)s::int[] IS NULL OR id = ANY(%(player_ids)s::int[])
+"""
+
+
+class PlayerAttributes:
+    """Birth ordinals, heights and hand codes by player id"""
+
+    def __init__(self, player_ids, births, heights, hands):
+        order = np.argsort(np.asarray(player_ids, dtype=np.int64))
+        self.player_ids = np.asarray(player_ids, dtype=np.int64)[order]
+        self.births = np.asarray(births, dtype=np.float64)[order]
+        self.heights = np.asarray(heights, dtype=np.float64)[order]
+        self.hands = np.asarray(hands, dtype=np.int64)[order]
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a frame with player_id, birth_date, height and playing_hand"""
+        births = pd.to_datetime(df['birth_date'])
+        ordinals = births.values.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+        heights = pd.to_numeric(df['height'], errors='coerce').to_numpy(dtype=np.float64)
+        # Unknown hand is its own value (code 0), so two unknowns are a "same hand" matchup
+        hand_codes, _ = pd.factorize(df['playing_hand'])
+        return cls(
+            df['player_id'].to_numpy(),
+            np.where(births.isna(), np.nan, ordinals),
+            # Missing heights count as DEFAULT_HEIGHT, like COALESCE(height, 180)
+            np.where(np.isnan(heights) | (heights == 0), DEFAULT_HEIGHT, heights),
+            hand_codes + 1
+        )
+
+    def lookup(self, field, player_ids):
+        """One attribute ('births', 'heights' or 'hands') per player id"""
+        player_ids = np.asarray(player_ids, dtype=np.int64)
+        missing = MISSING_ATTRIBUTES[field]
+        if not len(self.player_ids):
+            return np.full(len(player_ids), missing)
+        rows = np.minimum(np.searchsorted(self.player_ids, player_ids), len(self.player_ids) - 1)
+        return np.where(self.player_ids[rows] == player_ids, getattr(self, field)[rows], missing)
+
+
+class FeatureSources:
+    """The indexes inputs are read from; only the ones a plan needs are set"""
+
+    def __init__(self, ratings=None, win_rates=None, form=None, h2h=None, players=None, glicko2=None,
+                 trueskill=None):
+        self.ratings = ratings
+        self.win_rates = win_rates
+        self.form = form
+        self.h2h = h2h
+        self.players = players
+        self.glicko2 = glicko2
+        self.trueskill = trueskill
+
+
+class Requests:
+    """Aligned (player1, player2, surface, as_of) arrays.
+
+    as_of may be one date, an array of dates, or None for now; features use
+    matches and ratings dated strictly before it, so None counts today.
+    """
+
+    def __init__(self, player1_ids, player2_ids, surfaces, as_of=None):
+        self.player1_ids = np.asarray(player1_ids, dtype=np.int64)
+        self.player2_ids = np.asarray(player2_ids, dtype=np.int64)
+        n = len(self.player1_ids)
+        self.surfaces = [surfaces] * n if isinstance(surfaces, str) else list(surfaces)
+        if as_of is None:
+            as_of = date.today() + timedelta(days=1)
+        if np.ndim(as_of) == 0:
+            self.days = np.full(n, to_day_numbers([as_of])[0], dtype=np.int64)
+        else:
+            self.days = to_day_numbers(as_of)
+        self.dates = (self.days - EPOCH_ORDINAL).astype('datetime64[D]')
+
+    def __len__(self):
+        return len(self.days)
+
+
+class Input:
+    """A value features are computed from, read from one index.
+
+    lookup(sources, player_ids, requests) for per-player inputs, evaluated for
+    both players; lookup(sources, requests) for per-match inputs.
+    """
+
+    def __init__(self, name, index, family, lookup, per_player=True):
+        self.name = name
+        self.index = index
+        self.family = family
+        self.lookup = lookup
+        self.per_player = per_player
+
+
+INPUTS = {i.name: i for i in [
+    Input('surface_elo', 'ratings', 'surface_elo',
+          lambda s, ids, r: s.ratings.ratings_before(ids, r.surfaces, r.dates)),
+    Input('overall_elo', 'ratings', 'overall_elo',
+          lambda s, ids, r: s.ratings.ratings_before(ids, None, r.dates)),
+    Input('surface_wr_12mo', 'win_rates', 'win_rates',
+          lambda s, ids, r: s.win_rates.win_rates(ids, r.surfaces, r.days, WINDOW_12MO_DAYS)),
+    Input('surface_wr_career', 'win_rates', 'win_rates',
+          lambda s, ids, r: s.win_rates.win_rates(ids, r.surfaces, r.days, WINDOW_CAREER_DAYS)),
+    Input('form_20', 'form', 'form', lambda s, ids, r: s.form.recent_form(ids, r.days, FORM_LONG)),
+    Input('form_10', 'form', 'form', lambda s, ids, r: s.form.recent_form(ids, r.days, FORM_SHORT)),
+    Input('birth', 'players', 'demographics', lambda s, ids, r: s.players.lookup('births', ids)),
+    Input('height', 'players', 'demographics', lambda s, ids, r: s.players.lookup('heights', ids)),
+    Input('hand', 'players', 'demographics', lambda s, ids, r: s.players.lookup('hands', ids)),
+    Input('h2h', 'h2h', 'h2h',
+          lambda s, r: s.h2h.advantages(r.player1_ids, r.player2_ids, r.surfaces, r.dates),
+          per_player=False),
+    Input('glicko2_rating', 'glicko2', 'glicko2', lambda s, ids, r: s.glicko2.ratings_before(ids, r.dates)),
+    Input('glicko2_rd', 'glicko2', 'glicko2', lambda s, ids, r: s.glicko2.rds_before(ids, r.dates)),
+    Input('trueskill_mu', 'trueskill', 'trueskill', lambda s, ids, r: s.trueskill.mus_before(ids, r.dates)),
+    Input('trueskill_sigma', 'trueskill', 'trueskill', lambda s, ids, r: s.trueskill.sigmas_before(ids, r.dates)),
+    Input('day', None, 'assembly', lambda s, r: r.days, per_player=False),
+    Input('surface', None, 'assembly',
+          lambda s, r: np.array([SURFACE_ENCODING.get(x, 0) for x in r.surfaces], dtype=np.int64),
+          per_player=False),
+]}
+
+# Which query fills each index; everything but ELO and player attributes shares one history read
+INDEX_QUERIES = {'ratings': 'ratings', 'win_rates': 'history', 'form': 'history', 'h2h': 'history',
+                 'players': 'players', 'glicko2': 'history', 'trueskill': 'history'}
+
+# Indexes replayed over everyone's matches: a player's rating depends on
+# their opponents' other results, so the history read is never limited to
+# the requested players
+FULL_HISTORY_INDEXES = {'glicko2', 'trueskill'}
+
+
+class Feature:
+    """A model feature: a function of the named input values"""
+
+    def __init__(self, name, inputs, compute):
+        self.name = name
+        self.inputs = inputs
+        self.compute = compute
+
+
+def diff(name):
+    """player1's value minus player2's"""
+    return [name], lambda v: v[name][0] - v[name][1]
+
+
+def side(name, player):
+    return [name], lambda v: v[name][player]
+
+
+def age_diff(v):
+    birth1, birth2 = v['birth']
+    days = v['day'].astype(np.float64)
+    known = ~np.isnan(birth1) & ~np.isnan(birth2)
+    return np.where(known, (days - birth1) / DAYS_PER_YEAR - (days - birth2) / DAYS_PER_YEAR, 0.0)
+
+
+def hand_matchup(v):
+    return (v['hand'][0] != v['hand'][1]).astype(np.int64)
+
+
+def trueskill_win_prob(v):
+    (mu1, mu2), (sigma1, sigma2) = v['trueskill_mu'], v['trueskill_sigma']
+    return win_probability(mu1, sigma1, mu2, sigma2)
+
+
+# Model features in training order (model_metadata.json "features")
+FEATURES = {name: Feature(name, *spec) for name, spec in [
+    ('surface_elo_diff', diff('surface_elo')),
+    ('overall_elo_diff', diff('overall_elo')),
+    ('p1_surface_wr_12mo', side('surface_wr_12mo', 0)),
+    ('p2_surface_wr_12mo', side('surface_wr_12mo', 1)),
+    ('surface_wr_diff_12mo', diff('surface_wr_12mo')),
+    ('p1_surface_wr_career', side('surface_wr_career', 0)),
+    ('p2_surface_wr_career', side('surface_wr_career', 1)),
+    ('surface_wr_diff_career', diff('surface_wr_career')),
+    ('p1_form_20', side('form_20', 0)),
+    ('p2_form_20', side('form_20', 1)),
+    ('form_diff_20', diff('form_20')),
+    ('p1_surface_form_10', side('form_10', 0)),
+    ('p2_surface_form_10', side('form_10', 1)),
+    ('surface_form_diff_10', diff('form_10')),
+    ('age_diff', (['birth', 'day'], age_diff)),
+    ('height_diff', diff('height')),
+    ('hand_matchup', (['hand'], hand_matchup)),
+    ('h2h_surface_advantage', (['h2h'], lambda v: v['h2h'])),
+    ('surface', (['surface'], lambda v: v['surface'])),
+    ('glicko2_diff', diff('glicko2_rating')),
+    ('glicko2_rd_diff', diff('glicko2_rd')),
+    ('trueskill_diff', diff('trueskill_mu')),
+    ('trueskill_sigma_diff', diff('trueskill_sigma')),
+    ('trueskill_win_prob', (['trueskill_mu', 'trueskill_sigma'], trueskill_win_prob)),
+]}
+
+# Features extracted only on request (ml_extract_features.py --extra-features);
+# the shipped model does not use them
+OPTIONAL_FEATURES = ['glicko2_diff', 'glicko2_rd_diff', 'trueskill_diff', 'trueskill_sigma_diff', 'trueskill_win_prob']
+
+MODEL_FEATURES = [name for name in FEATURES if name not in OPTIONAL_FEATURES]
+
+# Columns of the extracted feature table, which keeps the surface name instead of its code
+EXTRACTED_FEATURES = [name for name in MODEL_FEATURES if name != 'surface']
+
+
+def load_feature_names(path=METADATA_FILE):
+    """Feature column order of a trained model"""
+    with open(path) as f:
+        return json.load(f)['features']
+
+
+def load_feature_dtype(path=METADATA_FILE):
+    """dtype the model's scaler was fit on; models trained before it was recorded used float64 CSV features"""
+    with open(path) as f:
+        return np.dtype(json.load(f).get('feature_dtype', 'float64'))
+
+
+def feature_columns(feature_names, values):
+    """Compute the named features from input values, as a dict of arrays.
+
+    Not profiled here: callers charge it to their own 'assembly' section.
+    """
+    return {name: FEATURES[name].compute(values) for name in feature_names}
+
+
+class PlayerSnapshot:
+    """Per-player input values of many players on every surface, as of one date.
+
+    Per-player inputs depend only on (player, surface, date), so a service can
+    compute them once for everyone it expects to see and answer requests with
+    row lookups; only per-match inputs such as H2H are left to evaluate.
+    """
+
+    def __init__(self, executor, sources, player_ids, as_of=None):
+        self.player_ids = np.unique(np.asarray(player_ids, dtype=np.int64))
+        self.rows = {int(player_id): row for row, player_id in enumerate(self.player_ids)}
+        self.as_of = as_of or date.today() + timedelta(days=1)
+        self.inputs = [name for name in executor.inputs if INPUTS[name].per_player]
+        # name -> (surface code, row) table
+        self.tables = {name: np.empty((len(SURFACE_ENCODING), len(self.player_ids))) for name in self.inputs}
+        for surface, code in SURFACE_ENCODING.items():
+            requests = Requests(self.player_ids, self.player_ids, surface, self.as_of)
+            for name in self.inputs:
+                self.tables[name][code] = INPUTS[name].lookup(sources, self.player_ids, requests)
+
+    def __len__(self):
+        return len(self.player_ids)
+
+    def covers(self, player_ids):
+        return all(int(player_id) in self.rows for player_id in player_ids)
+
+    def values(self, requests):
+        """{name: (player1 values, player2 values)} for requests made as of self.as_of"""
+        rows1 = np.fromiter((self.rows[int(p)] for p in requests.player1_ids), dtype=np.int64, count=len(requests))
+        rows2 = np.fromiter((self.rows[int(p)] for p in requests.player2_ids), dtype=np.int64, count=len(requests))
+        codes = np.fromiter((SURFACE_ENCODING.get(x, 0) for x in requests.surfaces), dtype=np.int64,
+                            count=len(requests))
+        return {name: (table[codes, rows1], table[codes, rows2]) for name, table in self.tables.items()}
+
+
+class FeatureExecutor:
+    """Evaluates a fixed list of features for batches of requests.
+
+    provided: inputs the caller passes to evaluate() itself (e.g. the ELO
+    replay's pre-match ratings), so their indexes are never loaded
+    dtype: default dtype of matrix()
+    """
+
+    def __init__(self, feature_names=None, provided=(), dtype=np.float32):
+        self.dtype = np.dtype(dtype)
+        self.feature_names = list(MODEL_FEATURES if feature_names is None else feature_names)
+        unknown = [name for name in self.feature_names if name not in FEATURES]
+        if unknown:
+            raise KeyError(f"Unknown features: {unknown}")
+        needed = {i for name in self.feature_names for i in FEATURES[name].inputs}
+        self.provided = [name for name in INPUTS if name in needed and name in provided]
+        self.inputs = [name for name in INPUTS if name in needed and name not in provided]
+        self.indexes = sorted({INPUTS[name].index for name in self.inputs} - {None})
+        self.queries = sorted({INDEX_QUERIES[index] for index in self.indexes})
+
+    @classmethod
+    def from_metadata(cls, path=METADATA_FILE):
+        """The trained model's features, built in the dtype its scaler was fit on"""
+        return cls(load_feature_names(path), dtype=load_feature_dtype(path))
+
+    def load_sources(self, conn, player_ids=None, before=None):
+        """
+        Build the indexes this plan needs, with one query per source table.
+
+        player_ids: limit the reads to these players (default: everyone)
+        before: only read matches and ratings dated before this (default: all)
+        """
+        return self.sources_from_frames(**self.read_frames(conn, player_ids, before))
+
+    def read_frames(self, conn, player_ids=None, before=None):
+        """The source query results this plan needs, by query name (see load_sources())"""
+        profiler = ml_profiling.active()
+        params = {
+            'player_ids': None if player_ids is None else sorted({int(p) for p in player_ids}),
+            'before': before or date.max,
+        }
+        history_params = dict(params, player_ids=None) if FULL_HISTORY_INDEXES & set(self.indexes) else params
+        frames = {}
+        with profiler.section('load'):
+            if 'ratings' in self.queries:
+                frames['ratings'] = pd.read_sql_query(PLAYER_RATINGS_QUERY, conn, params=params)
+            if 'players' in self.queries:
+                frames['players'] = pd.read_sql_query(PLAYERS_QUERY, conn, params=params)
+            if 'history' in self.queries:
+                frames['history'] = pd.read_sql_query(HISTORY_QUERY, conn, params=history_params)
+        return frames
+
+    def sources_from_frames(self, ratings=None, history=None, players=None):
+        """Build the indexes from frames shaped like the source queries'
+        results, e.g. read from the CSV files instead of the database"""
+        sources = FeatureSources()
+        if ratings is not None and 'ratings' in self.indexes:
+            sources.ratings = RatingIndex.from_frame(ratings)
+        if players is not None and 'players' in self.indexes:
+            sources.players = PlayerAttributes.from_frame(players)
+        if history is not None:
+            self.index_history(sources, history)
+        return sources
+
+    def index_history(self, sources, history):
+        """Fill the history-based indexes from a fetch_history()-style frame"""
+        profiler = ml_profiling.active()
+        if 'win_rates' in self.indexes:
+            with profiler.section('win_rates', calls=0):
+                sources.win_rates = SurfaceWinRates(history)
+        if 'form' in self.indexes:
+            with profiler.section('form', calls=0):
+                sources.form = RecentForm(history)
+        if 'h2h' in self.indexes:
+            with profiler.section('h2h', calls=0):
+                sources.h2h = H2HIndex.from_frame(history)
+        if 'glicko2' in self.indexes:
+            with profiler.section('glicko2', calls=0):
+                sources.glicko2 = Glicko2Index.from_history(history)
+        if 'trueskill' in self.indexes:
+            with profiler.section('trueskill', calls=0):
+                sources.trueskill = TrueSkillIndex.from_history(history)
+        return sources
+
+    def evaluate(self, sources, requests, provided=None, players=None):
+        """Input values for every request: (player1, player2) pairs or per-match arrays.
+
+        provided: values of this executor's provided inputs, in the same shape
+        players: a PlayerSnapshot covering every requested player, made as of
+        the requests' date; per-player inputs are read from it
+        """
+        profiler = ml_profiling.active()
+        values = {name: (provided or {})[name] for name in self.provided}
+        if players is not None:
+            with profiler.section('snapshot', calls=len(requests)):
+                values.update(players.values(requests))
+        for name in self.inputs:
+            if name in values:
+                continue
+            spec = INPUTS[name]
+            calls = len(requests) * (2 if spec.per_player else 1)
+            with profiler.section(spec.family, calls=calls):
+                if spec.per_player:
+                    values[name] = (spec.lookup(sources, requests.player1_ids, requests),
+                                    spec.lookup(sources, requests.player2_ids, requests))
+                else:
+                    values[name] = spec.lookup(sources, requests)
+        return values
+
+    def matrix(self, values, dtype=None):
+        """Features in this executor's column order, one row per request.
+
+        dtype defaults to the executor's. In front of the StandardScaler it
+        must be the dtype the scaler was fit on (model_metadata.json
+        "feature_dtype": float32 from the feature store, float64 from
+        ml_features.csv), because scaling in another precision shifts values
+        that sit exactly on a tree split.
+        """
+        dtype = dtype or self.dtype
+        columns = feature_columns(self.feature_names, values)
+        n = len(next(iter(columns.values()))) if columns else 0
+        matrix = np.empty((n, len(self.feature_names)), dtype=dtype)
+        for i, name in enumerate(self.feature_names):
+            matrix[:, i] = columns[name]
+        return matrix
+
+    def player_values(self, values, row=0):
+        """Per-player input values of one request, as (player1, player2) dicts"""
+        pairs = [(name, values[name]) for name in self.inputs if INPUTS[name].per_player]
+        return ({name: v[0][row].item() for name, v in pairs},
+                {name: v[1][row].item() for name, v in pairs})
+
+    def run(self, conn, player1_ids, player2_ids, surfaces, as_of=None, dtype=None):
+        """Load what the requested players need and compute their features.
+
+        Returns the feature matrix and the input values behind it.
+        """
+        requests = Requests(player1_ids, player2_ids, surfaces, as_of)
+        player_ids = np.concatenate([requests.player1_ids, requests.player2_ids])
+        before = requests.dates.max().astype(object) if len(requests) else None
+        sources = self.load_sources(conn, player_ids, before)
+        values = self.evaluate(sources, requests)
+        return self.matrix(values, dtype), values
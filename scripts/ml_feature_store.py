@@ -0,0 +1,192 @@
+"""
+Columnar Feature Store
+Stores the extracted feature table as one typed .npy file per column plus a
+manifest.json, so training can memory-map only the columns it needs instead
+of parsing ml_features.csv
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+STORE_DIR = 'ml_features'
+MANIFEST_FILE = 'manifest.json'
+STORE_VERSION = 1
+
+# Surface codes double as the model's surface_encoded input
+SURFACE_CATEGORIES = ['Hard', 'Clay', 'Grass']
+
+# Columns that are not model features; everything else numeric is stored as float32
+ID_COLUMNS = {'match_id': 'int64', 'match_date': 'datetime64[D]', 'target': 'int8'}
+CATEGORICAL_COLUMNS = {'surface': 'int8', 'player1_name': 'int32', 'player2_name': 'int32'}
+FEATURE_DTYPE = 'float32'
+
+
+def is_store(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def read_manifest(path=STORE_DIR):
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def _encode_categorical(values, dtype, categories=None):
+    """Map values to integer codes; categories are extended, never reordered"""
+    categories = list(categories or [])
+    seen = {name: code for code, name in enumerate(categories)}
+    for value in pd.unique(values):
+        if value not in seen:
+            seen[value] = len(categories)
+            categories.append(value)
+    codes = pd.Series(values).map(seen).to_numpy(dtype=dtype)
+    return codes, categories
+
+
+def write_store(df, path=STORE_DIR):
+    """
+    Write a feature frame as a column store, rows sorted by match_date.
+
+    The store is built in a temporary directory beside path and renamed into
+    place, so a crash mid-write leaves the previous store untouched instead
+    of a manifest describing a mix of old and new columns.
+    """
+    path = os.path.normpath(path)
+    parent = os.path.dirname(os.path.abspath(path))
+    staging = tempfile.mkdtemp(prefix=f'.{os.path.basename(path)}.tmp-', dir=parent)
+    try:
+        # mkdtemp() makes the directory private; give it the usual permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(staging, 0o777 & ~umask)
+        manifest = _write_columns(df, staging)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Directories can't be os.replace()d over a non-empty one: move the old store aside first
+    retired = None
+    if os.path.exists(path):
+        retired = tempfile.mkdtemp(prefix=f'.{os.path.basename(path)}.old-', dir=parent)
+        os.replace(path, os.path.join(retired, 'store'))
+    os.replace(staging, path)
+    if retired is not None:
+        shutil.rmtree(retired, ignore_errors=True)
+    return manifest
+
+
+def _write_columns(df, path):
+    """Write every column and then the manifest into an empty directory"""
+    df = df.sort_values(['match_date', 'match_id'], kind='stable').reset_index(drop=True)
+
+    columns = {}
+    for name in df.columns:
+        values = df[name]
+        spec = {}
+        if name == 'match_date':
+            spec['dtype'] = ID_COLUMNS[name]
+            array = pd.to_datetime(values).to_numpy().astype(spec['dtype'])
+            spec['kind'] = 'key'
+        elif name in ID_COLUMNS:
+            spec['dtype'] = ID_COLUMNS[name]
+            array = values.to_numpy().astype(spec['dtype'])
+            spec['kind'] = 'target' if name == 'target' else 'key'
+        elif name in CATEGORICAL_COLUMNS or not pd.api.types.is_numeric_dtype(values):
+            spec['dtype'] = CATEGORICAL_COLUMNS.get(name, 'int32')
+            base = SURFACE_CATEGORIES if name == 'surface' else None
+            array, spec['categories'] = _encode_categorical(values.to_numpy(), spec['dtype'], base)
+            spec['kind'] = 'categorical'
+        else:
+            spec['dtype'] = FEATURE_DTYPE
+            array = values.to_numpy(dtype=FEATURE_DTYPE)
+            spec['kind'] = 'feature'
+        np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+        columns[name] = spec
+
+    dates = np.load(os.path.join(path, 'match_date.npy'), mmap_mode='r')
+    manifest = {
+        'version': STORE_VERSION,
+        'rows': len(df),
+        'sorted_by': 'match_date',
+        'date_range': [str(dates[0]), str(dates[-1])] if len(df) else None,
+        'columns': columns
+    }
+    # Manifest last: a store without one is treated as incomplete
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def append_store(df, path=STORE_DIR):
+    """
+    Add rows to an existing store (or create it).
+
+    This is a full rewrite: the old rows are read back and every column is
+    written again, sorted, through write_store(). .npy files carry their
+    length in the header and rows must stay date-sorted, so columns can't be
+    extended in place; the cost is one read and write of the store.
+    """
+    if not is_store(path):
+        return write_store(df, path)
+    if df.empty:
+        return read_manifest(path)
+    existing = load_frame(path, mmap=False)
+    return write_store(pd.concat([existing, df[existing.columns]], ignore_index=True), path)
+
+
+def _row_slice(path, start_date, end_date):
+    """Rows with start_date <= match_date < end_date, as a contiguous slice"""
+    dates = np.load(os.path.join(path, 'match_date.npy'), mmap_mode='r')
+    lo = 0 if start_date is None else int(np.searchsorted(dates, np.datetime64(start_date, 'D'), side='left'))
+    hi = len(dates) if end_date is None else int(np.searchsorted(dates, np.datetime64(end_date, 'D'), side='left'))
+    return slice(lo, max(lo, hi))
+
+
+def load_columns(path=STORE_DIR, columns=None, start_date=None, end_date=None, mmap=True):
+    """
+    Load raw column arrays from the store.
+
+    columns: names to load (default all); only those files are opened
+    start_date / end_date: keep rows with start_date <= match_date < end_date
+
+    With mmap=True the arrays are read-only views of the files, so nothing is
+    read from disk until it is used. Categorical columns come back as codes;
+    their categories are in read_manifest(path)['columns'][name].
+    """
+    manifest = read_manifest(path)
+    names = list(manifest['columns']) if columns is None else list(columns)
+    missing = [name for name in names if name not in manifest['columns']]
+    if missing:
+        raise KeyError(f"Columns not in feature store: {missing}")
+
+    rows = _row_slice(path, start_date, end_date)
+    mode = 'r' if mmap else None
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode)[rows] for name in names}
+
+
+def load_matrix(path=STORE_DIR, columns=None, start_date=None, end_date=None):
+    """Stack numeric columns into one float32 matrix (the only copy made)"""
+    arrays = load_columns(path, columns, start_date, end_date)
+    n = len(next(iter(arrays.values()))) if arrays else 0
+    matrix = np.empty((n, len(arrays)), dtype=np.float32)
+    for i, array in enumerate(arrays.values()):
+        matrix[:, i] = array
+    return matrix
+
+
+def load_frame(path=STORE_DIR, columns=None, start_date=None, end_date=None, mmap=True):
+    """Load the store as a DataFrame with categoricals decoded, like the old CSV"""
+    manifest = read_manifest(path)
+    arrays = load_columns(path, columns, start_date, end_date, mmap=mmap)
+    data = {}
+    for name, array in arrays.items():
+        spec = manifest['columns'][name]
+        if spec['kind'] == 'categorical':
+            data[name] = pd.Categorical.from_codes(np.asarray(array), categories=spec['categories'])
+        else:
+            data[name] = array
+    return pd.DataFrame(data)
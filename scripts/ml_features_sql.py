@@ -0,0 +1,202 @@
+"""
+Server-Side Set-Based Feature Extraction
+Computes the whole feature table inside Postgres with one statement and
+streams it back through a server-side cursor, already shaped like ml_features.csv
+"""
+
+import pandas as pd
+
+
+# Columns come back in database order (player1 is the winner, target = 1);
+# the caller flips player order afterwards.
+FEATURES_SQL = """
+WITH decided AS (
+    SELECT
+        m.id as match_id,
+        m.match_date,
+        m.player1_id,
+        m.player2_id,
+        m.winner_id,
+        COALESCE(t.surface, 'Hard') as surface
+    FROM matches m
+    LEFT JOIN tournaments t ON m.tournament_id = t.id
+    WHERE m.winner_id IS NOT NULL
+),
+player_long AS (
+    SELECT match_id, match_date, surface, player1_id as player_id,
+           (winner_id = player1_id)::int as won
+    FROM decided
+    UNION ALL
+    SELECT match_id, match_date, surface, player2_id as player_id,
+           (winner_id = player2_id)::int as won
+    FROM decided
+),
+player_seq AS (
+    SELECT
+        player_id,
+        match_id,
+        match_date,
+        COUNT(*) OVER surface_12mo as wr_12mo_played,
+        COALESCE(SUM(won) OVER surface_12mo, 0) as wr_12mo_won,
+        COUNT(*) OVER surface_career as wr_career_played,
+        COALESCE(SUM(won) OVER surface_career, 0) as wr_career_won,
+        ROW_NUMBER() OVER by_player as seq,
+        SUM(won) OVER by_player as wins_through
+    FROM player_long
+    WINDOW
+        surface_12mo AS (PARTITION BY player_id, surface ORDER BY match_date
+                         RANGE BETWEEN INTERVAL '360 days' PRECEDING AND INTERVAL '1 day' PRECEDING),
+        surface_career AS (PARTITION BY player_id, surface ORDER BY match_date
+                           RANGE BETWEEN INTERVAL '3600 days' PRECEDING AND INTERVAL '1 day' PRECEDING),
+        by_player AS (PARTITION BY player_id ORDER BY match_date, match_id
+                      ROWS UNBOUNDED PRECEDING)
+),
+player_prior AS (
+    -- Matches played strictly before the match day (same-day matches excluded)
+    SELECT s.*,
+        MIN(s.seq) OVER (PARTITION BY s.player_id, s.match_date) - 1 as prior
+    FROM player_seq s
+),
+player_stats AS (
+    SELECT
+        p.player_id,
+        p.match_id,
+        CASE WHEN p.wr_12mo_played > 0
+             THEN p.wr_12mo_won::float / p.wr_12mo_played ELSE 0.5 END as wr_12mo,
+        CASE WHEN p.wr_career_played > 0
+             THEN p.wr_career_won::float / p.wr_career_played ELSE 0.5 END as wr_career,
+        CASE WHEN p.prior > 0
+             THEN (w.wins_through - COALESCE(w20.wins_through, 0))::float / LEAST(p.prior, 20)
+             ELSE 0.5 END as form_20,
+        CASE WHEN p.prior > 0
+             THEN (w.wins_through - COALESCE(w10.wins_through, 0))::float / LEAST(p.prior, 10)
+             ELSE 0.5 END as form_10
+    FROM player_prior p
+    LEFT JOIN player_seq w ON w.player_id = p.player_id AND w.seq = p.prior
+    LEFT JOIN player_seq w20 ON w20.player_id = p.player_id AND w20.seq = p.prior - 20
+    LEFT JOIN player_seq w10 ON w10.player_id = p.player_id AND w10.seq = p.prior - 10
+),
+elo_events AS (
+    -- Every ELO row, dated once like RatingIndex: by its rated match, else when it was calculated
+    SELECT r.player_id, COALESCE(r.surface, '') as rating_key,
+           COALESCE(rm.match_date, r.calculated_at::date) as event_date,
+           1 as kind, r.id as event_id, NULL::integer as match_id, r.rating_value
+    FROM ratings r
+    LEFT JOIN matches rm ON r.match_id = rm.id
+    WHERE r.rating_type = 'elo'
+    UNION ALL
+    -- One surface and one overall lookup per player and match; kind 0 sorts
+    -- before same-day ratings, so only ratings from earlier days are seen
+    SELECT player_id, surface, match_date, 0, match_id, match_id, NULL
+    FROM player_long
+    WHERE match_date >= %(start_date)s
+    UNION ALL
+    SELECT player_id, '', match_date, 0, match_id, match_id, NULL
+    FROM player_long
+    WHERE match_date >= %(start_date)s
+),
+elo_groups AS (
+    -- Each rating starts a group that runs until the next one
+    SELECT e.*,
+        COUNT(rating_value) OVER (PARTITION BY player_id, rating_key
+                                  ORDER BY event_date, kind, event_id
+                                  ROWS UNBOUNDED PRECEDING) as grp
+    FROM elo_events e
+),
+elo_carried AS (
+    SELECT match_id, player_id, rating_key, kind,
+        MAX(rating_value) OVER (PARTITION BY player_id, rating_key, grp) as rating_value
+    FROM elo_groups
+),
+player_elo AS (
+    -- Point-in-time ELO as of the match day, from one sort of ratings and lookups together
+    SELECT
+        match_id,
+        player_id,
+        MAX(CASE WHEN rating_key <> '' THEN rating_value END) as surface_elo,
+        MAX(CASE WHEN rating_key = '' THEN rating_value END) as overall_elo
+    FROM elo_carried
+    WHERE kind = 0
+    GROUP BY match_id, player_id
+),
+pair_h2h AS (
+    SELECT
+        match_id,
+        COALESCE(SUM((winner_id = LEAST(player1_id, player2_id))::int) OVER pair_before, 0) as low_wins,
+        COALESCE(SUM((winner_id <> LEAST(player1_id, player2_id))::int) OVER pair_before, 0) as high_wins
+    FROM decided
+    WINDOW pair_before AS (
+        PARTITION BY LEAST(player1_id, player2_id), GREATEST(player1_id, player2_id), surface
+        ORDER BY match_date
+        RANGE BETWEEN UNBOUNDED PRECEDING AND INTERVAL '1 day' PRECEDING
+    )
+)
+SELECT
+    d.match_id,
+    d.match_date,
+    d.surface,
+    p1.name as player1_name,
+    p2.name as player2_name,
+    COALESCE(e1.surface_elo, 1500) - COALESCE(e2.surface_elo, 1500) as surface_elo_diff,
+    COALESCE(e1.overall_elo, 1500) - COALESCE(e2.overall_elo, 1500) as overall_elo_diff,
+    s1.wr_12mo as p1_surface_wr_12mo,
+    s2.wr_12mo as p2_surface_wr_12mo,
+    s1.wr_12mo - s2.wr_12mo as surface_wr_diff_12mo,
+    s1.wr_career as p1_surface_wr_career,
+    s2.wr_career as p2_surface_wr_career,
+    s1.wr_career - s2.wr_career as surface_wr_diff_career,
+    s1.form_20 as p1_form_20,
+    s2.form_20 as p2_form_20,
+    s1.form_20 - s2.form_20 as form_diff_20,
+    s1.form_10 as p1_surface_form_10,
+    s2.form_10 as p2_surface_form_10,
+    s1.form_10 - s2.form_10 as surface_form_diff_10,
+    CASE WHEN p1.birth_date IS NOT NULL AND p2.birth_date IS NOT NULL
+         THEN (p2.birth_date - p1.birth_date) / 365.25 ELSE 0 END as age_diff,
+    COALESCE(NULLIF(p1.height, 0), 180) - COALESCE(NULLIF(p2.height, 0), 180) as height_diff,
+    CASE WHEN p1.playing_hand IS DISTINCT FROM p2.playing_hand THEN 1 ELSE 0 END as hand_matchup,
+    CASE WHEN d.player1_id < d.player2_id THEN h.low_wins - h.high_wins
+         ELSE h.high_wins - h.low_wins END as h2h_surface_advantage,
+    1 as target
+FROM decided d
+JOIN players p1 ON d.player1_id = p1.id
+JOIN players p2 ON d.player2_id = p2.id
+JOIN player_stats s1 ON s1.match_id = d.match_id AND s1.player_id = d.player1_id
+JOIN player_stats s2 ON s2.match_id = d.match_id AND s2.player_id = d.player2_id
+JOIN pair_h2h h ON h.match_id = d.match_id
+LEFT JOIN player_elo e1 ON e1.match_id = d.match_id AND e1.player_id = d.player1_id
+LEFT JOIN player_elo e2 ON e2.match_id = d.match_id AND e2.player_id = d.player2_id
+WHERE d.match_date >= %(start_date)s
+    AND d.surface IN ('Hard', 'Clay', 'Grass')
+    AND p1.name IS NOT NULL
+    AND p2.name IS NOT NULL
+    AND p1.name != ''
+    AND p2.name != ''
+ORDER BY d.match_date ASC, d.match_id ASC
+"""
+
+
+def stream_features(conn, start_year=2000, batch_size=10000):
+    """Run FEATURES_SQL and yield DataFrame batches from a server-side cursor"""
+    # Cursors are planned for fast first rows by default; this one is read to the end
+    with conn.cursor() as settings:
+        settings.execute("SET LOCAL cursor_tuple_fraction = 1.0")
+
+    cursor = conn.cursor(name='ml_features_sql')
+    cursor.itersize = batch_size
+    try:
+        cursor.execute(FEATURES_SQL, {'start_date': f'{start_year}-01-01'})
+        columns = None
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if columns is None:
+                columns = [col[0] for col in cursor.description]
+            if not rows:
+                break
+            batch = pd.DataFrame(rows, columns=columns)
+            # NUMERIC arithmetic (ratings, ages) comes back as Decimal
+            for col in ('surface_elo_diff', 'overall_elo_diff', 'age_diff'):
+                batch[col] = batch[col].astype(float)
+            yield batch
+    finally:
+        cursor.close()
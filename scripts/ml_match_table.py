@@ -0,0 +1,193 @@
+"""
+Compact Match Table for Feature Extraction
+Holds the target matches as one NumPy structured array (ids, day ordinals,
+surface codes, heights, birth ordinals, hand codes) and assembles the
+feature table with whole-array operations instead of per-row dicts
+"""
+
+import numpy as np
+import pandas as pd
+
+import ml_profiling
+from ml_feature_registry import DEFAULT_HEIGHT, EXTRACTED_FEATURES, feature_columns
+from ml_replay import EPOCH_ORDINAL, STAT_KEYS, to_day_numbers
+
+MATCH_DTYPE = np.dtype([
+    ('match_id', np.int64),
+    ('day', np.int32),
+    ('player1_id', np.int32),
+    ('player2_id', np.int32),
+    ('surface', np.int8),
+    ('player1_name', np.int32),
+    ('player2_name', np.int32),
+    ('p1_height', np.float32),
+    ('p2_height', np.float32),
+    ('p1_birth', np.float32),
+    ('p2_birth', np.float32),
+    ('p1_hand', np.int8),
+    ('p2_hand', np.int8),
+])
+
+
+def _birth_ordinals(values):
+    """Birth dates as float day ordinals, NaN when unknown"""
+    dates = pd.to_datetime(values)
+    days = dates.values.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+    return np.where(dates.isna(), np.nan, days).astype(np.float32)
+
+
+def _remap(lookup, values, offset=0):
+    """Append unseen values to lookup; return old code -> new code (lookup[i] has code i + offset)"""
+    index = {value: code for code, value in enumerate(lookup)}
+    remap = np.empty(len(values), dtype=np.int64)
+    for old, value in enumerate(values):
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(lookup)
+            lookup.append(value)
+        remap[old] = code + offset
+    return remap
+
+
+class MatchTable:
+    """Target matches in database order (player1 is the winner)"""
+
+    def __init__(self, records, surfaces, names, hands):
+        self.records = records
+        self.surfaces = surfaces  # surface code -> name
+        self.names = names        # player name code -> name
+        self.hands = hands        # hand code -> value; code 0 is unknown
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build from a fetch_matches() frame"""
+        records = np.empty(len(df), dtype=MATCH_DTYPE)
+        records['match_id'] = df['match_id'].to_numpy()
+        records['day'] = to_day_numbers(df['match_date'])
+        records['player1_id'] = df['player1_id'].to_numpy()
+        records['player2_id'] = df['player2_id'].to_numpy()
+
+        surface_codes, surfaces = pd.factorize(df['surface'])
+        records['surface'] = surface_codes
+
+        name_codes, names = pd.factorize(pd.concat([df['player1_name'], df['player2_name']], ignore_index=True))
+        records['player1_name'] = name_codes[:len(df)]
+        records['player2_name'] = name_codes[len(df):]
+
+        # Missing heights count as DEFAULT_HEIGHT, like COALESCE(height, 180)
+        for side in ('p1', 'p2'):
+            heights = pd.to_numeric(df[f'{side}_height'], errors='coerce').to_numpy(dtype=np.float64)
+            records[f'{side}_height'] = np.where(np.isnan(heights) | (heights == 0), DEFAULT_HEIGHT, heights)
+            records[f'{side}_birth'] = _birth_ordinals(df[f'{side}_birth_date'])
+
+        # Unknown hand is its own value (code 0), so two unknowns are a "same hand" matchup
+        hand_codes, hands = pd.factorize(pd.concat([df['p1_hand'], df['p2_hand']], ignore_index=True))
+        records['p1_hand'] = hand_codes[:len(df)] + 1
+        records['p2_hand'] = hand_codes[len(df):] + 1
+
+        return cls(records, list(surfaces), list(names), [None] + list(hands))
+
+    @classmethod
+    def concat(cls, tables):
+        """Join tables (e.g. streamed batches), merging their lookup tables"""
+        surfaces, names, hands = [], [], []
+        parts = []
+        for table in tables:
+            records = table.records.copy()
+            records['surface'] = _remap(surfaces, table.surfaces)[records['surface']]
+            name_map = _remap(names, table.names)
+            records['player1_name'] = name_map[records['player1_name']]
+            records['player2_name'] = name_map[records['player2_name']]
+            # Hand code 0 (unknown) stays 0
+            hand_map = np.concatenate([[0], _remap(hands, table.hands[1:], offset=1)])
+            records['p1_hand'] = hand_map[records['p1_hand']]
+            records['p2_hand'] = hand_map[records['p2_hand']]
+            parts.append(records)
+        records = np.concatenate(parts) if parts else np.empty(0, dtype=MATCH_DTYPE)
+        return cls(records, surfaces, names, [None] + hands)
+
+    def __len__(self):
+        return len(self.records)
+
+    def take(self, mask):
+        """Rows selected by a boolean mask or index array, sharing the lookup tables"""
+        return MatchTable(self.records[mask], self.surfaces, self.names, self.hands)
+
+    def surface_names(self):
+        return np.asarray(self.surfaces, dtype=object)[self.records['surface']]
+
+    def dates(self):
+        return (self.records['day'].astype(np.int64) - EPOCH_ORDINAL).astype('datetime64[D]')
+
+    def key_frame(self):
+        """The columns the history-based indexes look up (see ml_win_rates.py)"""
+        return pd.DataFrame({
+            'match_date': self.dates(),
+            'player1_id': self.records['player1_id'],
+            'player2_id': self.records['player2_id'],
+            'surface': self.surface_names(),
+        })
+
+
+def feature_frame(table, columns, flips):
+    """The extracted feature table: match columns, feature columns (see
+    ml_feature_registry.py) and the target, with player order already flipped"""
+    r = table.records
+    flips = np.asarray(flips, dtype=bool)
+    name1 = np.where(flips, r['player2_name'], r['player1_name'])
+    name2 = np.where(flips, r['player1_name'], r['player2_name'])
+    names = np.asarray(table.names, dtype=object)
+
+    return pd.DataFrame({
+        'match_id': r['match_id'],
+        'match_date': table.dates(),
+        'surface': table.surface_names(),
+        'player1_name': names[name1],
+        'player2_name': names[name2],
+
+        # Features (the model's, then any optional ones)
+        **columns,
+
+        # Target: 1 if the listed player1 won (only unflipped rows keep the winner first)
+        'target': (~flips).astype(np.int64)
+    })
+
+
+def assemble_features(table, p1_stats, p2_stats, h2h_surface, flips, extra=None):
+    """
+    Build the feature table for every match at once.
+
+    p1_stats / p2_stats: (n, len(STAT_KEYS)) arrays in database order
+    h2h_surface: player1 wins minus player2 wins, database order
+    flips: rows whose player order is swapped to balance the target
+    extra: optional feature columns (already flipped) appended after the model's
+    """
+    profiler = ml_profiling.active()
+    r = table.records
+    flips = np.asarray(flips, dtype=bool)
+
+    def paired(field):
+        a, b = r[f'p1_{field}'], r[f'p2_{field}']
+        return np.where(flips, b, a), np.where(flips, a, b)
+
+    with profiler.section('demographics', calls=len(r)):
+        birth1, birth2 = paired('birth')
+        height1, height2 = paired('height')
+        values = {
+            'birth': (birth1.astype(np.float64), birth2.astype(np.float64)),
+            'height': (height1.astype(np.float64), height2.astype(np.float64)),
+            'hand': paired('hand'),
+            'day': r['day'].astype(np.int64),
+        }
+
+    with profiler.section('assembly', calls=len(r)):
+        swap = flips[:, None]
+        s1 = np.where(swap, p2_stats, p1_stats)
+        s2 = np.where(swap, p1_stats, p2_stats)
+        values.update({key: (s1[:, i], s2[:, i]) for i, key in enumerate(STAT_KEYS)})
+        h2h_surface = np.asarray(h2h_surface)
+        values['h2h'] = np.where(flips, -h2h_surface, h2h_surface)
+
+        columns = feature_columns(EXTRACTED_FEATURES, values)
+        columns.update(extra or {})
+        return feature_frame(table, columns, flips)
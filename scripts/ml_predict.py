@@ -2,15 +2,34 @@
 """
 ML Match Prediction Script
 Takes player names and surface, returns prediction with probabilities
+
+    python ml_predict.py <player1_name> <player2_name> <surface>
+
+With --serve it stays running as a worker: the model is loaded and the
+database connection opened once, then every line of newline-delimited JSON
+on stdin ({"id": ..., "player1": ..., "player2": ..., "surface": ...}) gets
+one JSON line back on stdout with the same id. --socket PATH serves the same
+protocol on a Unix socket instead.
+
+With --batch FILE (or - for stdin) it predicts a list of fixtures, e.g. a
+whole draw, given as CSV with player1,player2,surface columns or as JSON
+lines with the same keys. Names are resolved with one query, features are
+computed with one batched read per source, and all matches are scored with
+one predict_proba call; one JSON line per fixture is written in input order.
 """
 
-import sys
+import argparse
+import csv
 import json
+import os
+import socketserver
+import sys
+import threading
+
 import joblib
-import numpy as np
 import psycopg2
-from datetime import datetime, timedelta
-import pandas as pd
+
+from ml_feature_registry import FeatureExecutor
 
 def get_db_connection():
     return psycopg2.connect(
@@ -24,7 +43,7 @@ def get_player_id(player_name, conn):
     """Get player ID from name"""
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT id FROM players 
+        SELECT id FROM players
         WHERE LOWER(name) = LOWER(%s)
         LIMIT 1
     """, (player_name,))
@@ -32,216 +51,136 @@ def get_player_id(player_name, conn):
     cursor.close()
     return result[0] if result else None
 
-def get_surface_elo(player_id, surface, conn):
-    """Get player's latest ELO rating on specific surface"""
+def get_player_ids(player_names, conn):
+    """Map each name (case-insensitive) to a player ID with one query; unknown names are left out"""
     cursor = conn.cursor()
     cursor.execute("""
-        SELECT rating_value
-        FROM ratings
-        WHERE player_id = %s
-            AND rating_type = 'elo'
-            AND surface = %s
-        ORDER BY calculated_at DESC
-        LIMIT 1
-    """, (player_id, surface))
-    result = cursor.fetchone()
+        SELECT DISTINCT ON (LOWER(name)) LOWER(name), id FROM players
+        WHERE LOWER(name) = ANY(%s)
+        ORDER BY LOWER(name), id
+    """, (sorted({name.lower() for name in player_names}),))
+    ids = dict(cursor.fetchall())
     cursor.close()
-    return float(result[0]) if result else 1500.0
+    return {name: ids[name.lower()] for name in player_names if name.lower() in ids}
 
-def get_overall_elo(player_id, conn):
-    """Get player's latest overall ELO rating"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT rating_value
-        FROM ratings
-        WHERE player_id = %s
-            AND rating_type = 'elo'
-            AND surface IS NULL
-        ORDER BY calculated_at DESC
-        LIMIT 1
-    """, (player_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    return float(result[0]) if result else 1500.0
+def read_fixtures(stream):
+    """Fixtures from CSV (with a header row) or JSON lines, as dicts with player1, player2, surface"""
+    lines = [line for line in stream if line.strip()]
+    if lines and lines[0].lstrip().startswith('{'):
+        return [json.loads(line) for line in lines]
+    return [dict(row) for row in csv.DictReader(lines)]
 
-def get_surface_win_rate(player_id, surface, months, conn):
-    """Get player's win rate on surface in last N months"""
-    cursor = conn.cursor()
-    cutoff_date = datetime.now() - timedelta(days=months*30)
-    
-    cursor.execute("""
-        SELECT 
-            COUNT(*) as total,
-            COUNT(*) FILTER (WHERE winner_id = %s) as wins
-        FROM matches m
-        WHERE (m.player1_id = %s OR m.player2_id = %s)
-            AND m.surface = %s
-            AND m.match_date >= %s
-            AND m.winner_id IS NOT NULL
-    """, (player_id, player_id, player_id, surface, cutoff_date))
-    
-    result = cursor.fetchone()
-    cursor.close()
-    
-    if result and result[0] > 0:
-        return result[1] / result[0]
-    return 0.5
+class Predictor:
+    """The model, scaler, feature plan and a database connection, loaded once"""
 
-def get_recent_form(player_id, num_matches, conn):
-    """Get player's recent form (win rate in last N matches)"""
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT winner_id = %s as won
-        FROM matches m
-        WHERE (m.player1_id = %s OR m.player2_id = %s)
-            AND m.winner_id IS NOT NULL
-        ORDER BY m.match_date DESC
-        LIMIT %s
-    """, (player_id, player_id, player_id, num_matches))
-    
-    results = cursor.fetchall()
-    cursor.close()
-    
-    if len(results) > 0:
-        wins = sum(1 for r in results if r[0])
-        return wins / len(results)
-    return 0.5
-
-def get_h2h(player1_id, player2_id, surface, conn):
-    """Get head-to-head record on specific surface"""
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT 
-            COUNT(*) FILTER (WHERE winner_id = %s) as p1_wins,
-            COUNT(*) FILTER (WHERE winner_id = %s) as p2_wins
-        FROM matches m
-        WHERE ((m.player1_id = %s AND m.player2_id = %s) 
-            OR (m.player1_id = %s AND m.player2_id = %s))
-            AND m.surface = %s
-            AND m.winner_id IS NOT NULL
-    """, (player1_id, player2_id, player1_id, player2_id, player2_id, player1_id, surface))
-    
-    result = cursor.fetchone()
-    cursor.close()
-    
-    if result:
-        p1_wins = result[0] or 0
-        p2_wins = result[1] or 0
-        return p1_wins - p2_wins
-    return 0
-
-def get_player_info(player_id, conn):
-    """Get player age, height, hand"""
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT birth_date, height, playing_hand
-        FROM players
-        WHERE id = %s
-    """, (player_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    return result if result else (None, None, None)
+    def __init__(self):
+        self.model = joblib.load('xgboost_model.pkl')
+        self.scaler = joblib.load('scaler.pkl')
+        self.executor = FeatureExecutor.from_metadata()
+        self.conn = None
+        # One connection, so requests from socket clients take turns
+        self.lock = threading.Lock()
 
-def predict_match(player1_name, player2_name, surface):
-    """Predict match outcome"""
-    try:
-        # Load model and scaler
-        model = joblib.load('xgboost_model.pkl')
-        scaler = joblib.load('scaler.pkl')
-        
-        # Connect to database
-        conn = get_db_connection()
-        
+    def connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = get_db_connection()
+            # Reads only; no transaction is left open between requests
+            self.conn.autocommit = True
+        return self.conn
+
+    def close(self):
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
+        self.conn = None
+
+    def predict(self, player1_name, player2_name, surface):
+        """Predict one match, reconnecting once if the connection was dropped"""
+        with self.lock:
+            try:
+                return self._predict(self.connection(), player1_name, player2_name, surface)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self.close()
+                return self._predict(self.connection(), player1_name, player2_name, surface)
+
+    def _predict(self, conn, player1_name, player2_name, surface):
         # Get player IDs
         player1_id = get_player_id(player1_name, conn)
         player2_id = get_player_id(player2_name, conn)
-        
+
         if not player1_id or not player2_id:
             return {
                 'success': False,
                 'error': f'Player not found: {player1_name if not player1_id else player2_name}'
             }
-        
-        # Get ELO ratings
-        p1_surface_elo = get_surface_elo(player1_id, surface, conn)
-        p2_surface_elo = get_surface_elo(player2_id, surface, conn)
-        p1_overall_elo = get_overall_elo(player1_id, conn)
-        p2_overall_elo = get_overall_elo(player2_id, conn)
-        
-        # Get win rates
-        p1_surface_wr_12mo = get_surface_win_rate(player1_id, surface, 12, conn)
-        p2_surface_wr_12mo = get_surface_win_rate(player2_id, surface, 12, conn)
-        p1_surface_wr_career = get_surface_win_rate(player1_id, surface, 120, conn)
-        p2_surface_wr_career = get_surface_win_rate(player2_id, surface, 120, conn)
-        
-        # Get recent form
-        p1_form_20 = get_recent_form(player1_id, 20, conn)
-        p2_form_20 = get_recent_form(player2_id, 20, conn)
-        p1_surface_form_10 = get_recent_form(player1_id, 10, conn)
-        p2_surface_form_10 = get_recent_form(player2_id, 10, conn)
-        
-        # Get H2H
-        h2h_surface = get_h2h(player1_id, player2_id, surface, conn)
-        
-        # Get player info
-        p1_birth, p1_height, p1_hand = get_player_info(player1_id, conn)
-        p2_birth, p2_height, p2_hand = get_player_info(player2_id, conn)
-        
-        # Calculate age difference
-        if p1_birth and p2_birth:
-            p1_age = (datetime.now() - pd.to_datetime(p1_birth)).days / 365.25
-            p2_age = (datetime.now() - pd.to_datetime(p2_birth)).days / 365.25
-            age_diff = p1_age - p2_age
-        else:
-            age_diff = 0
-        
-        # Height difference
-        height_diff = (p1_height or 180) - (p2_height or 180)
-        
-        # Hand matchup
-        hand_matchup = 1 if p1_hand != p2_hand else 0
-        
-        # Encode surface
-        surface_encoded = {'Hard': 0, 'Clay': 1, 'Grass': 2}.get(surface, 0)
-        
-        # Create feature vector
-        features = np.array([[
-            p1_surface_elo - p2_surface_elo,  # surface_elo_diff
-            p1_overall_elo - p2_overall_elo,  # overall_elo_diff
-            p1_surface_wr_12mo,
-            p2_surface_wr_12mo,
-            p1_surface_wr_12mo - p2_surface_wr_12mo,  # surface_wr_diff_12mo
-            p1_surface_wr_career,
-            p2_surface_wr_career,
-            p1_surface_wr_career - p2_surface_wr_career,  # surface_wr_diff_career
-            p1_form_20,
-            p2_form_20,
-            p1_form_20 - p2_form_20,  # form_diff_20
-            p1_surface_form_10,
-            p2_surface_form_10,
-            p1_surface_form_10 - p2_surface_form_10,  # surface_form_diff_10
-            age_diff,
-            height_diff,
-            hand_matchup,
-            h2h_surface,
-            surface_encoded
-        ]])
-        
+
+        # Every model feature in model_metadata.json order, from one batched read per source
+        features, values = self.executor.run(conn, [player1_id], [player2_id], surface)
+
         # Scale features
-        features_scaled = scaler.transform(features)
-        
+        features_scaled = self.scaler.transform(features)
+
         # Make prediction
-        prediction_proba = model.predict_proba(features_scaled)[0]
-        prediction = model.predict(features_scaled)[0]
-        
-        conn.close()
-        
+        prediction_proba = self.model.predict_proba(features_scaled)[0]
+        return self.result(player1_name, player2_name, surface, float(prediction_proba[1]), values)
+
+    def predict_many(self, fixtures):
+        """Predict a list of fixtures together; one result per fixture, in order"""
+        with self.lock:
+            try:
+                return self._predict_many(self.connection(), fixtures)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                self.close()
+                return self._predict_many(self.connection(), fixtures)
+
+    def _predict_many(self, conn, fixtures):
+        results = [None] * len(fixtures)
+        valid = []
+        for i, fixture in enumerate(fixtures):
+            missing = [key for key in ('player1', 'player2', 'surface') if not fixture.get(key)]
+            if missing:
+                results[i] = {'success': False, 'error': f'Missing fields: {", ".join(missing)}'}
+            elif fixture['surface'] not in ('Hard', 'Clay', 'Grass'):
+                results[i] = {'success': False, 'error': 'Invalid surface. Must be one of: Hard, Clay, Grass'}
+            else:
+                valid.append(i)
+
+        names = [fixtures[i][key] for i in valid for key in ('player1', 'player2')]
+        ids = get_player_ids(names, conn) if names else {}
+        scored = []
+        for i in valid:
+            fixture = fixtures[i]
+            unknown = [name for name in (fixture['player1'], fixture['player2']) if name not in ids]
+            if unknown:
+                results[i] = {'success': False, 'error': f'Player not found: {unknown[0]}'}
+            else:
+                scored.append(i)
+        if not scored:
+            return results
+
+        # All fixtures at once: one read per source, one scaler pass, one predict_proba call
+        features, values = self.executor.run(
+            conn,
+            [ids[fixtures[i]['player1']] for i in scored],
+            [ids[fixtures[i]['player2']] for i in scored],
+            [fixtures[i]['surface'] for i in scored]
+        )
+        proba = self.model.predict_proba(self.scaler.transform(features))[:, 1]
+        for row, i in enumerate(scored):
+            fixture = fixtures[i]
+            results[i] = self.result(fixture['player1'], fixture['player2'], fixture['surface'],
+                                     float(proba[row]), values, row)
+        return results
+
+    def result(self, player1_name, player2_name, surface, player1_probability, values, row=0):
+        """The response for one match, from its win probability and feature inputs"""
+        p1, p2 = self.executor.player_values(values, row)
+        h2h_surface = int(values['h2h'][row])
+        player2_probability = 1.0 - player1_probability
+
         # Calculate confidence as the margin between probabilities (0-100%)
         # Higher margin = more confident prediction
-        confidence = abs(float(prediction_proba[1]) - float(prediction_proba[0]))
-        
+        confidence = abs(player1_probability - player2_probability)
+
         # Return result
         return {
             'success': True,
@@ -249,53 +188,139 @@ def predict_match(player1_name, player2_name, surface):
             'player2': player2_name,
             'surface': surface,
             'prediction': {
-                'winner': player1_name if prediction == 1 else player2_name,
-                'player1_win_probability': float(prediction_proba[1]),
-                'player2_win_probability': float(prediction_proba[0]),
+                'winner': player1_name if player1_probability > 0.5 else player2_name,
+                'player1_win_probability': player1_probability,
+                'player2_win_probability': player2_probability,
                 'confidence': confidence
             },
             'key_factors': {
-                'surface_elo_difference': float(p1_surface_elo - p2_surface_elo),
-                'form_difference': float(p1_form_20 - p2_form_20),
-                'surface_form_difference': float(p1_surface_form_10 - p2_surface_form_10),
-                'h2h_advantage': int(h2h_surface),
-                'player1_surface_wr': float(p1_surface_wr_career),
-                'player2_surface_wr': float(p2_surface_wr_career)
+                'surface_elo_difference': p1['surface_elo'] - p2['surface_elo'],
+                'form_difference': p1['form_20'] - p2['form_20'],
+                'surface_form_difference': p1['form_10'] - p2['form_10'],
+                'h2h_advantage': h2h_surface,
+                'player1_surface_wr': p1['surface_wr_career'],
+                'player2_surface_wr': p2['surface_wr_career']
             },
             'player_stats': {
                 'player1': {
-                    'surface_elo': float(p1_surface_elo),
-                    'overall_elo': float(p1_overall_elo),
-                    'recent_form': float(p1_form_20),
-                    'surface_form': float(p1_surface_form_10)
+                    'surface_elo': p1['surface_elo'],
+                    'overall_elo': p1['overall_elo'],
+                    'recent_form': p1['form_20'],
+                    'surface_form': p1['form_10']
                 },
                 'player2': {
-                    'surface_elo': float(p2_surface_elo),
-                    'overall_elo': float(p2_overall_elo),
-                    'recent_form': float(p2_form_20),
-                    'surface_form': float(p2_surface_form_10)
+                    'surface_elo': p2['surface_elo'],
+                    'overall_elo': p2['overall_elo'],
+                    'recent_form': p2['form_20'],
+                    'surface_form': p2['form_10']
                 }
             }
         }
-        
+
+def predict_match(player1_name, player2_name, surface):
+    """Predict match outcome"""
+    predictor = None
+    try:
+        predictor = Predictor()
+        return predictor.predict(player1_name, player2_name, surface)
     except Exception as e:
         return {
             'success': False,
             'error': str(e)
         }
+    finally:
+        if predictor is not None:
+            predictor.close()
+
+def handle_request(predictor, line):
+    """One protocol line in, one JSON-serializable response out"""
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get('id')
+        missing = [key for key in ('player1', 'player2', 'surface') if not request.get(key)]
+        if missing:
+            result = {'success': False, 'error': f'Missing fields: {", ".join(missing)}'}
+        else:
+            result = predictor.predict(request['player1'], request['player2'], request['surface'])
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    return {'id': request_id, **result}
+
+def serve_stdio(predictor):
+    """Answer newline-delimited JSON requests on stdin until it closes"""
+    for line in sys.stdin:
+        if line.strip():
+            sys.stdout.write(json.dumps(handle_request(predictor, line)) + '\n')
+            sys.stdout.flush()
+
+def serve_socket(predictor, path):
+    """Answer the same protocol for any number of clients on a Unix socket"""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write((json.dumps(handle_request(predictor, line)) + '\n').encode())
+                    self.wfile.flush()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Predict tennis matches with the XGBoost model')
+    parser.add_argument('match', nargs='*', metavar='ARG',
+                        help='<player1_name> <player2_name> <surface> for a single prediction')
+    parser.add_argument('--serve', action='store_true',
+                        help='Stay running and answer newline-delimited JSON requests on stdin')
+    parser.add_argument('--socket', default=None, metavar='PATH',
+                        help='With --serve, listen on this Unix socket instead of stdin')
+    parser.add_argument('--batch', default=None, metavar='FILE',
+                        help='Predict every fixture in a CSV or JSON-lines file (- for stdin)')
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    if len(sys.argv) != 4:
+    args = parse_args()
+
+    if args.serve:
+        predictor = Predictor()
+        try:
+            if args.socket:
+                serve_socket(predictor, args.socket)
+            else:
+                serve_stdio(predictor)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            predictor.close()
+        sys.exit(0)
+
+    if args.batch:
+        stream = sys.stdin if args.batch == '-' else open(args.batch, newline='')
+        with stream:
+            fixtures = read_fixtures(stream)
+        predictor = Predictor()
+        try:
+            for result in predictor.predict_many(fixtures):
+                sys.stdout.write(json.dumps(result) + '\n')
+        finally:
+            predictor.close()
+        sys.exit(0)
+
+    if len(args.match) != 3:
         print(json.dumps({
             'success': False,
             'error': 'Usage: python ml_predict.py <player1_name> <player2_name> <surface>'
         }))
         sys.exit(1)
-    
-    player1 = sys.argv[1]
-    player2 = sys.argv[2]
-    surface = sys.argv[3]
-    
+
+    player1, player2, surface = args.match
+
     result = predict_match(player1, player2, surface)
     print(json.dumps(result, indent=2))
-
@@ -0,0 +1,122 @@
+"""
+Point-in-Time Rating Index
+Loads the ratings table in one bulk read and answers "rating before date D"
+by binary search, instead of one ORDER BY ... LIMIT 1 query per lookup
+"""
+
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from ml_replay import DEFAULT_RATING, to_day_numbers
+
+# Surface slot inside the per-player key; None is the overall rating
+SURFACE_CODES = {None: 0, 'Hard': 1, 'Clay': 2, 'Grass': 3, 'Carpet': 4}
+OTHER_SURFACE = 7
+SURFACE_SLOTS = 8
+
+DAY_BITS = 32
+LATEST_DAY = (1 << DAY_BITS) - 1
+
+# Rating rows dated by the match that produced them, as in
+# calculateELORatings_incremental.js getCurrentRating()
+RATINGS_QUERY = """
+    SELECT
+        COALESCE(m.match_date, r.calculated_at::date) as rated_on,
+        r.player_id,
+        r.surface,
+        r.rating_value
+    FROM ratings r
+    LEFT JOIN matches m ON r.match_id = m.id
+    WHERE r.rating_type = %s
+        AND COALESCE(m.match_date, r.calculated_at::date) >= %s
+    ORDER BY rated_on ASC, r.id ASC
+"""
+
+
+def surface_code(surface):
+    if not isinstance(surface, str):
+        return SURFACE_CODES[None]
+    return SURFACE_CODES.get(surface, OTHER_SURFACE)
+
+
+def day_number(value):
+    """date.toordinal() for a single date-like value; None means 'latest'"""
+    if value is None:
+        return LATEST_DAY
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return pd.Timestamp(value).date().toordinal()
+
+
+class RatingIndex:
+    """Sorted (player, surface, day) -> rating arrays for one rating type"""
+
+    def __init__(self, player_ids, surfaces, days, values, default=DEFAULT_RATING):
+        keys = self._keys(np.asarray(player_ids, dtype=np.int64), surfaces)
+        composite = (keys << DAY_BITS) | np.asarray(days, dtype=np.int64)
+        order = np.argsort(composite, kind='stable')
+        self.composite = composite[order]
+        self.values = np.asarray(values, dtype=np.float64)[order]
+        self.default = default
+
+    @staticmethod
+    def _keys(player_ids, surfaces):
+        codes = np.fromiter((surface_code(s) for s in surfaces), dtype=np.int64, count=len(player_ids))
+        return player_ids * SURFACE_SLOTS + codes
+
+    @classmethod
+    def from_frame(cls, df, default=DEFAULT_RATING):
+        """Build from a frame with rated_on, player_id, surface and rating_value columns"""
+        return cls(
+            df['player_id'].to_numpy(),
+            df['surface'].tolist(),
+            to_day_numbers(df['rated_on']),
+            df['rating_value'].astype(float).to_numpy(),
+            default=default
+        )
+
+    @classmethod
+    def load(cls, conn, rating_type='elo'):
+        """Read every rating row of one type, dated by the match that produced it"""
+        df = pd.read_sql_query(RATINGS_QUERY, conn, params=(rating_type, date.min))
+        return cls.from_frame(df)
+
+    def __len__(self):
+        return len(self.values)
+
+    def rating_before(self, player_id, surface, before=None):
+        """Latest rating dated strictly before `before` (or the latest overall if None)"""
+        key = int(player_id) * SURFACE_SLOTS + surface_code(surface)
+        target = (key << DAY_BITS) | day_number(before)
+        pos = int(np.searchsorted(self.composite, target, side='left')) - 1
+        if pos >= 0 and (int(self.composite[pos]) >> DAY_BITS) == key:
+            return float(self.values[pos])
+        return self.default
+
+    def ratings_before(self, player_ids, surfaces, before=None):
+        """Vectorized rating_before over arrays of player ids, surfaces and dates.
+
+        `before` may be one date-like value, None for the latest ratings, or an
+        array of dates aligned with player_ids.
+        """
+        player_ids = np.asarray(player_ids, dtype=np.int64)
+        if isinstance(surfaces, str) or surfaces is None:
+            surfaces = [surfaces] * len(player_ids)
+        keys = self._keys(player_ids, surfaces)
+
+        if before is None or np.ndim(before) == 0:
+            days = np.full(len(player_ids), day_number(before), dtype=np.int64)
+        else:
+            days = to_day_numbers(before)
+
+        if len(self.composite) == 0:
+            return np.full(len(player_ids), self.default)
+
+        pos = np.searchsorted(self.composite, (keys << DAY_BITS) | days, side='left') - 1
+        clipped = np.maximum(pos, 0)
+        found = (pos >= 0) & ((self.composite[clipped] >> DAY_BITS) == keys)
+        return np.where(found, self.values[clipped], self.default)
@@ -0,0 +1,106 @@
+"""
+XGBoost Data From the Feature Store
+Feeds memory-mapped feature store columns to XGBoost in fixed-size float32
+batches, so a QuantileDMatrix can be built without ever holding the raw
+feature matrix in memory. Only the quantized bins (one byte per value at the
+default max_bin) stay resident, which keeps training possible on feature
+tables much larger than RAM.
+"""
+
+import numpy as np
+import xgboost as xgb
+
+from ml_feature_store import STORE_DIR, load_columns
+
+DEFAULT_BATCH_ROWS = 200_000
+DEFAULT_MAX_BIN = 256
+
+
+def _day_cut(dates, cut):
+    """Move a row cut back to the first row of its day, so no day is split"""
+    if 0 < cut < len(dates):
+        cut = int(np.searchsorted(dates, dates[cut], side='left'))
+    return cut
+
+
+def time_split(path=STORE_DIR, test_fraction=0.2):
+    """
+    Split the (date-sorted) store into a training slice and a later test
+    slice. The cut is moved back to a day boundary so no day is in both.
+    """
+    dates = load_columns(path, ['match_date'])['match_date']
+    cut = _day_cut(dates, int(len(dates) * (1 - test_fraction)))
+    return slice(0, cut), slice(cut, len(dates))
+
+
+def validation_split(path=STORE_DIR, test_fraction=0.2, validation_fraction=0.2):
+    """
+    (train, validation, test) slices for tuning. The test slice is exactly
+    time_split()'s, so it stays unseen until the final model is scored; the
+    validation slice is the latest validation_fraction of the rows before it.
+    """
+    train_rows, test_rows = time_split(path, test_fraction)
+    dates = load_columns(path, ['match_date'])['match_date']
+    cut = _day_cut(dates, int(train_rows.stop * (1 - validation_fraction)))
+    return slice(0, cut), slice(cut, train_rows.stop), test_rows
+
+
+def iter_batches(path, columns, rows=slice(None), batch_rows=DEFAULT_BATCH_ROWS, label='target'):
+    """Yield (X, y) float32 batches of at most batch_rows rows from the store"""
+    arrays = load_columns(path, columns + [label])
+    start, stop, _ = rows.indices(len(arrays[label]))
+    for lo in range(start, stop, batch_rows):
+        hi = min(lo + batch_rows, stop)
+        X = np.empty((hi - lo, len(columns)), dtype=np.float32)
+        for i, name in enumerate(columns):
+            X[:, i] = arrays[name][lo:hi]
+        yield X, np.asarray(arrays[label][lo:hi], dtype=np.float32)
+
+
+class StoreBatches(xgb.DataIter):
+    """xgb.DataIter over a row slice of the feature store"""
+
+    def __init__(self, path, columns, rows=slice(None), batch_rows=DEFAULT_BATCH_ROWS,
+                 feature_names=None):
+        self.path = path
+        self.columns = list(columns)
+        self.rows = rows
+        self.batch_rows = batch_rows
+        self.feature_names = feature_names
+        self._batches = None
+        super().__init__()
+
+    def next(self, input_data):
+        if self._batches is None:
+            self._batches = iter_batches(self.path, self.columns, self.rows, self.batch_rows)
+        batch = next(self._batches, None)
+        if batch is None:
+            return 0
+        X, y = batch
+        input_data(data=X, label=y, feature_names=self.feature_names)
+        return 1
+
+    def reset(self):
+        self._batches = None
+
+
+def quantile_dmatrix(path, columns, rows=slice(None), batch_rows=DEFAULT_BATCH_ROWS,
+                     max_bin=DEFAULT_MAX_BIN, ref=None, feature_names=None, nthread=-1):
+    """
+    Build a QuantileDMatrix from store columns, one batch at a time.
+
+    ref: the training QuantileDMatrix, so evaluation data reuses its bin cuts
+    """
+    batches = StoreBatches(path, columns, rows, batch_rows, feature_names)
+    return xgb.QuantileDMatrix(batches, ref=ref, max_bin=max_bin, nthread=nthread)
+
+
+def predict_batches(booster, path, columns, rows=slice(None), batch_rows=DEFAULT_BATCH_ROWS):
+    """Return (probabilities, labels) for a row slice, predicted batch by batch"""
+    proba, labels = [], []
+    for X, y in iter_batches(path, columns, rows, batch_rows):
+        proba.append(booster.inplace_predict(X))
+        labels.append(y.astype(np.int8))
+    if not proba:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int8)
+    return np.concatenate(proba), np.concatenate(labels)
@@ -13,45 +13,234 @@ import xgboost as xgb
 import joblib
 import json
 from datetime import datetime
+import argparse
 import sys
 
+from ml_feature_registry import EXTRACTED_FEATURES, OPTIONAL_FEATURES
+from ml_feature_store import STORE_DIR, is_store, load_columns, load_matrix
+from ml_store_dmatrix import DEFAULT_BATCH_ROWS, DEFAULT_MAX_BIN, predict_batches, quantile_dmatrix, time_split
+
 def print_progress(message, emoji="📊"):
     """Print progress with timestamp"""
     timestamp = datetime.now().strftime("%H:%M:%S")
     print(f"[{timestamp}] {emoji} {message}")
     sys.stdout.flush()
 
+# Feature table columns the model uses, plus the encoded surface (see ml_feature_registry.py)
+FEATURE_COLS = list(EXTRACTED_FEATURES)
+
+# XGBoost parameters (also used by ml_backtest.py)
+XGB_PARAMS = {
+    'objective': 'binary:logistic',
+    'eval_metric': ['logloss', 'auc', 'error'],
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'n_estimators': 200,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'min_child_weight': 3,
+    'gamma': 0.1,
+    'reg_alpha': 0.1,
+    'reg_lambda': 1.0,
+    'random_state': 42,
+    'n_jobs': -1
+}
+
+def load_tuning(path='model_metadata.json'):
+    """The tuning block ml_tune_model.py wrote into the metadata, or None"""
+    try:
+        with open(path) as f:
+            return json.load(f).get('tuning')
+    except (OSError, ValueError):
+        return None
+
+def model_params(tuning=None):
+    """XGB_PARAMS, overridden by the tuned parameters when given"""
+    params = dict(XGB_PARAMS)
+    if tuning:
+        params.update(tuning['best_params'])
+    return params
+
+def load_training_data(path, feature_cols):
+    """Return (X, y) from the feature store, or from a CSV file"""
+    if is_store(path):
+        # Only the model columns are mapped; surface codes are already Hard=0, Clay=1, Grass=2
+        X = load_matrix(path, feature_cols + ['surface'])
+        y = np.asarray(load_columns(path, ['target'])['target'])
+        return X, y
+    
+    df = pd.read_csv(path)
+    df['surface_encoded'] = df['surface'].map({'Hard': 0, 'Clay': 1, 'Grass': 2})
+    return df[feature_cols + ['surface_encoded']].values, df['target'].values
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Train the XGBoost match prediction model')
+    parser.add_argument('--features', default=None,
+                        help=f'Feature store directory or CSV file (default: {STORE_DIR}/ if present, '
+                             f'else ml_features.csv)')
+    parser.add_argument('--extra-features', nargs='+', choices=OPTIONAL_FEATURES, default=[], metavar='NAME',
+                        help='Optional feature columns to train on as well (extracted with the same flag)')
+    parser.add_argument('--out-of-core', action='store_true',
+                        help='Stream float32 batches from the feature store into a QuantileDMatrix, '
+                             'train on the earliest 80%% of matches and test on the latest 20%%, '
+                             'without scaling (needs the feature store)')
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS,
+                        help=f'Rows per batch with --out-of-core (default: {DEFAULT_BATCH_ROWS:,})')
+    parser.add_argument('--max-bin', type=int, default=DEFAULT_MAX_BIN,
+                        help=f'Histogram bins per feature with --out-of-core (default: {DEFAULT_MAX_BIN})')
+    parser.add_argument('--tuned', action='store_true',
+                        help='Use the best parameters ml_tune_model.py saved in model_metadata.json')
+    return parser.parse_args()
+
+def print_metrics(title, emoji, y_true, proba):
+    """Print accuracy, AUC, log loss and Brier score; return (accuracy, auc)"""
+    acc = accuracy_score(y_true, proba > 0.5)
+    auc = roc_auc_score(y_true, proba)
+    print_progress(title, emoji)
+    print_progress(f"   Accuracy: {acc*100:.2f}%", "🎯")
+    print_progress(f"   AUC: {auc:.4f}", "📈")
+    print_progress(f"   Log Loss: {log_loss(y_true, proba, labels=[0, 1]):.4f}", "📉")
+    print_progress(f"   Brier Score: {brier_score_loss(y_true, proba):.4f}", "🎲")
+    print()
+    return acc, auc
+
+def train_out_of_core(args, features_path, feature_cols, tuning=None):
+    """
+    Train from the feature store without materializing the feature matrix.
+
+    Batches of memory-mapped columns go straight into QuantileDMatrix objects
+    (the test matrix reuses the training bin cuts), so memory holds only the
+    quantized bins. Trees only compare values against split points, so the
+    StandardScaler is skipped; an identity scaler is saved so scaler.pkl keeps
+    working for the prediction services.
+    """
+    if not is_store(features_path):
+        print_progress(f"--out-of-core needs the feature store; {features_path} is not one", "❌")
+        sys.exit(1)
+    
+    columns = feature_cols + ['surface']
+    train_rows, test_rows = time_split(features_path)
+    n_train = train_rows.stop - train_rows.start
+    n_test = test_rows.stop - test_rows.start
+    print_progress(f"Time-ordered split: {n_train:,} training, {n_test:,} test matches", "✂️")
+    
+    print_progress(f"Building QuantileDMatrix ({args.batch_rows:,}-row batches, {args.max_bin} bins)...", "🔧")
+    dtrain = quantile_dmatrix(features_path, columns, train_rows, args.batch_rows, args.max_bin)
+    dtest = quantile_dmatrix(features_path, columns, test_rows, args.batch_rows, args.max_bin, ref=dtrain)
+    print_progress(f"✅ Binned {dtrain.num_row():,} + {dtest.num_row():,} rows x {dtrain.num_col()} features", "✅")
+    print()
+    
+    params = model_params(tuning if args.tuned else None)
+    print_progress("Model Parameters:", "⚙️")
+    for key, value in params.items():
+        if key not in ['n_jobs', 'random_state']:
+            print_progress(f"   {key}: {value}", "  ")
+    print()
+    
+    train_params = {k: v for k, v in params.items() if k not in ['n_estimators', 'n_jobs', 'random_state']}
+    train_params.update({'tree_method': 'hist', 'max_bin': args.max_bin,
+                         'seed': params['random_state'], 'nthread': params['n_jobs']})
+    print_progress("Starting training...", "🚀")
+    booster = xgb.train(train_params, dtrain, num_boost_round=params['n_estimators'],
+                        evals=[(dtrain, 'train'), (dtest, 'test')], verbose_eval=10)
+    del dtrain, dtest
+    print()
+    print_progress("✅ Training complete!", "✅")
+    print()
+    
+    train_proba, y_train = predict_batches(booster, features_path, columns, train_rows, args.batch_rows)
+    train_acc, train_auc = print_metrics("Training Set Performance:", "📚", y_train, train_proba)
+    test_proba, y_test = predict_batches(booster, features_path, columns, test_rows, args.batch_rows)
+    test_acc, test_auc = print_metrics("Test Set Performance:", "🧪", y_test, test_proba)
+    
+    print_progress("Top 10 Feature Importances:", "🌟")
+    # Features are unnamed (f0, f1, ...) like the sklearn path, so the services can pass plain arrays
+    gains = {columns[int(name[1:])]: gain for name, gain in booster.get_score(importance_type='gain').items()}
+    total = sum(gains.values()) or 1.0
+    for i, (name, gain) in enumerate(sorted(gains.items(), key=lambda kv: kv[1], reverse=True)[:10], 1):
+        print_progress(f"   {i}. {name}: {gain / total:.4f}", "  ")
+    print()
+    
+    print_progress("Surface-Specific Performance:", "🎾")
+    test_surfaces = np.asarray(load_columns(features_path, ['surface'])['surface'][test_rows])
+    for surface_code, surface_name in [(0, 'Hard'), (1, 'Clay'), (2, 'Grass')]:
+        mask = test_surfaces == surface_code
+        if mask.sum() > 0:
+            surface_acc = accuracy_score(y_test[mask], test_proba[mask] > 0.5)
+            surface_auc = roc_auc_score(y_test[mask], test_proba[mask])
+            print_progress(f"   {surface_name}: Accuracy={surface_acc*100:.2f}%, AUC={surface_auc:.4f} (n={mask.sum():,})", "🎾")
+    print()
+    
+    # The services load the sklearn wrapper and apply scaler.pkl
+    model = xgb.XGBClassifier()
+    model.load_model(bytearray(booster.save_raw('json')))
+    scaler = StandardScaler(with_mean=False, with_std=False).fit(np.zeros((1, len(columns)), dtype=np.float32))
+    
+    joblib.dump(model, 'xgboost_model.pkl')
+    print_progress("✅ Saved: xgboost_model.pkl", "✅")
+    joblib.dump(scaler, 'scaler.pkl')
+    print_progress("✅ Saved: scaler.pkl (identity)", "✅")
+    
+    metadata = {
+        'model_type': 'XGBoost',
+        'version': '1.0',
+        'trained_at': datetime.now().isoformat(),
+        'features': columns,
+        'num_features': len(columns),
+        'training_samples': n_train,
+        'test_samples': n_test,
+        'split': 'time',
+        'feature_dtype': 'float32',
+        'scaled': False,
+        'performance': {
+            'train_accuracy': float(train_acc),
+            'test_accuracy': float(test_acc),
+            'train_auc': float(train_auc),
+            'test_auc': float(test_auc)
+        },
+        'hyperparameters': {k: v for k, v in params.items() if k not in ['n_jobs', 'random_state']}
+    }
+    if tuning:
+        metadata['tuning'] = tuning
+    with open('model_metadata.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print_progress("✅ Saved: model_metadata.json", "✅")
+    print()
+    print_progress(f"Test accuracy {test_acc*100:.2f}%, AUC {test_auc:.4f} on the latest {n_test:,} matches", "🎉")
+
 def main():
+    args = parse_args()
+    features_path = args.features or (STORE_DIR if is_store(STORE_DIR) else 'ml_features.csv')
+    
     print_progress("=" * 60, "🚀")
     print_progress("ML MODEL TRAINING - XGBOOST MATCH PREDICTION", "🎾")
     print_progress("=" * 60, "🚀")
     print()
     
+    feature_cols = FEATURE_COLS + args.extra_features
+    # Kept in the new metadata so the leaderboard survives retraining
+    tuning = load_tuning()
+    if args.tuned and not tuning:
+        print_progress("--tuned: no tuning results in model_metadata.json; run ml_tune_model.py first", "❌")
+        sys.exit(1)
+    if args.tuned and tuning.get('features') != feature_cols + ['surface']:
+        print_progress(f"--tuned: tuning used features {tuning.get('features')}, but this model trains on "
+                       f"{feature_cols + ['surface']}; pass the same --extra-features or re-run "
+                       f"ml_tune_model.py", "❌")
+        sys.exit(1)
+    if args.out_of_core:
+        train_out_of_core(args, features_path, feature_cols, tuning)
+        return
+    
     # Step 1: Load features
-    print_progress("Loading features from ml_features.csv...", "📂")
-    df = pd.read_csv('ml_features.csv')
-    print_progress(f"✅ Loaded {len(df):,} matches", "✅")
+    print_progress(f"Loading features from {features_path}...", "📂")
+    X, y = load_training_data(features_path, feature_cols)
+    print_progress(f"✅ Loaded {len(y):,} matches", "✅")
     print()
     
     # Step 2: Prepare data
     print_progress("Preparing training data...", "🔧")
     
-    # Define feature columns
-    feature_cols = [
-        'surface_elo_diff', 'overall_elo_diff',
-        'p1_surface_wr_12mo', 'p2_surface_wr_12mo', 'surface_wr_diff_12mo',
-        'p1_surface_wr_career', 'p2_surface_wr_career', 'surface_wr_diff_career',
-        'p1_form_20', 'p2_form_20', 'form_diff_20',
-        'p1_surface_form_10', 'p2_surface_form_10', 'surface_form_diff_10',
-        'age_diff', 'height_diff', 'hand_matchup', 'h2h_surface_advantage'
-    ]
-    
-    # Encode surface as categorical
-    df['surface_encoded'] = df['surface'].map({'Hard': 0, 'Clay': 1, 'Grass': 2})
-    
-    X = df[feature_cols + ['surface_encoded']].values
-    y = df['target'].values
-    
     print_progress(f"   Features: {X.shape[1]}", "🔢")
     print_progress(f"   Samples: {X.shape[0]:,}", "📊")
     print_progress(f"   Target balance: {np.mean(y)*100:.1f}% player1 wins", "⚖️")
@@ -64,6 +253,10 @@ def main():
     )
     print_progress(f"   Training set: {len(X_train):,} matches", "📚")
     print_progress(f"   Test set: {len(X_test):,} matches", "🧪")
+    if args.tuned:
+        # The tuning validation window is part of this random split, so these metrics lean optimistic
+        print_progress("   Metrics below come from this random split, not the tuner's held-out time "
+                       "window; use --out-of-core for an unbiased test", "⚠️")
     print()
     
     # Step 4: Scale features
@@ -81,21 +274,7 @@ def main():
     print()
     
     # XGBoost parameters
-    params = {
-        'objective': 'binary:logistic',
-        'eval_metric': ['logloss', 'auc', 'error'],
-        'max_depth': 6,
-        'learning_rate': 0.1,
-        'n_estimators': 200,
-        'subsample': 0.8,
-        'colsample_bytree': 0.8,
-        'min_child_weight': 3,
-        'gamma': 0.1,
-        'reg_alpha': 0.1,
-        'reg_lambda': 1.0,
-        'random_state': 42,
-        'n_jobs': -1
-    }
+    params = model_params(tuning if args.tuned else None)
     
     print_progress("Model Parameters:", "⚙️")
     for key, value in params.items():
@@ -176,8 +355,6 @@ def main():
     
     # Step 7: Surface-specific analysis
     print_progress("Surface-Specific Performance:", "🎾")
-    df_test = df.iloc[y_test.index] if hasattr(y_test, 'index') else df.tail(len(y_test))
-    
     # Get test indices properly
     test_indices = X_test[:, -1]  # surface_encoded is last column
     
@@ -212,6 +389,9 @@ def main():
         'num_features': len(feature_names),
         'training_samples': len(X_train),
         'test_samples': len(X_test),
+        'split': 'random',
+        # Float32 from the feature store, float64 from the CSV; predictions must match it
+        'feature_dtype': str(X_train.dtype),
         'performance': {
             'train_accuracy': float(train_acc),
             'test_accuracy': float(test_acc),
@@ -222,6 +402,8 @@ def main():
         },
         'hyperparameters': {k: v for k, v in params.items() if k not in ['n_jobs', 'random_state']}
     }
+    if tuning:
+        metadata['tuning'] = tuning
     
     with open('model_metadata.json', 'w') as f:
         json.dump(metadata, f, indent=2)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Hyperparameter Search for the Match Model
+Runs random-search trials of the XGBoost model concurrently under one CPU
+budget. Every trial trains on the same cached QuantileDMatrix (binned once)
+and is scored on a validation window that ends where the test slice of
+ml_train_model.py --out-of-core begins, so that test slice never influences
+the choice of parameters or tree count. Trials stop early when validation
+log-loss stops improving, and are pruned at checkpoints where they trail the
+median of the trials seen there. The leaderboard is written into model_metadata.json;
+ml_train_model.py --tuned trains with the winning parameters.
+
+Usage:
+    python3 scripts/ml_tune_model.py --trials 60 --cpus 8 --concurrent 4
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import xgboost as xgb
+
+from ml_feature_registry import OPTIONAL_FEATURES
+from ml_feature_store import STORE_DIR, is_store
+from ml_store_dmatrix import DEFAULT_BATCH_ROWS, DEFAULT_MAX_BIN, quantile_dmatrix, validation_split
+from ml_train_model import FEATURE_COLS, XGB_PARAMS
+
+METADATA_FILE = 'model_metadata.json'
+LEADERBOARD_SIZE = 20
+
+# name -> (low, high, kind); 'log' samples log-uniformly
+SEARCH_SPACE = {
+    'max_depth': (3, 10, 'int'),
+    'learning_rate': (0.01, 0.3, 'log'),
+    'min_child_weight': (1, 20, 'log'),
+    'subsample': (0.5, 1.0, 'float'),
+    'colsample_bytree': (0.5, 1.0, 'float'),
+    'gamma': (1e-3, 5.0, 'log'),
+    'reg_alpha': (1e-3, 10.0, 'log'),
+    'reg_lambda': (1e-2, 10.0, 'log'),
+}
+
+
+def print_progress(message, emoji="📊"):
+    """Print progress with timestamp"""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    print(f"[{timestamp}] {emoji} {message}")
+    sys.stdout.flush()
+
+
+def sample_params(rng):
+    """Draw one configuration from SEARCH_SPACE"""
+    params = {}
+    for name, (low, high, kind) in SEARCH_SPACE.items():
+        if kind == 'int':
+            params[name] = rng.randint(low, high)
+        elif kind == 'log':
+            params[name] = round(math.exp(rng.uniform(math.log(low), math.log(high))), 5)
+        else:
+            params[name] = round(rng.uniform(low, high), 4)
+    return params
+
+
+class MedianPruner:
+    """
+    Shared across trials: at every checkpoint round, a trial whose validation
+    log-loss is worse than the median of the trials that already reached that
+    round is stopped.
+    """
+
+    def __init__(self, every=25, warmup=50, min_trials=4):
+        self.every = every
+        self.warmup = warmup
+        self.min_trials = min_trials
+        self._scores = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def should_prune(self, rounds, score):
+        if rounds < self.warmup or rounds % self.every:
+            return False
+        with self._lock:
+            seen = self._scores[rounds]
+            prune = len(seen) >= self.min_trials and score > float(np.median(seen))
+            seen.append(score)
+        return prune
+
+
+class PruningCallback(xgb.callback.TrainingCallback):
+    """Ask the pruner after every round whether this trial should stop"""
+
+    def __init__(self, pruner, data_name='valid', metric_name='logloss'):
+        self.pruner = pruner
+        self.data_name = data_name
+        self.metric_name = metric_name
+        self.pruned_at = None
+        super().__init__()
+
+    def after_iteration(self, model, epoch, evals_log):
+        rounds = epoch + 1
+        if self.pruner.should_prune(rounds, evals_log[self.data_name][self.metric_name][-1]):
+            self.pruned_at = rounds
+            return True
+        return False
+
+
+def run_trial(number, params, dtrain, dvalid, pruner, threads, max_rounds, early_stopping):
+    """Train one configuration and return its leaderboard entry"""
+    started = time.time()
+    train_params = {
+        'objective': 'binary:logistic',
+        'eval_metric': ['auc', 'logloss'],
+        'tree_method': 'hist',
+        'seed': XGB_PARAMS['random_state'],
+        'nthread': threads,
+        **params
+    }
+    evals_log = {}
+    pruning = PruningCallback(pruner)
+    xgb.train(train_params, dtrain, num_boost_round=max_rounds, evals=[(dvalid, 'valid')],
+              evals_result=evals_log, verbose_eval=False,
+              callbacks=[xgb.callback.EarlyStopping(rounds=early_stopping, metric_name='logloss',
+                                                    data_name='valid'), pruning])
+
+    logloss = evals_log['valid']['logloss']
+    best = int(np.argmin(logloss))
+    return {
+        'trial': number,
+        'status': 'pruned' if pruning.pruned_at else 'complete',
+        'log_loss': float(logloss[best]),
+        'auc': float(evals_log['valid']['auc'][best]),
+        'best_rounds': best + 1,
+        'rounds': len(logloss),
+        'seconds': round(time.time() - started, 3),
+        'params': params
+    }
+
+
+def save_leaderboard(results, search, path=METADATA_FILE):
+    """Merge the tuning block into model_metadata.json, keeping everything else"""
+    metadata = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            metadata = json.load(f)
+    ranked = sorted(results, key=lambda r: r['log_loss'])
+    best = next((r for r in ranked if r['status'] == 'complete'), ranked[0])
+    metadata['tuning'] = {
+        **search,
+        'tuned_at': datetime.now().isoformat(),
+        'trials_complete': sum(r['status'] == 'complete' for r in results),
+        'trials_pruned': sum(r['status'] == 'pruned' for r in results),
+        'best_params': {**best['params'], 'n_estimators': best['best_rounds']},
+        'leaderboard': ranked[:LEADERBOARD_SIZE]
+    }
+    with open(path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return best
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Concurrent hyperparameter search for the XGBoost match model')
+    parser.add_argument('--features', default=STORE_DIR,
+                        help=f'Feature store directory (default: {STORE_DIR})')
+    parser.add_argument('--extra-features', nargs='+', choices=OPTIONAL_FEATURES, default=[], metavar='NAME',
+                        help='Optional feature columns to tune with as well (extracted with the same flag)')
+    parser.add_argument('--trials', type=int, default=40,
+                        help='Configurations to try (default: 40)')
+    parser.add_argument('--cpus', type=int, default=os.cpu_count() or 1,
+                        help='Total CPU threads for all trials together (default: all)')
+    parser.add_argument('--concurrent', type=int, default=None,
+                        help='Trials running at once; each gets cpus / concurrent threads '
+                             '(default: a quarter of --cpus)')
+    parser.add_argument('--max-rounds', type=int, default=1000,
+                        help='Boosting rounds per trial before early stopping (default: 1000)')
+    parser.add_argument('--early-stopping', type=int, default=30,
+                        help='Stop a trial after this many rounds without improvement (default: 30)')
+    parser.add_argument('--prune-every', type=int, default=25,
+                        help='Rounds between pruning checkpoints (default: 25)')
+    parser.add_argument('--test-fraction', type=float, default=0.2,
+                        help='Latest share of matches held out for the final test and never '
+                             'used here; match ml_train_model.py (default: 0.2)')
+    parser.add_argument('--validation-fraction', type=float, default=0.2,
+                        help='Share of the matches before the test slice, taken from its end, '
+                             'used for validation (default: 0.2)')
+    parser.add_argument('--max-bin', type=int, default=DEFAULT_MAX_BIN,
+                        help=f'Histogram bins per feature (default: {DEFAULT_MAX_BIN})')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Random seed for the search (default: 42)')
+    parser.add_argument('--metadata', default=METADATA_FILE,
+                        help=f'Metadata file to write the leaderboard into (default: {METADATA_FILE})')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not is_store(args.features):
+        print_progress(f"{args.features} is not a feature store; run ml_extract_features.py first", "❌")
+        sys.exit(1)
+    concurrent = max(1, args.concurrent or args.cpus // 4)
+    threads = max(1, args.cpus // concurrent)
+    columns = FEATURE_COLS + args.extra_features + ['surface']
+
+    print_progress("=" * 60, "🚀")
+    print_progress("HYPERPARAMETER SEARCH - XGBOOST MATCH PREDICTION", "🎾")
+    print_progress("=" * 60, "🚀")
+    print()
+
+    train_rows, valid_rows, test_rows = validation_split(args.features, args.test_fraction,
+                                                         args.validation_fraction)
+    print_progress(f"Binning {train_rows.stop:,} training and {valid_rows.stop - valid_rows.start:,} "
+                   f"validation matches once for all trials "
+                   f"(latest {test_rows.stop - test_rows.start:,} held out)...", "🔧")
+    dtrain = quantile_dmatrix(args.features, columns, train_rows, DEFAULT_BATCH_ROWS, args.max_bin,
+                              nthread=args.cpus)
+    dvalid = quantile_dmatrix(args.features, columns, valid_rows, DEFAULT_BATCH_ROWS, args.max_bin,
+                              ref=dtrain, nthread=args.cpus)
+    print_progress(f"{args.trials} trials, {concurrent} at a time x {threads} thread(s)", "⚙️")
+    print()
+
+    rng = random.Random(args.seed)
+    # Trial 0 is the current default configuration, so the leaderboard shows what tuning gained
+    candidates = [{k: XGB_PARAMS[k] for k in SEARCH_SPACE}]
+    candidates += [sample_params(rng) for _ in range(args.trials - 1)]
+    pruner = MedianPruner(every=args.prune_every, warmup=2 * args.prune_every)
+
+    start_time = time.time()
+    results = []
+    # XGBoost releases the GIL while training, so threads share the cached matrices without copies
+    with ThreadPoolExecutor(max_workers=concurrent) as pool:
+        futures = [pool.submit(run_trial, number, params, dtrain, dvalid, pruner, threads,
+                               args.max_rounds, args.early_stopping)
+                   for number, params in enumerate(candidates)]
+        for future in as_completed(futures):
+            r = future.result()
+            results.append(r)
+            print_progress(f"   Trial {r['trial']:>3} {r['status']:<8} LogLoss={r['log_loss']:.4f} "
+                           f"AUC={r['auc']:.4f} at {r['best_rounds']} rounds ({r['seconds']:.1f}s)",
+                           "✂️" if r['status'] == 'pruned' else "✅")
+    elapsed = time.time() - start_time
+    print()
+
+    search = {
+        'features': columns,
+        'trials': len(results),
+        'test_fraction': args.test_fraction,
+        'validation_fraction': args.validation_fraction,
+        'validation_rows': [valid_rows.start, valid_rows.stop],
+        'held_out_rows': [test_rows.start, test_rows.stop],
+        'cpus': args.cpus,
+        'concurrent': concurrent,
+        'wall_seconds': round(elapsed, 3)
+    }
+    best = save_leaderboard(results, search, args.metadata)
+
+    print_progress("Top 5 Trials:", "🏆")
+    for r in sorted(results, key=lambda r: r['log_loss'])[:5]:
+        print_progress(f"   Trial {r['trial']:>3}: LogLoss={r['log_loss']:.4f}, AUC={r['auc']:.4f}, "
+                       f"{r['best_rounds']} rounds, {r['params']}", "  ")
+    print()
+    print_progress(f"Best: trial {best['trial']} (LogLoss {best['log_loss']:.4f}); "
+                   f"{search['trials']} trials in {elapsed:.1f}s", "🎯")
+    print_progress(f"✅ Saved leaderboard to {args.metadata}; train with: "
+                   f"python3 scripts/ml_train_model.py --tuned", "✅")
+
+
+if __name__ == "__main__":
+    main()
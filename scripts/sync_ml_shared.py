@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Sync Shared ML Modules Into the Services
+ml-service/ (Railway) and client/api/ (Vercel) are deployed from their own
+directories, so they cannot import from scripts/. This copies the modules
+the feature registry needs at prediction time into a _ml_shared/ directory
+in each of them, which ships with the deploy like the model files do.
+(Vercel does not turn files under an underscore directory into endpoints.)
+
+Usage:
+    python3 scripts/sync_ml_shared.py           # copy after changing a module
+    python3 scripts/sync_ml_shared.py --check   # exit 1 if a copy is stale
+"""
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPTS_DIR)
+
+# ml_feature_registry.py and everything it imports
+SHARED_MODULES = [
+    'ml_feature_registry.py',
+    'ml_glicko2.py',
+    'ml_h2h_index.py',
+    'ml_profiling.py',
+    'ml_rating_index.py',
+    'ml_replay.py',
+    'ml_trueskill.py',
+    'ml_win_rates.py',
+]
+
+TARGETS = [
+    os.path.join(REPO_DIR, 'ml-service', '_ml_shared'),
+    os.path.join(REPO_DIR, 'client', 'api', '_ml_shared'),
+]
+
+
+def stale_files(target):
+    """Shared modules missing from target or different from scripts/, plus leftovers"""
+    stale = [name for name in SHARED_MODULES
+             if not os.path.isfile(os.path.join(target, name))
+             or not filecmp.cmp(os.path.join(SCRIPTS_DIR, name), os.path.join(target, name), shallow=False)]
+    if os.path.isdir(target):
+        stale += sorted(name for name in os.listdir(target)
+                        if name.endswith('.py') and name not in SHARED_MODULES)
+    return stale
+
+
+def sync(target):
+    os.makedirs(target, exist_ok=True)
+    for name in os.listdir(target):
+        if name.endswith('.py') and name not in SHARED_MODULES:
+            os.remove(os.path.join(target, name))
+    for name in SHARED_MODULES:
+        shutil.copy2(os.path.join(SCRIPTS_DIR, name), os.path.join(target, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy the shared ML modules into the deployable services')
+    parser.add_argument('--check', action='store_true',
+                        help='Only report stale copies; exit 1 if there are any')
+    args = parser.parse_args()
+
+    failed = False
+    for target in TARGETS:
+        relative = os.path.relpath(target, REPO_DIR)
+        stale = stale_files(target)
+        if args.check:
+            if stale:
+                failed = True
+                print(f"❌ {relative}: out of date ({', '.join(stale)}); run scripts/sync_ml_shared.py")
+            else:
+                print(f"✅ {relative}: up to date")
+        else:
+            sync(target)
+            print(f"✅ {relative}: {len(SHARED_MODULES)} modules ({len(stale)} updated)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()